@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Per-record CPU cost of ``DBLogHandler.emit``, measured with the SQLite handler so no
+database server is needed.
+
+    python benchmarks/emit_cpu.py [--records 20000] [--callsites 50] [--runs 3]
+
+``callsite lookup`` compares only the resolution of the function, logger and host ids:
+before, every record built the function key with an f-string, did four dict lookups and
+called ``socket.gethostname()``; now it is one lookup of a tuple key in ``callsite_cache``.
+``emit`` runs the whole handler (including the ``INSERT``), once with the callsite cache
+disabled so every record resolves its ids from the per-row caches like before.
+"""
+from typing import List, Callable
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dblogger.sqlite_handler import DBLogHandler
+
+
+class NoCache(dict):
+    """
+    Callsite cache that never stores anything
+    """
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def make_records(count: int, callsites: int) -> List[logging.LogRecord]:
+    return [
+        logging.LogRecord(
+            'benchmark', logging.INFO, f'/srv/app/module_{idx % callsites}.py', 10 + idx % callsites,
+            'Request %d done', (idx,), None, func=f'handler_{idx % callsites}'
+        )
+        for idx in range(count)
+    ]
+
+
+def lookup_before(handler: DBLogHandler) -> Callable[[logging.LogRecord], None]:
+    def lookup(record: logging.LogRecord):
+        src = handler.src_cache[record.pathname]
+        func = handler.func_cache[f'{record.name}.{record.funcName}:{record.lineno}@{src.path}']
+        logger = handler.logger_cache[handler.logger_name]
+        host = handler.host_cache[socket.gethostname()]
+        return func.pk, logger.pk, host.pk
+    return lookup
+
+
+def lookup_after(handler: DBLogHandler) -> Callable[[logging.LogRecord], None]:
+    def lookup(record: logging.LogRecord):
+        return handler.callsite_cache[
+            (handler.logger_name, record.name, record.funcName, record.lineno, record.pathname)
+        ]
+    return lookup
+
+
+def per_record(func: Callable[[logging.LogRecord], None], records: List[logging.LogRecord]) -> float:
+    """
+    CPU seconds per record
+    """
+    start = time.process_time()
+    for record in records:
+        func(record)
+    return (time.process_time() - start) / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per-record CPU cost of emit')
+    parser.add_argument('--records', dest='records', type=int, default=20000, help='Records per case')
+    parser.add_argument('--callsites', dest='callsites', type=int, default=50, help='Distinct call sites')
+    parser.add_argument('--runs', dest='runs', type=int, default=3, help='Runs per case, the fastest is reported')
+    options = parser.parse_args()
+
+    records = make_records(options.records, options.callsites)
+
+    with tempfile.TemporaryDirectory() as directory:
+        handler = DBLogHandler('benchmark', db_name=os.path.join(directory, 'log.sqlite3'))
+
+        # warm up, all rows and caches exist from now on
+        for record in records[:options.callsites]:
+            handler.emit(record)
+
+        before = min(per_record(lookup_before(handler), records) for _ in range(options.runs))
+        after = min(per_record(lookup_after(handler), records) for _ in range(options.runs))
+        print(f'{"callsite lookup, before":30} {before * 1e9:9.0f} ns/record')
+        print(f'{"callsite lookup, after":30} {after * 1e9:9.0f} ns/record')
+
+        # alternate the cases, the database grows with every run
+        callsite_cache = handler.callsite_cache
+        uncached_runs: List[float] = []
+        cached_runs: List[float] = []
+        for _ in range(options.runs):
+            handler.callsite_cache = NoCache()
+            uncached_runs.append(per_record(handler.emit, records))
+            handler.callsite_cache = callsite_cache
+            cached_runs.append(per_record(handler.emit, records))
+        uncached = min(uncached_runs)
+        cached = min(cached_runs)
+        print(f'{"emit, callsite cache disabled":30} {uncached * 1e6:9.2f} us/record')
+        print(f'{"emit":30} {cached * 1e6:9.2f} us/record')
+
+        handler.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Import time of the package, every case runs in a fresh interpreter.
+
+    python benchmarks/import_time.py [--runs 20]
+
+``import dblogger`` only loads the package itself, the handler (together with the
+database driver and the models) is imported when ``DBLogHandler`` is accessed. The
+second case is what every ``import dblogger`` cost before the handler was resolved lazily.
+"""
+from typing import List, Optional
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ('import dblogger', 'import dblogger'),
+    ('import dblogger + DBLogHandler', 'import dblogger; dblogger.DBLogHandler'),
+    ('import dblogger.sync_handler', 'import dblogger.sync_handler'),
+    ('import dblogger.async_handler', 'import dblogger.async_handler'),
+    ('import dblogger.sqlite_handler', 'import dblogger.sqlite_handler'),
+]
+
+TIMER = '''
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+'''
+
+
+def measure(code: str, runs: int) -> Optional[List[float]]:
+    """
+    Run ``code`` in ``runs`` fresh interpreters
+
+    :return: Seconds per run or ``None`` if the code fails (e.g. missing driver)
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result: List[float] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-c', TIMER.format(code=code)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env
+        )
+        if proc.returncode != 0:
+            return None
+        result.append(float(proc.stdout))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of dblogger')
+    parser.add_argument('--runs', dest='runs', type=int, default=20, help='Interpreter runs per case')
+    options = parser.parse_args()
+
+    for name, code in CASES:
+        times = measure(code, options.runs)
+        if times is None:
+            print(f'{name:40} n/a (driver not installed)')
+            continue
+        print(f'{name:40} median {statistics.median(times) * 1000:7.2f} ms   min {min(times) * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,61 @@
-# TODO
+#!/usr/bin/env python
+
+from typing import Optional
+import argparse
+import os
+
+from dblogger import get_run_mode, connect_sync
+from dblogger.models.schema import SCHEMA, SQLITE_SCHEMA
+
+
+def create_schema(db_url: str):
+    """
+    Run all schema statements in one transaction
+    """
+    if get_run_mode() == 'async':
+        import asyncio
+        import asyncpg
+
+        async def run():
+            db = await asyncpg.connect(dsn=db_url)
+            try:
+                async with db.transaction():
+                    for statement in SCHEMA:
+                        await db.execute(statement)
+            finally:
+                await db.close()
+
+        asyncio.get_event_loop().run_until_complete(run())
+        return
+
+    conn = connect_sync(db_url)
+    try:
+        cursor = conn.cursor()
+        for statement in (SQLITE_SCHEMA if get_run_mode() == 'sqlite' else SCHEMA):
+            cursor.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create or upgrade the logging schema in the DB')
+
+    parser.add_argument(
+        '--db',
+        dest='db',
+        type=str,
+        default=None,
+        help='DB Connection URI, if not set defaults to the environment variable `PGURI` or an empty value'
+    )
+
+    options = parser.parse_args()
+
+    db_url: Optional[str] = options.db
+    if db_url is None:
+        db_url = os.environ.get('PGURI', 'postgresql://localhost')
+
+    create_schema(db_url)
+
+if __name__ == '__main__':
+    main()
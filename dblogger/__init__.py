@@ -1,13 +1,93 @@
-try:
-    import asyncpg
-    from .async_handler import DBLogHandler
-except ImportError:
-    try:
-        import psycopg2
-        from .sync_handler import DBLogHandler
-    except ImportError:
-        raise RuntimeError("Please install a database driver, you'll need either psycopg2 or asyncpg")
+from typing import Optional, Any, List
+import os
+from importlib.util import find_spec
 
 from .taggedlogger import TaggedLogger
+from .tagscope import tag_scope, current_tags
 
-__all__ = ['DBLogHandler', 'TaggedLogger']
+__all__ = ['DBLogHandler', 'TaggedLogger', 'tag_scope', 'current_tags', 'get_run_mode', 'set_run_mode', 'connect_sync', 'RUN_MODES']
+
+# ``async``: asyncpg, ``sync``: psycopg2, ``psycopg``: psycopg 3, ``sqlite``: sqlite3 (never
+# detected automatically)
+RUN_MODES = ('async', 'sync', 'psycopg', 'sqlite')
+
+# forced run mode, ``None`` picks the implementation by the installed drivers
+_run_mode: Optional[str] = os.environ.get('DBLOGGER_RUN_MODE', None) or None
+
+
+def set_run_mode(run_mode: Optional[str]):
+    """
+    Force the ``async`` (asyncpg), ``sync`` (psycopg2), ``psycopg`` (psycopg 3) or ``sqlite``
+    implementation regardless of the installed drivers, ``None`` restores the auto-detection.
+    Setting the environment variable ``DBLOGGER_RUN_MODE`` does the same.
+
+    Call this before ``DBLogHandler`` is used for the first time.
+    """
+    global _run_mode
+    if run_mode is not None and run_mode not in RUN_MODES:
+        raise ValueError(f'`run_mode` has to be one of {", ".join(RUN_MODES)} or None')
+    _run_mode = run_mode
+    globals().pop('DBLogHandler', None)
+
+
+def get_run_mode() -> str:
+    """
+    Run mode to use, the forced one or the first installed driver of asyncpg (``async``),
+    psycopg2 (``sync``) and psycopg 3 (``psycopg``). The drivers are only looked up, not imported.
+    """
+    if _run_mode is not None:
+        if _run_mode not in RUN_MODES:
+            raise ValueError(f'DBLOGGER_RUN_MODE has to be one of {", ".join(RUN_MODES)}')
+        return _run_mode
+    if find_spec('asyncpg') is not None:
+        return 'async'
+    if find_spec('psycopg2') is not None:
+        return 'sync'
+    if find_spec('psycopg') is not None:
+        return 'psycopg'
+    raise RuntimeError("Please install a database driver, you'll need either psycopg2, psycopg or asyncpg")
+
+
+def connect_sync(dsn: str, run_mode: Optional[str]=None) -> Any:
+    """
+    Connect with the sync driver of the run mode, rows can be accessed by column name
+    with all drivers (``DictCursor`` for psycopg2, ``dict_row`` for psycopg 3 and SQLite)
+
+    :param dsn: Connection string, for SQLite the path of the database file or a
+                ``sqlite:///path`` DSN
+    :param run_mode: ``sync``, ``psycopg`` or ``sqlite``, defaults to ``get_run_mode()``
+    """
+    run_mode = run_mode or get_run_mode()
+    if run_mode == 'sqlite':
+        from .sqlite_models import connect
+        return connect(dsn)
+
+    if run_mode == 'psycopg':
+        import psycopg
+        from psycopg.rows import dict_row
+        return psycopg.connect(dsn, row_factory=dict_row)
+
+    import psycopg2
+    from psycopg2.extras import DictCursor
+    return psycopg2.connect(dsn, cursor_factory=DictCursor)
+
+
+def __getattr__(name: str) -> Any:
+    # the handler (and with it the driver and the models) is only imported on first access
+    if name == 'DBLogHandler':
+        run_mode = get_run_mode()
+        if run_mode == 'async':
+            from .async_handler import DBLogHandler
+        elif run_mode == 'psycopg':
+            from .psycopg_handler import DBLogHandler
+        elif run_mode == 'sqlite':
+            from .sqlite_handler import DBLogHandler
+        else:
+            from .sync_handler import DBLogHandler
+        globals()['DBLogHandler'] = DBLogHandler
+        return DBLogHandler
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals().keys()) | {'DBLogHandler'})
@@ -1,6 +1,7 @@
-from typing import List, Any, Optional, Dict, Tuple, Deque
+from typing import List, Any, Optional, Dict, Tuple, FrozenSet, Deque
 import asyncio
 import socket
+import time
 
 from datetime import datetime
 from collections import deque
@@ -9,7 +10,17 @@ from logging import Handler, Logger, NOTSET, LogRecord
 from asyncpg import Connection, connect
 from asyncpg.pool import Pool
 
-from .async_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry
+from .async_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException, LogTemplate, LogRollup
+from .tracebacks import normalize_traceback, format_traceback, traceback_hash
+from .templates import split_message, template_hash
+from .ratelimit import RateLimiter
+from .coalesce import Coalescer
+from .rollup import RollupCounter, report_flush_error
+from .lanes import PriorityLanes
+from .circuit import CircuitBreaker
+from .durability import Durability
+from .cache import LRUCache, TAG_CACHE_SIZE
+from .tagscope import TagSet, intern_tags, attach_scope_tags
 
 __all__ = ['DBLogHandler', 'AsyncFilter']
 
@@ -30,18 +41,45 @@ class DBLogHandler(Handler):
     queue: Deque[LogRecord] = deque()
     start_emitting: asyncio.Future
     stop_emitting: asyncio.Future
+    emitter: asyncio.Task
 
     # caches
     src_cache: Dict[str, LogSource] = {}
     func_cache: Dict[str, LogFunction] = {}
     logger_cache: Dict[str, LogLogger] = {}
     host_cache: Dict[str, LogHost] = {}
-    tag_cache: Dict[str, LogTag] = {}
+    # tags and tag sets may be unique per request, these caches are bounded
+    tag_cache: Dict[str, LogTag] = LRUCache(TAG_CACHE_SIZE)
+    exception_cache: Dict[str, LogException] = {}
+    template_cache: Dict[str, LogTemplate] = {}
+    tag_set_cache: Dict[FrozenSet[str], List[int]] = LRUCache(TAG_CACHE_SIZE)
+    tag_list_cache: Dict[FrozenSet[str], List[LogTag]] = LRUCache(TAG_CACHE_SIZE)
+    # (function_id, logger_id, hostname_id) by logger name and record code location
+    callsite_cache: Dict[Tuple[str, str, str, int, str], Tuple[int, int, int]] = {}
 
     # internal state
     logger_name: str
+    hostname: str
+    message_templates: bool = False
+    extra_fields: List[str]
+    tag_storage: str = 'table'
+    rate_limiter: Optional[RateLimiter] = None
+    coalescer: Optional[Coalescer] = None
+    rollup: Optional[RollupCounter] = None
+    lanes: Optional[PriorityLanes] = None
+    flush_handle: Optional[asyncio.TimerHandle] = None
+    summary_handle: Optional[asyncio.TimerHandle] = None
+    batch_handle: Optional[asyncio.TimerHandle] = None
+    circuit_breaker: CircuitBreaker
+    durability: Optional[Durability] = None
+    merge_handle: Optional[asyncio.TimerHandle] = None
+    next_merge: float = 0.0
     async_filters: List[AsyncFilter]
 
+    # an open commit group waiting for more records, and if ``drain`` asked it to finish
+    group_waiter: Optional[asyncio.Future] = None
+    draining: bool = False
+
     def __init__(
         self, name: str,
         db_name: Optional[str]=None,
@@ -50,7 +88,16 @@ class DBLogHandler(Handler):
         db_password: Optional[str]=None,
         db_host: str='localhost',
         db_port: int=5432,
-        level: int = NOTSET
+        level: int = NOTSET,
+        message_templates: bool = False,
+        extra_fields: Optional[List[str]] = None,
+        tag_storage: str = 'table',
+        rate_limiter: Optional[RateLimiter] = None,
+        coalescer: Optional[Coalescer] = None,
+        rollup: Optional[RollupCounter] = None,
+        lanes: Optional[PriorityLanes] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        durability: Optional[Durability] = None
     ):
         """
         Initialize new DB logging handler
@@ -63,7 +110,28 @@ class DBLogHandler(Handler):
         :param db_host: DB hostname (optional, defaults to ``localhost``)
         :param db_port: DB port (optional, defaults to ``5432``)
         :param level: Log level, defaults to ``NOTSET`` which inherits the level from the logger
+        :param message_templates: Store the message template once and only the arguments
+                                  with the entry instead of the formatted message
+        :param extra_fields: Names of ``extra`` attributes of the log record to store in
+                             the ``extra`` JSON column of the entry (e.g. ``['request_id']``)
+        :param tag_storage: ``table`` to store one ``logger_log_tag`` row per tag or ``array``
+                            to store the sorted tag ids in the ``tagIDs`` column of the entry
+        :param rate_limiter: Per-callsite rate limiting and sampling, suppressed records are
+                             replaced by periodic summary entries (optional)
+        :param coalescer: Fold identical records within a time window into one entry with
+                          a repeat count (optional)
+        :param rollup: Count entries per minute, logger, host, function and level and
+                       periodically add the counts to the ``logger_rollup`` table (optional)
+        :param lanes: Write records at or above a level immediately and batch (and under
+                      pressure drop) lower levels instead of using one FIFO queue (optional)
+        :param circuit_breaker: Reconnect backoff and fallback while the DB is unreachable,
+                                defaults to a ``CircuitBreaker`` that drops the records
+        :param durability: Relaxed commits, group commit or an unlogged staging table for
+                           low levels, trading a bounded window of loss for throughput (optional),
+                           group commit and relaxed commits need a connection instead of a pool
         """
+        if tag_storage not in ('table', 'array'):
+            raise ValueError('`tag_storage` has to be one of `table` or `array`')
 
         if db is not None:
             self.db = db
@@ -77,14 +145,28 @@ class DBLogHandler(Handler):
             else:
                 self.db_config = f'postgresql://{db_host}:{db_port}/{db_name}'
 
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.durability = durability
+
         loop = asyncio.get_event_loop()
         self.start_emitting = loop.create_future()
         self.stop_emitting = loop.create_future()
         self.stop_emitting.set_result(True)
-        loop.create_task(self.log_emitter())
+        self.emitter = loop.create_task(self.log_emitter())
+        if durability is not None and durability.staging:
+            self.next_merge = time.monotonic() + durability.merge_interval
+            self.schedule_merge()
 
         self.async_filters = []
         self.logger_name = name
+        self.hostname = socket.gethostname()
+        self.message_templates = message_templates
+        self.extra_fields = list(extra_fields) if extra_fields is not None else []
+        self.tag_storage = tag_storage
+        self.rate_limiter = rate_limiter
+        self.coalescer = coalescer
+        self.rollup = rollup
+        self.lanes = lanes
         self.createLock()
         super().__init__(level=level)
 
@@ -103,51 +185,425 @@ class DBLogHandler(Handler):
             self.async_filters.remove(filter)
 
     def emit(self, record: LogRecord):
-        self.queue.append(record)
+        # the tag scope has to be read in the context of the logging call
+        attach_scope_tags(record)
+        if self.coalescer is None:
+            self.enqueue(record)
+        else:
+            for item in self.coalescer.add(record):
+                self.enqueue(item)
+            self.schedule_flush()
+
+        self.wake()
+
+    def enqueue(self, record: LogRecord):
+        if self.rate_limiter is not None:
+            for summary in self.rate_limiter.summaries(record.created):
+                self.put(summary)
+            if not self.rate_limiter.allow(record):
+                self.schedule_summary()
+                return
 
-        if not self.start_emitting.done():
+        self.put(record)
+
+    def put(self, record: LogRecord):
+        if self.lanes is None:
+            self.queue.append(record)
+        else:
+            self.lanes.put(record)
+
+    def next_record(self) -> Optional[LogRecord]:
+        if self.lanes is not None:
+            return self.lanes.get()
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            return None
+
+    def pending(self) -> int:
+        if self.lanes is not None:
+            return len(self.lanes)
+        return len(self.queue)
+
+    def wake(self):
+        """
+        Start the emitter if there is something to write, with priority lanes only
+        immediate records or a full or overdue batch start it
+        """
+        if self.lanes is None:
+            ready = len(self.queue) > 0
+        else:
+            ready = self.lanes.ready()
+            if not ready:
+                self.schedule_batch()
+
+        if ready and not self.start_emitting.done():
             self.start_emitting.set_result(True)
+        if self.group_waiter is not None and not self.group_waiter.done() and self.pending() > 0:
+            self.group_waiter.set_result(True)
+
+        # restart the emitter if it died
+        if self.emitter.done() and not self.emitter.cancelled() and self.emitter.exception() is not None:
+            self.emitter = asyncio.get_event_loop().create_task(self.log_emitter())
+
+    def schedule_batch(self):
+        """
+        Make sure batched records are written after the batch delay even if the
+        batch does not fill up
+        """
+        deadline = self.lanes.next_deadline()
+        if self.batch_handle is not None or deadline is None:
+            return
+        loop = asyncio.get_event_loop()
+        self.batch_handle = loop.call_later(deadline, self.flush_batched)
+
+    def flush_batched(self):
+        self.batch_handle = None
+        self.wake()
+
+    def schedule_flush(self):
+        """
+        Make sure coalesced records are written once their window closes even if
+        no further records arrive
+        """
+        next_expiry = self.coalescer.next_expiry()
+        if self.flush_handle is not None or next_expiry is None:
+            return
+        loop = asyncio.get_event_loop()
+        self.flush_handle = loop.call_later(max(0.01, next_expiry - time.time()), self.flush_coalesced)
+
+    def flush_coalesced(self):
+        self.flush_handle = None
+        for item in self.coalescer.expired(time.time()):
+            self.enqueue(item)
+        self.schedule_flush()
+
+        self.wake()
+
+    def schedule_summary(self):
+        """
+        Make sure the summary of suppressed records is written once the summary
+        interval has passed even if no further records arrive
+        """
+        due = self.rate_limiter.next_summary_due()
+        if self.summary_handle is not None or due is None:
+            return
+        loop = asyncio.get_event_loop()
+        self.summary_handle = loop.call_later(max(0.01, due - time.time()), self.flush_summaries)
+
+    def flush_summaries(self):
+        self.summary_handle = None
+        for summary in self.rate_limiter.summaries():
+            self.put(summary)
+        self.schedule_summary()
+
+        self.wake()
 
     async def drain(self):
+        self.draining = True
+        try:
+            await self.drain_pending()
+        finally:
+            self.draining = False
+
+    async def drain_pending(self):
+        if self.coalescer is not None:
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+                self.flush_handle = None
+            for item in self.coalescer.flush():
+                self.enqueue(item)
+        if self.rate_limiter is not None:
+            if self.summary_handle is not None:
+                self.summary_handle.cancel()
+                self.summary_handle = None
+            for summary in self.rate_limiter.summaries(force=True):
+                self.put(summary)
+        if self.batch_handle is not None:
+            self.batch_handle.cancel()
+            self.batch_handle = None
+
+        if self.pending() > 0 and not self.start_emitting.done():
+            self.start_emitting.set_result(True)
+            # give the emitter a chance to pick up the remaining records
+            await asyncio.sleep(0)
+        if self.group_waiter is not None and not self.group_waiter.done():
+            # commit the open group now instead of waiting for the window to pass
+            self.group_waiter.set_result(True)
+
         if not self.stop_emitting.done():
             await self.stop_emitting
 
-    async def log_emitter(self):
-        if self.db is None:
-            if self.db_config is None:
-                raise RuntimeWarning('DB handle was closed, can not continue')
-            self.acquire()
-            try:
-                self.db = await connect(dsn=self.db_config)
-            except Exception:
-                return
-            self.release()
+        if self.rollup is not None and self.db is not None:
+            await self.flush_rollup()
 
+        if self.durability is not None and self.durability.staging and self.db is not None:
+            if self.merge_handle is not None:
+                self.merge_handle.cancel()
+                self.merge_handle = None
+            await self.merge_staging()
+
+    def schedule_merge(self):
         loop = asyncio.get_event_loop()
+        self.merge_handle = loop.call_later(self.durability.merge_interval, self.flush_staging)
+
+    def flush_staging(self):
+        # the emitter merges the staging table once it is idle
+        self.merge_handle = None
+        if not self.start_emitting.done():
+            self.start_emitting.set_result(True)
+        self.schedule_merge()
 
+    async def merge_staging(self):
+        """
+        Move the staging table into ``logger_log``
+        """
+        self.next_merge = time.monotonic() + self.durability.merge_interval
         try:
+            self.durability.merged += await LogEntry.merge_staging(self.db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the entries stay in the staging table for the next merge
+            pass
+
+    async def flush_rollup(self):
+        """
+        Add the rollup counters to the rollup table, inside an open group the upsert runs
+        in a savepoint so a failure does not abort the group, the counters are retried
+        with the next flush
+        """
+        counters = self.rollup.take()
+        if len(counters) == 0:
+            return
+        try:
+            async with self.db.transaction():
+                await LogRollup.upsert_counters(self.db, counters)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.rollup.restore(counters)
+            report_flush_error()
+
+    async def connect_db(self) -> bool:
+        """
+        Make sure there is a connection, returns ``False`` if the DB is unreachable
+        """
+        if self.db is not None:
+            return True
+        if self.db_config is None:
+            raise RuntimeWarning('DB handle was closed, can not continue')
+
+        try:
+            db = await connect(dsn=self.db_config)
+            # health probe
+            await db.fetchval('SELECT 1')
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.circuit_breaker.failure()
+            return False
+
+        self.db = db
+        self.circuit_breaker.success()
+        return True
+
+    async def log_emitter(self):
+        loop = asyncio.get_event_loop()
+
+        try:
+            # a failed connect only opens the circuit, the emitter keeps running and
+            # reconnects once the backoff delay has passed
+            await self.connect_db()
+
             while True:
                 await self.start_emitting
                 self.stop_emitting = loop.create_future()
 
                 try:
-                    record = self.queue.popleft()
-                except IndexError:
-                    record = None
-
-                while record is not None:
-                    await self.async_emit(record)
-                    try:
-                        record = self.queue.popleft()
-                    except IndexError:
-                        break
-
-                self.stop_emitting.set_result(True)
-                self.start_emitting = loop.create_future()
+                    await self.emit_pending()
+                    if (
+                        self.durability is not None and self.durability.staging and
+                        self.db is not None and time.monotonic() >= self.next_merge
+                    ):
+                        await self.merge_staging()
+                finally:
+                    self.stop_emitting.set_result(True)
+                    self.start_emitting = loop.create_future()
         except asyncio.CancelledError:
             return
 
-    async def async_emit(self, record: LogRecord):
+    async def emit_pending(self):
+        # with priority lanes immediate records are picked before the next batched one
+        record = self.next_record()
+        while record is not None:
+            if not self.circuit_breaker.allow() or not await self.connect_db():
+                # do not let the queue grow while the DB is down
+                self.circuit_breaker.reject(record)
+                record = self.next_record()
+            elif self.durability is not None and isinstance(self.db, Connection):
+                record = await self.emit_group(record)
+            else:
+                await self.async_emit(record)
+                record = self.next_record()
+
+    async def emit_group(self, record: LogRecord) -> Optional[LogRecord]:
+        """
+        Write queued records in one transaction until the group commit window has passed
+        or a record at or above the durability level was written, relaxed records wait
+        for further records until the window has passed. If one record fails, the other
+        records of the group are written one at a time.
+
+        :return: The next record that has not been written
+        """
+        deadline = time.monotonic() + self.durability.group_commit
+        transaction = self.db.transaction()
+        written: List[LogRecord] = []
+        failed = False
+        try:
+            await transaction.start()
+            relaxed_commit = False
+            while record is not None:
+                relaxed = self.durability.relaxed(record.levelno)
+                if relaxed and not relaxed_commit and not self.durability.synchronous_commit:
+                    await self.db.execute('SET LOCAL synchronous_commit TO OFF')
+                    relaxed_commit = True
+                elif not relaxed and relaxed_commit:
+                    await self.db.execute('SET LOCAL synchronous_commit TO ON')
+
+                # a failed record has been reported by ``async_emit`` and is skipped
+                failed = not await self.async_emit(record)
+                if not failed:
+                    written.append(record)
+                if failed or not relaxed or time.monotonic() >= deadline:
+                    record = self.next_record()
+                    break
+                record = await self.wait_for_record(deadline)
+
+            if not failed:
+                await transaction.commit()
+                return record
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failed = True
+
+        # the transaction is aborted, rows created in it must not be referenced again
+        connected = self.db is not None and not self.db.is_closed()
+        if connected:
+            try:
+                await transaction.rollback()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                connected = not self.db.is_closed()
+        self.clear_caches()
+
+        for item in written:
+            if not connected or not await self.emit_single(item):
+                self.durability.lost += 1
+                connected = self.db is not None and not self.db.is_closed()
+        return record
+
+    async def wait_for_record(self, deadline: float) -> Optional[LogRecord]:
+        """
+        Next queued record, waits until ``deadline`` (monotonic time) for one to arrive
+        """
+        record = self.next_record()
+        if record is not None or self.draining:
+            return record
+
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return None
+        self.group_waiter = asyncio.get_event_loop().create_future()
+        try:
+            await asyncio.wait_for(self.group_waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.group_waiter = None
+        return self.next_record()
+
+    async def emit_single(self, record: LogRecord) -> bool:
+        """
+        Write one record in its own transaction
+
+        :return: ``False`` if writing failed
+        """
+        transaction = self.db.transaction()
+        try:
+            await transaction.start()
+            if await self.async_emit(record):
+                await transaction.commit()
+                return True
+            if self.db is not None and not self.db.is_closed():
+                await transaction.rollback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+        self.clear_caches()
+        return False
+
+    def clear_caches(self):
+        # rows created in a rolled back transaction must not be referenced again
+        for cache in (
+            self.src_cache, self.func_cache, self.logger_cache, self.host_cache,
+            self.tag_cache, self.exception_cache, self.template_cache, self.tag_set_cache,
+            self.tag_list_cache, self.callsite_cache
+        ):
+            cache.clear()
+
+    async def resolve_tags(self, db: Connection, tag_set: TagSet) -> List[LogTag]:
+        tags: List[LogTag] = []
+        for tag_name in tag_set:
+            tag = self.tag_cache.get(tag_name, None)
+            if tag is None:
+                tag = await LogTag.get_or_create(db, name=tag_name)
+                self.tag_cache[tag_name] = tag
+            tags.append(tag)
+        return tags
+
+    async def resolve_callsite(self, db: Connection, record: LogRecord) -> Tuple[int, int, int]:
+        """
+        Look up or create the source, function, logger and host rows of a call site
+        """
+        src = self.src_cache.get(record.pathname, None)
+        if src is None:
+            src = await LogSource.get_or_create(db, path=record.pathname)
+            self.src_cache[record.pathname] = src
+
+        func_key = f'{record.name}.{record.funcName}:{record.lineno}@{src.path}'
+        func = self.func_cache.get(func_key, None)
+        if func is None:
+            func = await LogFunction.get_or_create(
+                db,
+                name=f'{record.name}.{record.funcName}',
+                line_number=record.lineno,
+                source_id=src.pk,
+            )
+            self.func_cache[func_key] = func
+
+        logger = self.logger_cache.get(self.logger_name, None)
+        if logger is None:
+            logger = await LogLogger.get_or_create(db, name=self.logger_name)
+            self.logger_cache[self.logger_name] = logger
+
+        host_key = self.hostname
+        host = self.host_cache.get(host_key, None)
+        if host is None:
+            host = await LogHost.get_or_create(db, name=host_key)
+            self.host_cache[host_key] = host
+
+        return func.pk, logger.pk, host.pk
+
+    async def async_emit(self, record: LogRecord) -> bool:
+        """
+        Write one record
+
+        :return: ``False`` if writing failed
+        """
         # run all async filters
         rv = True
         for f in self.async_filters:
@@ -162,60 +618,111 @@ class DBLogHandler(Handler):
             except Exception:
                 rv = True
         if not rv:
-            return
+            return True
 
         try:
-            src = self.src_cache.get(record.pathname, None)
-            if src is None:
-                src = await LogSource.get_or_create(self.db, path=record.pathname)
-                self.src_cache[record.pathname] = src
-
-            func_key = f'{record.name}.{record.funcName}:{record.lineno}@{src.path}'
-            func = self.func_cache.get(func_key, None)
-            if func is None:
-                func = await LogFunction.get_or_create(
-                    self.db,
-                    name=f'{record.name}.{record.funcName}',
-                    line_number=record.lineno,
-                    source_id=src.pk,
-                )
-                self.func_cache[func_key] = func
-
-            logger = self.logger_cache.get(self.logger_name, None)
-            if logger is None:
-                logger = await LogLogger.get_or_create(self.db, name=self.logger_name)
-                self.logger_cache[self.logger_name] = logger
-
-            host_key = socket.gethostname()
-            host = self.host_cache.get(host_key, None)
-            if host is None:
-                host = await LogHost.get_or_create(self.db, name=host_key)
-                self.host_cache[host_key] = host
-
-            entry = await LogEntry.create(
-                self.db,
+            callsite_key = (self.logger_name, record.name, record.funcName, record.lineno, record.pathname)
+            callsite = self.callsite_cache.get(callsite_key, None)
+            if callsite is None:
+                callsite = await self.resolve_callsite(self.db, record)
+                self.callsite_cache[callsite_key] = callsite
+            function_id, logger_id, hostname_id = callsite
+
+            exception: Optional[LogException] = None
+            normalized = normalize_traceback(record)
+            if normalized is not None:
+                exception = self.exception_cache.get(normalized, None)
+                if exception is None:
+                    exc_hash = traceback_hash(normalized)
+                    exception = await LogException.load(self.db, hash=exc_hash)
+                    if exception is None:
+                        exception = await LogException.create(
+                            self.db,
+                            hash=exc_hash,
+                            traceback=format_traceback(record)
+                        )
+                    self.exception_cache[normalized] = exception
+
+            message: Optional[str] = None
+            template: Optional[LogTemplate] = None
+            args: Optional[Any] = None
+            split = split_message(record) if self.message_templates else None
+            if split is None:
+                message = record.getMessage()
+            else:
+                template_text, args = split
+                template = self.template_cache.get(template_text, None)
+                if template is None:
+                    tpl_hash = template_hash(template_text)
+                    template = await LogTemplate.load(self.db, hash=tpl_hash)
+                    if template is None:
+                        template = await LogTemplate.create(self.db, hash=tpl_hash, template=template_text)
+                    self.template_cache[template_text] = template
+
+            extra: Optional[Dict[str, Any]] = None
+            for key in self.extra_fields:
+                value = getattr(record, key, None)
+                if value is not None:
+                    if extra is None:
+                        extra = {}
+                    extra[key] = value
+
+            # interned tag sets are resolved once, later records only do one lookup
+            tag_set = intern_tags(getattr(record, 'tags', None) or ())
+            tags: List[LogTag] = []
+            tag_ids: Optional[List[int]] = None
+            if self.tag_storage == 'array':
+                tag_ids = self.tag_set_cache.get(tag_set, None)
+                if tag_ids is None:
+                    tag_ids = sorted(set(tag.pk for tag in await self.resolve_tags(self.db, tag_set)))
+                    self.tag_set_cache[tag_set] = tag_ids
+            elif len(tag_set) > 0:
+                tags = self.tag_list_cache.get(tag_set, None)
+                if tags is None:
+                    tags = await self.resolve_tags(self.db, tag_set)
+                    self.tag_list_cache[tag_set] = tags
+
+            data = dict(
                 level=record.levelno,
-                message=record.getMessage(),
+                message=message,
                 pid=record.process,
                 time=datetime.fromtimestamp(record.created),
-                function_id=func.pk,
-                logger_id=logger.pk,
-                hostname_id=host.pk
+                function_id=function_id,
+                logger_id=logger_id,
+                hostname_id=hostname_id,
+                exception_id=exception.pk if exception is not None else None,
+                template_id=template.pk if template is not None else None,
+                args=args,
+                extra=extra,
+                tag_ids=tag_ids,
+                repeat_count=getattr(record, 'repeat_count', 1),
+                last_time=datetime.fromtimestamp(record.last_created) if hasattr(record, 'last_created') else None
             )
+            relaxed = self.durability is not None and self.durability.relaxed(record.levelno)
 
-            tags_names = getattr(record, 'tags', set())
-            tags: List[LogTag] = []
-            for tag_name in tags_names:
-                if tag_name is None or tag_name == '':
-                    continue
-                tag = self.tag_cache.get(tag_name, None)
-                if tag is None:
-                    tag = await LogTag.get_or_create(self.db, name=tag_name)
-                    self.tag_cache[tag_name] = tag
-
-                tags.append(tag)
-
-            await entry.add_tags(self.db, tags)
+            if relaxed and self.durability.staging:
+                await LogEntry.create_staged(self.db, tags if tag_ids is None else [], **data)
+            else:
+                entry = await LogEntry.create(self.db, **data)
+                if tag_ids is None:
+                    await entry.add_tags(self.db, tags)
+
+            if self.rollup is not None:
+                self.rollup.add(
+                    record.created, logger_id, hostname_id, function_id, record.levelno,
+                    getattr(record, 'repeat_count', 1)
+                )
+                if self.rollup.due():
+                    await self.flush_rollup()
 
         except Exception:
+            if self.db_config is not None and isinstance(self.db, Connection) and self.db.is_closed():
+                # connection lost, reconnect with backoff
+                self.db = None
+                self.circuit_breaker.failure()
+                self.circuit_breaker.reject(record)
+                return False
             self.handleError(record)
+            return False
+
+        return True
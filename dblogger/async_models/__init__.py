@@ -5,5 +5,9 @@ from .function import LogFunction
 from .host import LogHost
 from .logger import LogLogger
 from .source import LogSource
+from .exception import LogException
+from .template import LogTemplate
+from .rollup import LogRollup
+from .import_state import LogImport
 
-__all__ = ['LogEntry', 'LogFunction', 'LogHost', 'LogLogger', 'LogSource', 'LogTag']
+__all__ = ['LogEntry', 'LogFunction', 'LogHost', 'LogLogger', 'LogSource', 'LogTag', 'LogException', 'LogTemplate', 'LogRollup', 'LogImport']
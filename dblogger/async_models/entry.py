@@ -1,16 +1,25 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator
+import io
+import json
 from asyncpg import Connection, Record
 
 from logging import DEBUG
 from datetime import datetime, timezone
 
-from dblogger.models.entry import BaseLogEntry, get_sql_for_entry_with_date, get_sql_for_entry_after_id
-from .model import AsyncModel
+from dblogger.models.entry import BaseLogEntry, get_sql_for_entry_with_date, get_sql_for_entry_after_id, \
+    get_sql_for_template_counts, get_sql_for_search, get_search_value, get_sql_for_staged_entry, \
+    get_sql_for_merge_staging, get_sql_for_columns, get_sql_for_time_bucket, get_sql_for_time_counts, \
+    get_sql_for_dimension_counts
+from dblogger.columnar import LogColumns, DIMENSIONS, parse_binary_copy, unique_ids
+from dblogger.models.tracing import traced
+from .model import AsyncModel, MAX_PARAMETERS, fetch, fetchval, execute
 from .tag import LogTag
 from .function import LogFunction
 from .logger import LogLogger
 from .host import LogHost
 from .source import LogSource
+from .exception import LogException
+from .template import LogTemplate
 
 __all__ = ['LogEntry']
 
@@ -38,6 +47,23 @@ def deserialize_joined(entry: "LogEntry", result: Dict[str, Any]):
     setattr(entry, '_function', function)
     setattr(entry, '_logger', logger)
     setattr(entry, '_hostname', hostname)
+    if result['exceptionID'] is not None:
+        exception = LogException(rowdata={
+            "id": result['exceptionID'],
+            "traceback": result['exception_traceback']
+        })
+        setattr(entry, '_exception', exception)
+    if result['templateID'] is not None:
+        template = LogTemplate(rowdata={
+            "id": result['templateID'],
+            "template": result['template_text']
+        })
+        setattr(entry, '_template', template)
+    if result['tagIDs'] is not None:
+        tag_list = result['tag_list']
+        if isinstance(tag_list, str):
+            tag_list = json.loads(tag_list)
+        setattr(entry, '_tags', [LogTag(rowdata=tag) for tag in tag_list])
 
 
 class LogEntry(BaseLogEntry, AsyncModel):
@@ -48,8 +74,19 @@ class LogEntry(BaseLogEntry, AsyncModel):
         db: Connection,
         from_date: Optional[datetime]=None,
         to_date: Optional[datetime]=None,
-        limit: Optional[int]=None
+        limit: Optional[int]=None,
+        extra: Optional[Dict[str, Any]]=None,
+        search: Optional[str]=None,
+        search_mode: str='substring'
     ) -> List["LogEntry"]:
+        """
+        Load entries in a time range or the latest ``limit`` entries
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` for a case-insensitive substring search, ``words`` for a
+                            full text search (web search syntax, e.g. ``timeout -redis``)
+        """
         if from_date is None and to_date is None and limit is None:
             raise ValueError('Define at least one of `from_date`, `to_date` or `limit`')
         where_clause = []
@@ -60,11 +97,17 @@ class LogEntry(BaseLogEntry, AsyncModel):
         if to_date is not None:
             where_clause.append(f'"time" < ${len(where_clause) + 1}')
             values.append(to_date.timestamp())
+        if extra is not None:
+            where_clause.append(f'le.extra @> ${len(where_clause) + 1}::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search(f'${len(where_clause) + 1}', search_mode))
+            values.append(get_search_value(search, search_mode))
 
         where_clause = ' AND '.join(where_clause)
 
         sql = get_sql_for_entry_with_date(where_clause, limit)
-        results = await db.fetch(sql, *values)
+        results = await fetch(db, sql, *values)
 
         entries = []
         for result in results:
@@ -74,8 +117,224 @@ class LogEntry(BaseLogEntry, AsyncModel):
         return entries
 
     @classmethod
-    async def load_all_after_id(cls, db: Connection, lowest_id: int) -> List["LogEntry"]:
-        results = await db.fetch(get_sql_for_entry_after_id("$1"), lowest_id)
+    async def iterate_with_date(
+        cls,
+        db: Connection,
+        from_date: datetime,
+        to_date: datetime,
+        batch_size: int=5000,
+        extra: Optional[Dict[str, Any]]=None,
+        search: Optional[str]=None,
+        search_mode: str='substring'
+    ) -> AsyncGenerator["LogEntry", None]:
+        """
+        Stream all entries with ``from_date <= time < to_date`` in batches using a
+        server side cursor, has to be called inside a transaction. Tags are prefetched
+        per batch.
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause = ['"time" >= $1', '"time" < $2']
+        values: List[Any] = [from_date.timestamp(), to_date.timestamp()]
+        if extra is not None:
+            where_clause.append(f'le.extra @> ${len(values) + 1}::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search(f'${len(values) + 1}', search_mode))
+            values.append(get_search_value(search, search_mode))
+        sql = get_sql_for_entry_with_date(' AND '.join(where_clause))
+
+        entries: List["LogEntry"] = []
+        async for result in db.cursor(sql, *values, prefetch=batch_size):
+            entry = cls(rowdata=result)
+            deserialize_joined(entry, result)
+            entries.append(entry)
+            if len(entries) >= batch_size:
+                await cls.prefetch_tags(db, entries)
+                for entry in entries:
+                    yield entry
+                entries = []
+
+        await cls.prefetch_tags(db, entries)
+        for entry in entries:
+            yield entry
+
+    @classmethod
+    async def load_columns(
+        cls,
+        db: Connection,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> LogColumns:
+        """
+        Load entries with ``from_date <= time < to_date`` as NumPy column arrays (needs
+        ``numpy``). The rows are transferred with binary ``COPY`` and parsed in one go,
+        no objects are created per row.
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause: List[str] = []
+        values: List[Any] = []
+        if from_date is not None:
+            where_clause.append(f'"time" >= ${len(where_clause) + 1}')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append(f'"time" < ${len(where_clause) + 1}')
+            values.append(to_date.timestamp())
+        if extra is not None:
+            where_clause.append(f'le.extra @> ${len(where_clause) + 1}::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search(f'${len(where_clause) + 1}', search_mode))
+            values.append(get_search_value(search, search_mode))
+
+        buffer = io.BytesIO()
+        sql = get_sql_for_columns(' AND '.join(where_clause))
+        with traced(sql, len(values)) as trace:
+            await db.copy_from_query(sql, *values, output=buffer, format='binary')
+            arrays = parse_binary_copy(buffer.getvalue())
+            trace.rows = len(arrays['id'])
+
+        names: Dict[str, Dict[int, str]] = {}
+        for name, column, table in DIMENSIONS:
+            ids = unique_ids(arrays, column)
+            names[name] = {}
+            if len(ids) == 0:
+                continue
+            for row in await fetch(db, f'SELECT id, name FROM {table} WHERE id = ANY($1::integer[]);', ids):
+                names[name][row['id']] = row['name']
+
+        return LogColumns(arrays, names)
+
+    @classmethod
+    async def prefetch_tags(cls, db: Connection, entries: List["LogEntry"]):
+        """
+        Load the tags of all entries that have no cached tags with one query
+        """
+        missing: Dict[int, "LogEntry"] = {}
+        for entry in entries:
+            if getattr(entry, '_tags', None) is None:
+                setattr(entry, '_tags', [])
+                missing[entry.pk] = entry
+        if len(missing) == 0:
+            return
+
+        sql = f"""
+            SELECT lt."logID", t.* FROM logger_log_tag lt
+            JOIN logger_tag t ON t.id = lt."tagID"
+            WHERE lt."logID" = ANY($1::bigint[]);
+        """
+        for result in await fetch(db, sql, list(missing.keys())):
+            getattr(missing[result['logID']], '_tags').append(LogTag(rowdata=result))
+
+    @classmethod
+    async def count_by_template(
+        cls,
+        db: Connection,
+        from_date: Optional[datetime]=None,
+        to_date: Optional[datetime]=None,
+        limit: Optional[int]=None
+    ) -> List[Tuple[LogTemplate, int]]:
+        """
+        Count entries stored in template mode grouped by their message template,
+        most frequent templates first
+        """
+        where_clause = []
+        values = []
+        if from_date is not None:
+            where_clause.append(f'"time" > ${len(where_clause) + 1}')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append(f'"time" < ${len(where_clause) + 1}')
+            values.append(to_date.timestamp())
+
+        results = await fetch(db, get_sql_for_template_counts(' AND '.join(where_clause), limit), *values)
+        return [(LogTemplate(rowdata=result), result['count']) for result in results]
+
+    @classmethod
+    async def count_by_time(
+        cls,
+        db: Connection,
+        from_date: datetime,
+        to_date: datetime,
+        bucket: int=60,
+        level: int=0
+    ) -> List[Dict[str, Any]]:
+        """
+        Count entries per time bucket and level, like ``LogRollup.load_stats`` but for any
+        bucket width and without the rollup table
+
+        :param bucket: Width of a bucket in seconds
+        :param level: Only count entries with this level or higher
+        :return: One dict with ``time`` (start of the bucket), ``level`` and ``count`` per bucket and level
+        """
+        where_clause = ['le.level >= $1', 'le."time" >= $2', 'le."time" < $3']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+
+        results = await fetch(
+            db,
+            get_sql_for_time_counts(' AND '.join(where_clause), get_sql_for_time_bucket(bucket)),
+            *values
+        )
+        return [
+            dict(time=datetime.utcfromtimestamp(result['time']), level=result['level'], count=result['count'])
+            for result in results
+        ]
+
+    @classmethod
+    async def count_by(
+        cls,
+        db: Connection,
+        dimension: str,
+        from_date: datetime,
+        to_date: datetime,
+        level: int=0,
+        limit: int=10
+    ) -> List[Tuple[str, int]]:
+        """
+        Count entries grouped by ``functions``, ``loggers``, ``tags`` or ``messages``,
+        most frequent first
+
+        :param level: Only count entries with this level or higher
+        :return: Tuples of name and count, functions are named ``name:line``
+        """
+        where_clause = ['le.level >= $1', 'le."time" >= $2', 'le."time" < $3']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+        results = await fetch(db, get_sql_for_dimension_counts(dimension, ' AND '.join(where_clause), limit), *values)
+        return [(result['name'], result['count']) for result in results]
+
+    @classmethod
+    async def load_all_after_id(
+        cls,
+        db: Connection,
+        lowest_id: int,
+        extra: Optional[Dict[str, Any]]=None,
+        search: Optional[str]=None,
+        search_mode: str='substring'
+    ) -> List["LogEntry"]:
+        """
+        Load all entries newer than ``lowest_id``
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause = []
+        values: List[Any] = [lowest_id]
+        if extra is not None:
+            where_clause.append(f'le.extra @> ${len(values) + 1}::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search(f'${len(values) + 1}', search_mode))
+            values.append(get_search_value(search, search_mode))
+        results = await fetch(db, get_sql_for_entry_after_id("$1", ' AND '.join(where_clause)), *values)
 
         entries = []
         for result in results:
@@ -85,11 +344,16 @@ class LogEntry(BaseLogEntry, AsyncModel):
         return entries
 
     async def add_tag(self, db: Connection, tag: LogTag):
+        if self.tag_ids is not None:
+            await self.add_tags(db, [tag])
+            return
+
         cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
         if cached_tags is not None:
             cached_tags.append(tag)
 
-        await db.execute(
+        await execute(
+            db,
             'INSERT INTO logger_log_tag ("logID", "tagID") VALUES ($1, $2);',
             self.pk, tag.pk
         )
@@ -102,6 +366,15 @@ class LogEntry(BaseLogEntry, AsyncModel):
 
         if len(tags) == 0:
             return
+
+        if self.tag_ids is not None:
+            self.tag_ids = sorted(set(self.tag_ids) | set(tag.pk for tag in tags))
+            await execute(
+                db,
+                f'UPDATE {self.table} SET "tagIDs" = $1 WHERE id = $2;',
+                self.tag_ids, self.pk
+            )
+            return
         values: List[int] = []
         placeholders: List[str] = []
         for idx, tag in enumerate(tags):
@@ -111,14 +384,113 @@ class LogEntry(BaseLogEntry, AsyncModel):
 
         sql = f'INSERT INTO logger_log_tag ("logID", "tagID") VALUES {", ".join(placeholders)};'
 
-        await db.execute(sql, *values)
+        await execute(db, sql, *values)
+
+    @classmethod
+    async def add_tags_many(cls, db: Connection, entries: List[Tuple["LogEntry", List[LogTag]]]):
+        """
+        Tag multiple entries with one multi-row insert per chunk
+        """
+        values: List[int] = []
+        for entry, tags in entries:
+            cached_tags: Optional[List[LogTag]] = getattr(entry, '_tags', None)
+            if cached_tags is not None:
+                cached_tags.extend(tags)
+            for tag in tags:
+                values.append(entry.pk)
+                values.append(tag.pk)
+
+        chunk_size = MAX_PARAMETERS - (MAX_PARAMETERS % 2)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            placeholders = [f'(${idx + 1}, ${idx + 2})' for idx in range(0, len(chunk), 2)]
+            sql = f'INSERT INTO logger_log_tag ("logID", "tagID") VALUES {", ".join(placeholders)};'
+            await execute(db, sql, *chunk)
+
+    @classmethod
+    async def copy_many(
+        cls,
+        db: Connection,
+        items: List[Dict[str, Any]],
+        tag_ids: Optional[List[List[int]]]=None
+    ) -> List[int]:
+        """
+        Bulk load entries with ``COPY``, the ids are allocated from the sequence up front
+        so the tags can be copied into ``logger_log_tag`` right away
+
+        :param items: Entry data like for ``create``
+        :param tag_ids: Optional list of tag ids for every item
+        :return: ids of the new entries in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        result = await fetch(
+            db,
+            f"SELECT nextval(pg_get_serial_sequence('{cls.table}', 'id')) FROM generate_series(1, $1);",
+            len(items)
+        )
+        ids = [row[0] for row in result]
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(dict.fromkeys(key for ser in sers for key in ser.keys()))
+        with traced(f'COPY {cls.table} FROM STDIN') as trace:
+            await db.copy_records_to_table(
+                cls.table,
+                records=[[pk] + [ser.get(key, None) for key in keys] for pk, ser in zip(ids, sers)],
+                columns=['id'] + keys
+            )
+            trace.rows = len(ids)
+
+        if tag_ids is not None:
+            with traced('COPY logger_log_tag FROM STDIN') as trace:
+                records = [(pk, tag_id) for pk, tags in zip(ids, tag_ids) for tag_id in tags]
+                await db.copy_records_to_table('logger_log_tag', records=records, columns=['logID', 'tagID'])
+                trace.rows = len(records)
+
+        return ids
+
+    @classmethod
+    async def create_staged(cls, db: Connection, tags: List[LogTag], **kwargs) -> int:
+        """
+        Insert an entry and its tags into the unlogged staging tables with one statement,
+        the entry is moved to ``logger_log`` by ``merge_staging``
+
+        :return: id of the entry
+        """
+        ser = cls.serialize_data(kwargs)
+        params = [f'${idx + 1}' for idx in range(len(ser))]
+        return await fetchval(
+            db,
+            get_sql_for_staged_entry(list(ser.keys()), params, f'${len(ser) + 1}'),
+            *ser.values(), [tag.pk for tag in tags]
+        )
+
+    @classmethod
+    async def merge_staging(cls, db: Connection) -> int:
+        """
+        Move all entries and tags from the staging tables to ``logger_log``
+
+        :return: Number of moved entries
+        """
+        return await fetchval(db, get_sql_for_merge_staging())
 
     async def remove_tag(self, db: Connection, tag: LogTag):
         cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
         if cached_tags is not None:
             cached_tags.remove(tag)
 
-        await db.execute(
+        if self.tag_ids is not None:
+            self.tag_ids = [tag_id for tag_id in self.tag_ids if tag_id != tag.pk]
+            await execute(
+                db,
+                f'UPDATE {self.table} SET "tagIDs" = $1 WHERE id = $2;',
+                self.tag_ids, self.pk
+            )
+            return
+
+        await execute(
+            db,
             'DELETE FROM logger_log_tag WHERE "logID" = $1 AND "tagID" = $2;',
             self.pk, tag.pk
         )
@@ -129,12 +501,15 @@ class LogEntry(BaseLogEntry, AsyncModel):
             return cached_tags
 
         cached_tags = []
-        sql = f"""
-            SELECT t.* FROM logger_log_tag lt
-            JOIN logger_tag t ON t.id = lt."tagID"
-            WHERE "logID" = $1;
-        """
-        results = await db.fetch(sql, self.pk)
+        if self.tag_ids is not None:
+            results = await fetch(db, f'SELECT * FROM {LogTag.table} WHERE id = ANY($1::integer[]);', self.tag_ids)
+        else:
+            sql = f"""
+                SELECT t.* FROM logger_log_tag lt
+                JOIN logger_tag t ON t.id = lt."tagID"
+                WHERE "logID" = $1;
+            """
+            results = await fetch(db, sql, self.pk)
         for result in results:
             result = LogTag(rowdata=result)
             cached_tags.append(result)
@@ -144,16 +519,40 @@ class LogEntry(BaseLogEntry, AsyncModel):
 
 
     async def function(self, db: Connection) -> LogFunction:
-        result = getattr(self, '_function', await LogFunction.load(db, pk=self.function_id))
-        setattr(self, '_function', result)
+        result = getattr(self, '_function', None)
+        if result is None:
+            result = await LogFunction.load(db, pk=self.function_id)
+            setattr(self, '_function', result)
         return result
 
     async def logger(self, db: Connection) -> LogLogger:
-        result = getattr(self, '_logger', await LogLogger.load(db, pk=self.logger_id))
-        setattr(self, '_logger', result)
+        result = getattr(self, '_logger', None)
+        if result is None:
+            result = await LogLogger.load(db, pk=self.logger_id)
+            setattr(self, '_logger', result)
         return result
 
     async def hostname(self, db: Connection) -> LogHost:
-        result = getattr(self, '_hostname', await LogHost.load(db, pk=self.hostname_id))
-        setattr(self, '_hostname', result)
+        result = getattr(self, '_hostname', None)
+        if result is None:
+            result = await LogHost.load(db, pk=self.hostname_id)
+            setattr(self, '_hostname', result)
+        return result
+
+    async def exception(self, db: Connection) -> Optional[LogException]:
+        if self.exception_id is None:
+            return None
+        result = getattr(self, '_exception', None)
+        if result is None:
+            result = await LogException.load(db, pk=self.exception_id)
+            setattr(self, '_exception', result)
+        return result
+
+    async def template(self, db: Connection) -> Optional[LogTemplate]:
+        if self.template_id is None:
+            return None
+        result = getattr(self, '_template', None)
+        if result is None:
+            result = await LogTemplate.load(db, pk=self.template_id)
+            setattr(self, '_template', result)
         return result
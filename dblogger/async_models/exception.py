@@ -0,0 +1,6 @@
+from dblogger.models.exception import BaseLogException
+from .model import AsyncModel
+
+
+class LogException(BaseLogException, AsyncModel):
+    pass
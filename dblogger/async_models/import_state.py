@@ -0,0 +1,22 @@
+from asyncpg import Connection
+
+from dblogger.models.import_state import BaseLogImport
+from .model import AsyncModel, execute
+
+
+class LogImport(BaseLogImport, AsyncModel):
+
+    @classmethod
+    async def save_progress(cls, db: Connection, path: str, offset: int, entries: int):
+        """
+        Record how far a file has been imported, run this in the transaction that
+        loaded the entries so the progress always matches the data
+        """
+        await execute(db, f'''
+            INSERT INTO {cls.table} (path, "offset", entries) VALUES ($1, $2, $3)
+            ON CONFLICT (path) DO UPDATE SET "offset" = EXCLUDED."offset", entries = {cls.table}.entries + EXCLUDED.entries
+        ''', path, offset, entries)
+
+    @classmethod
+    async def reset(cls, db: Connection, path: str):
+        await execute(db, f'DELETE FROM {cls.table} WHERE path = $1;', path)
@@ -2,9 +2,45 @@ from typing import List, Dict, Any, Tuple, Optional, ClassVar
 from asyncpg import Connection, Record
 
 from dblogger.models.model import BaseModel
+from dblogger.models.tracing import traced
 
 __all__ = ['AsyncModel']
 
+# PostgreSQL allows at most 32767 bind parameters per statement
+MAX_PARAMETERS = 32767
+
+
+# Statement helpers, timed by the installed query tracer
+
+async def fetch(db: Connection, sql: str, *values: Any) -> List[Record]:
+    with traced(sql, len(values)) as trace:
+        result = await db.fetch(sql, *values)
+        trace.rows = len(result)
+    return result
+
+
+async def fetchrow(db: Connection, sql: str, *values: Any) -> Optional[Record]:
+    with traced(sql, len(values)) as trace:
+        result = await db.fetchrow(sql, *values)
+        trace.rows = 0 if result is None else 1
+    return result
+
+
+async def fetchval(db: Connection, sql: str, *values: Any) -> Any:
+    with traced(sql, len(values)) as trace:
+        result = await db.fetchval(sql, *values)
+        trace.rows = 0 if result is None else 1
+    return result
+
+
+async def execute(db: Connection, sql: str, *values: Any) -> str:
+    with traced(sql, len(values)) as trace:
+        status = await db.execute(sql, *values)
+        count = status.rsplit(' ', 1)[-1]
+        if count.isdigit():
+            trace.rows = int(count)
+    return status
+
 
 class AsyncModel(BaseModel):
 
@@ -32,7 +68,7 @@ class AsyncModel(BaseModel):
             ser['id'] = pk
         where_clause, values = AsyncModel.make_where_statement(ser)
 
-        data = await db.fetchrow(f'SELECT * FROM {cls.table} WHERE {where_clause};', *values)
+        data = await fetchrow(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', *values)
         if data is None:
             return None
         return cls(rowdata=data)
@@ -42,7 +78,7 @@ class AsyncModel(BaseModel):
         ser = cls.serialize_data(kwargs)
         where_clause, values = AsyncModel.make_where_statement(ser)
 
-        result = await db.fetch(f'SELECT * FROM {cls.table} WHERE {where_clause};', *values)
+        result = await fetch(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', *values)
         return [cls(rowdata=data) for data in result]
 
     @classmethod
@@ -62,9 +98,94 @@ class AsyncModel(BaseModel):
             sql += ' ON CONFLICT DO NOTHING'
 
         sql += ' RETURNING *'
-        data = await db.fetchrow(sql, *values)
+        data = await fetchrow(db, sql, *values)
         return cls(rowdata=data)
 
+    @classmethod
+    async def create_many(cls, db: Connection, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Insert multiple rows with one multi-row ``INSERT`` per chunk, keys that
+        are missing from some of the items are inserted as ``NULL``.
+
+        :return: List of created models in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(dict.fromkeys(key for ser in sers for key in ser.keys()))
+        value_list = [f'"{v}"' for v in keys]
+        chunk_size = max(1, MAX_PARAMETERS // max(1, len(keys)))
+
+        result: List[Any] = []
+        for start in range(0, len(sers), chunk_size):
+            values: List[Any] = []
+            placeholders: List[str] = []
+            for ser in sers[start:start + chunk_size]:
+                params: List[str] = []
+                for key in keys:
+                    values.append(ser.get(key, None))
+                    params.append(f'${len(values)}')
+                placeholders.append('(' + ', '.join(params) + ')')
+
+            sql = f'''
+                INSERT INTO {cls.table} ({', '.join(value_list)})
+                VALUES {', '.join(placeholders)}
+                RETURNING *
+            '''
+            rows = await fetch(db, sql, *values)
+            result.extend(cls(rowdata=data) for data in rows)
+        return result
+
+    @classmethod
+    async def get_or_create_many(
+        cls,
+        db: Connection,
+        items: List[Dict[str, Any]],
+        defaults: Optional[List[Dict[str, Any]]]=None
+    ) -> List[Any]:
+        """
+        Batched ``get_or_create``, looks up all distinct items with one query per chunk
+        and creates the missing ones with ``create_many``. All items have to use the same keys.
+
+        :param items: Lookup data of every item
+        :param defaults: Optional additional data for every item that is only used when creating
+        :return: List of models in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(sers[0].keys())
+        row_keys = [tuple(ser[key] for key in keys) for ser in sers]
+        unique = list(dict.fromkeys(row_keys))
+        chunk_size = min(1000, max(1, MAX_PARAMETERS // max(1, len(keys))))
+
+        found: Dict[Tuple[Any, ...], Any] = {}
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            values: List[Any] = []
+            clauses: List[str] = []
+            for row_key in chunk:
+                clauses.append('(' + ' AND '.join([
+                    f'"{key}" = ${len(values) + idx + 1}' for idx, key in enumerate(keys)
+                ]) + ')')
+                values.extend(row_key)
+            result = await fetch(db, f'SELECT * FROM {cls.table} WHERE {" OR ".join(clauses)};', *values)
+            for data in result:
+                found[tuple(data[key] for key in keys)] = cls(rowdata=data)
+
+        missing: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for idx, (row_key, item) in enumerate(zip(row_keys, items)):
+            if row_key not in found and row_key not in missing:
+                if defaults is not None:
+                    item = dict(item, **defaults[idx])
+                missing[row_key] = item
+        created = await cls.create_many(db, list(missing.values()))
+        found.update(zip(missing.keys(), created))
+
+        return [found[row_key] for row_key in row_keys]
+
     @classmethod
     async def get_or_create(cls, db: Connection, **kwargs) -> Any:
         item = await cls.load(db, **kwargs)
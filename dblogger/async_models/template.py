@@ -0,0 +1,6 @@
+from dblogger.models.template import BaseLogTemplate
+from .model import AsyncModel
+
+
+class LogTemplate(BaseLogTemplate, AsyncModel):
+    pass
@@ -0,0 +1,34 @@
+from typing import Any, Optional
+from collections import OrderedDict
+
+__all__ = ['LRUCache', 'TAG_CACHE_SIZE']
+
+# entries of the tag caches of the handlers, tags may be unique per request (e.g. a request id)
+TAG_CACHE_SIZE = 10000
+
+
+class LRUCache(OrderedDict):
+    """
+    Dict with a maximum number of items, the least recently used item is evicted when
+    a new item would exceed ``max_size``. Use ``get`` for lookups, it marks the item as used.
+    """
+
+    max_size: int
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__()
+
+    def get(self, key: Any, default: Optional[Any]=None) -> Any:
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Any, value: Any):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
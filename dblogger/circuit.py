@@ -0,0 +1,122 @@
+from typing import Optional
+import random
+import time
+
+from logging import Handler, LogRecord
+
+__all__ = ['CircuitBreaker']
+
+
+class CircuitBreaker:
+    """
+    Reconnect backoff and circuit breaker for the handlers.
+
+    After ``failure_threshold`` consecutive connection failures the circuit opens and
+    records are not written to the DB but passed to the ``fallback`` handler (or counted
+    as dropped) until the backoff delay has passed. Then one record is let through
+    as a probe (half-open), if that fails the circuit opens again with twice the delay,
+    if it succeeds the circuit closes. One breaker may be shared by several handlers
+    that log to the same DB.
+    """
+
+    # config
+    failure_threshold: int
+    base_delay: float
+    max_delay: float
+    fallback: Optional[Handler]
+
+    # state, one of ``closed``, ``open`` or ``half-open``
+    state: str
+    failures: int
+    opened: int
+    retry_at: float
+
+    # counters
+    dropped: int
+    diverted: int
+
+    def __init__(
+        self,
+        failure_threshold: int=1,
+        base_delay: float=0.5,
+        max_delay: float=60.0,
+        fallback: Optional[Handler]=None
+    ):
+        """
+        Initialize circuit breaker
+
+        :param failure_threshold: Consecutive connection failures that open the circuit
+        :param base_delay: Seconds the circuit stays open after the first failure, doubled
+                           for every failed probe
+        :param max_delay: Upper limit for the delay
+        :param fallback: Handler that gets the records while the circuit is open (e.g. a
+                         ``StreamHandler`` or ``FileHandler``), records are dropped if not set
+        """
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.fallback = fallback
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0.0
+        self.dropped = 0
+        self.diverted = 0
+
+    def allow(self) -> bool:
+        """
+        Check if the DB should be used, switches to ``half-open`` once the delay has passed
+        """
+        if self.state == 'open':
+            if time.monotonic() < self.retry_at:
+                return False
+            self.state = 'half-open'
+        return True
+
+    def success(self):
+        """
+        Report a working connection, closes the circuit
+        """
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+
+    def failure(self):
+        """
+        Report a connection failure, opens the circuit after ``failure_threshold`` failures
+        or immediately if the probe of a half-open circuit failed
+        """
+        self.failures += 1
+        if self.state != 'half-open' and self.failures < self.failure_threshold:
+            return
+        self.state = 'open'
+        self.retry_at = time.monotonic() + self.delay
+        self.opened += 1
+
+    @property
+    def delay(self) -> float:
+        """
+        Current backoff delay in seconds, with jitter so handlers sharing a DB do not
+        reconnect in lockstep
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** min(self.opened, 32)))
+        return delay * (0.5 + random.random() / 2)
+
+    @property
+    def remaining(self) -> float:
+        """
+        Seconds until the next probe, ``0`` if the circuit is not open
+        """
+        if self.state != 'open':
+            return 0.0
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def reject(self, record: LogRecord):
+        """
+        Handle a record that could not be written to the DB
+        """
+        if self.fallback is not None:
+            self.diverted += 1
+            self.fallback.handle(record)
+        else:
+            self.dropped += 1
@@ -0,0 +1,95 @@
+from typing import List, Optional, Tuple, FrozenSet
+from collections import OrderedDict
+
+from logging import LogRecord
+
+from .ratelimit import callsite_key
+
+__all__ = ['Coalescer']
+
+
+class Coalescer:
+    """
+    Coalesces identical records (same callsite, level, message and tags) that arrive
+    within a time window into the first record of the burst.
+
+    Every record is held back until its window has passed, the record that is
+    eventually written carries ``repeat_count`` and ``last_created`` attributes.
+    """
+
+    # config
+    window: float
+    max_size: int
+
+    # first record of every open window in arrival order
+    pending: 'OrderedDict[Tuple[str, int, str, FrozenSet[str]], LogRecord]'
+
+    # counters
+    coalesced: int
+
+    def __init__(self, window: float=1.0, max_size: int=1000):
+        """
+        Initialize coalescer
+
+        :param window: Seconds identical records are folded into the first one
+        :param max_size: Maximum number of open windows, the oldest window is closed
+                         early if more distinct records arrive
+        """
+        self.window = window
+        self.max_size = max_size
+        self.pending = OrderedDict()
+        self.coalesced = 0
+
+    def add(self, record: LogRecord) -> List[LogRecord]:
+        """
+        Add a record to the coalescing table
+
+        :return: Records whose window has closed and that should be written now
+        """
+        ready = self.expired(record.created)
+
+        tags = getattr(record, 'tags', None) or ()
+        if not isinstance(tags, frozenset):
+            tags = frozenset(tags)
+        key = (callsite_key(record), record.levelno, record.getMessage(), tags)
+        first = self.pending.get(key, None)
+        if first is not None:
+            first.repeat_count += 1
+            first.last_created = record.created
+            self.coalesced += 1
+            return ready
+
+        record.repeat_count = 1
+        record.last_created = record.created
+        self.pending[key] = record
+        if len(self.pending) > self.max_size:
+            ready.append(self.pending.popitem(last=False)[1])
+        return ready
+
+    def expired(self, now: float) -> List[LogRecord]:
+        """
+        Remove and return all records whose window has closed at ``now``
+        """
+        ready: List[LogRecord] = []
+        while len(self.pending) > 0:
+            first = next(iter(self.pending.values()))
+            if now - first.created < self.window:
+                break
+            ready.append(self.pending.popitem(last=False)[1])
+        return ready
+
+    def next_expiry(self) -> Optional[float]:
+        """
+        Timestamp at which the oldest open window closes, ``None`` if nothing is pending
+        """
+        if len(self.pending) == 0:
+            return None
+        return next(iter(self.pending.values())).created + self.window
+
+    def flush(self) -> List[LogRecord]:
+        """
+        Close all windows and return their records
+        """
+        ready = list(self.pending.values())
+        self.pending = OrderedDict()
+        return ready
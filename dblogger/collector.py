@@ -0,0 +1,586 @@
+from typing import List, Any, Optional, Dict, Tuple, Sequence
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+
+from datetime import datetime
+from logging import Handler, NOTSET, LogRecord, getLogger
+
+from . import get_run_mode, connect_sync
+from .tracebacks import normalize_traceback, format_traceback, traceback_hash
+from .cache import LRUCache, TAG_CACHE_SIZE
+from .tagscope import attach_scope_tags
+
+__all__ = [
+    'CollectorHandler', 'Collector', 'encode_record', 'decode_record', 'DEFAULT_SOCKET_PATH',
+    'DEFAULT_SOCKET_MODE', 'DEFAULT_MAX_FRAME_SIZE'
+]
+
+DEFAULT_SOCKET_PATH = '/tmp/dblogger.sock'
+
+# only the owner and the group of the socket may send records
+DEFAULT_SOCKET_MODE = 0o660
+
+# frames above this size are rejected, the collector drops the connection
+DEFAULT_MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+# delay before reconnecting to the DB after a failed attempt, doubled on every failure
+MIN_RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+# Wire format, all integers in network byte order:
+#
+# frame:  u32 length of the following payload
+# header: f64 created, u16 level, i32 pid, u32 line number, u16 tag count
+# then:   u16-prefixed UTF-8 strings for logger name, record name, function name and path,
+#         u32-prefixed UTF-8 strings for the message, the normalized traceback and the
+#         formatted traceback (both empty if the record has none), the JSON encoded extra
+#         fields (empty if none) and one u16-prefixed UTF-8 string per tag
+_FRAME = struct.Struct('!I')
+_HEADER = struct.Struct('!dHiIH')
+_SHORT = struct.Struct('!H')
+_LONG = struct.Struct('!I')
+
+
+def _pack_short(value: str) -> bytes:
+    data = value.encode('utf-8')[:0xffff]
+    return _SHORT.pack(len(data)) + data
+
+
+def _unpack_short(payload: bytes, offset: int) -> Tuple[str, int]:
+    length, = _SHORT.unpack_from(payload, offset)
+    offset += _SHORT.size
+    return payload[offset:offset + length].decode('utf-8', 'replace'), offset + length
+
+
+def _pack_long(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return _LONG.pack(len(data)) + data
+
+
+def _unpack_long(payload: bytes, offset: int) -> Tuple[str, int]:
+    length, = _LONG.unpack_from(payload, offset)
+    offset += _LONG.size
+    return payload[offset:offset + length].decode('utf-8', 'replace'), offset + length
+
+
+def encode_record(logger_name: str, record: LogRecord, extra_fields: Sequence[str]=()) -> bytes:
+    """
+    Serialize a log record into a collector frame
+
+    :param logger_name: Name of the logger in the DB
+    :param record: Log record to serialize
+    :param extra_fields: Names of ``extra`` attributes of the record to ship along
+    :return: Frame including the length prefix
+    """
+    tags = [str(t) for t in getattr(record, 'tags', set()) if t is not None and t != '']
+    normalized = normalize_traceback(record)
+
+    extra: Dict[str, Any] = {}
+    for key in extra_fields:
+        value = getattr(record, key, None)
+        if value is not None:
+            extra[key] = value
+
+    parts = [
+        _HEADER.pack(record.created, record.levelno, record.process or 0, record.lineno, len(tags)),
+        _pack_short(logger_name),
+        _pack_short(record.name),
+        _pack_short(record.funcName or ''),
+        _pack_short(record.pathname),
+        _pack_long(record.getMessage()),
+        _pack_long(normalized or ''),
+        _pack_long(format_traceback(record) if normalized is not None else ''),
+        _pack_long(json.dumps(extra, separators=(',', ':'), default=str) if extra else '')
+    ]
+    for tag in tags:
+        parts.append(_pack_short(tag))
+
+    payload = b''.join(parts)
+    return _FRAME.pack(len(payload)) + payload
+
+
+def decode_record(payload: bytes) -> Dict[str, Any]:
+    """
+    De-serialize a collector frame payload (without the length prefix)
+
+    :return: Dictionary with the record data
+    """
+    created, level, pid, lineno, tag_count = _HEADER.unpack_from(payload, 0)
+    offset = _HEADER.size
+    logger_name, offset = _unpack_short(payload, offset)
+    name, offset = _unpack_short(payload, offset)
+    func_name, offset = _unpack_short(payload, offset)
+    pathname, offset = _unpack_short(payload, offset)
+    message, offset = _unpack_long(payload, offset)
+    normalized, offset = _unpack_long(payload, offset)
+    formatted, offset = _unpack_long(payload, offset)
+    extra, offset = _unpack_long(payload, offset)
+
+    tags: List[str] = []
+    for _ in range(tag_count):
+        tag, offset = _unpack_short(payload, offset)
+        tags.append(tag)
+
+    extra_data: Optional[Dict[str, Any]] = None
+    if extra:
+        try:
+            extra_data = json.loads(extra)
+        except ValueError:
+            # the entry is still worth keeping without its extra fields
+            getLogger(__name__).warning('Dropping malformed extra fields of a record')
+
+    return {
+        'created': created,
+        'levelno': level,
+        'process': pid,
+        'lineno': lineno,
+        'logger_name': logger_name,
+        'name': name,
+        'funcName': func_name,
+        'pathname': pathname,
+        'message': message,
+        'normalized_traceback': normalized or None,
+        'traceback': formatted,
+        'extra': extra_data,
+        'tags': tags
+    }
+
+
+class CollectorHandler(Handler):
+    """
+    Lightweight log handler that ships records to a local collector daemon
+    (see ``bin/dblogger_collector``) instead of talking to the DB directly.
+    """
+
+    # connection
+    socket_path: str
+    sock: Optional[socket.socket] = None
+    pid: Optional[int] = None
+
+    # internal state
+    logger_name: str
+    extra_fields: List[str]
+    max_frame_size: int
+
+    def __init__(
+        self, name: str,
+        socket_path: str=DEFAULT_SOCKET_PATH,
+        level: int = NOTSET,
+        extra_fields: Optional[List[str]] = None,
+        max_frame_size: int = DEFAULT_MAX_FRAME_SIZE
+    ):
+        """
+        Initialize new collector client handler
+
+        :param name: Name of the logger in the DB
+        :param socket_path: Path of the Unix domain socket the collector listens on
+        :param level: Log level, defaults to ``NOTSET`` which inherits the level from the logger
+        :param extra_fields: Names of ``extra`` attributes of the log record to store in
+                             the ``extra`` JSON column of the entry (e.g. ``['request_id']``)
+        :param max_frame_size: Records that encode to more bytes are not sent, has to match the
+                               ``max_frame_size`` of the collector
+        """
+        self.socket_path = socket_path
+        self.logger_name = name
+        self.extra_fields = list(extra_fields) if extra_fields is not None else []
+        self.max_frame_size = max_frame_size
+        self.createLock()
+        super().__init__(level=level)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        self.sock = sock
+        self.pid = os.getpid()
+
+    def emit(self, record: LogRecord):
+        attach_scope_tags(record)
+        try:
+            frame = encode_record(self.logger_name, record, self.extra_fields)
+            if len(frame) - _FRAME.size > self.max_frame_size:
+                # the collector would drop the connection
+                raise ValueError(f'Record of {len(frame)} bytes exceeds the maximum frame size')
+        except Exception:
+            self.handleError(record)
+            return
+
+        try:
+            # reconnect after a fork, the socket would be shared with the parent otherwise
+            if self.sock is None or self.pid != os.getpid():
+                self.connect()
+            self.sock.sendall(frame)
+        except Exception:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+        finally:
+            self.release()
+        super().close()
+
+
+class Collector:
+    """
+    Collector daemon, receives records from many local processes, keeps one
+    shared dimension cache and writes the entries in large batches.
+    """
+
+    # db config and connection
+    db: Any = None
+    db_config: str
+    run_mode: str
+
+    # config
+    socket_path: str
+    socket_mode: int
+    batch_size: int
+    flush_interval: float
+    max_frame_size: int
+    max_pending: int
+
+    # state
+    pending: List[Dict[str, Any]]
+    flush_requested: asyncio.Event
+    reconnect_at: float = 0.0
+    reconnect_delay: float = MIN_RECONNECT_DELAY
+
+    # caches
+    src_cache: Dict[str, Any]
+    func_cache: Dict[str, Any]
+    logger_cache: Dict[str, Any]
+    host_cache: Dict[str, Any]
+    tag_cache: Dict[str, Any]
+    exception_cache: Dict[str, Any]
+
+    def __init__(
+        self,
+        db_config: str,
+        socket_path: str=DEFAULT_SOCKET_PATH,
+        batch_size: int=1000,
+        flush_interval: float=0.5,
+        run_mode: Optional[str]=None,
+        socket_mode: int=DEFAULT_SOCKET_MODE,
+        max_frame_size: int=DEFAULT_MAX_FRAME_SIZE,
+        max_pending: int=100000
+    ):
+        """
+        Initialize the collector
+
+        :param db_config: DB connection URI
+        :param socket_path: Path of the Unix domain socket to listen on
+        :param batch_size: Flush as soon as this many records are pending
+        :param flush_interval: Flush pending records at least every ``flush_interval`` seconds
+        :param run_mode: ``async`` (asyncpg), ``sync`` (psycopg2), ``psycopg`` (psycopg 3) or
+                         ``sqlite``, auto-detected if not set
+        :param socket_mode: Permissions of the socket, defaults to read and write access for
+                            the owner and the group of the collector process
+        :param max_frame_size: Connections that send a larger frame are closed
+        :param max_pending: Records kept while the DB is unreachable, the oldest records are
+                            dropped when more arrive
+        """
+        if run_mode is None:
+            run_mode = get_run_mode()
+
+        self.db_config = db_config
+        self.run_mode = run_mode
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_frame_size = max_frame_size
+        self.max_pending = max_pending
+        self.pending = []
+        self.src_cache = {}
+        self.func_cache = {}
+        self.logger_cache = {}
+        self.host_cache = {}
+        self.tag_cache = LRUCache(TAG_CACHE_SIZE)
+        self.exception_cache = {}
+
+    async def run(self):
+        self.flush_requested = asyncio.Event()
+        # if the DB is down records are accepted anyway, ``flush`` keeps reconnecting
+        await self.ensure_connected()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, self.socket_mode)
+
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.flush_requested.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.flush_requested.clear()
+                await self.flush()
+        finally:
+            server.close()
+            await self.flush()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def connect(self):
+        if self.run_mode == 'async':
+            from asyncpg import connect
+            self.db = await connect(dsn=self.db_config)
+        else:
+            loop = asyncio.get_event_loop()
+            self.db = await loop.run_in_executor(None, connect_sync, self.db_config, self.run_mode)
+
+    def is_connected(self) -> bool:
+        if self.db is None:
+            return False
+        if self.run_mode == 'async':
+            return not self.db.is_closed()
+        if self.run_mode == 'sqlite':
+            # the database file is always reachable
+            return True
+        return not self.db.closed
+
+    async def ensure_connected(self) -> bool:
+        """
+        Reconnect if the DB connection was lost, failed attempts are retried with an
+        exponential backoff
+
+        :return: ``True`` if the connection is usable
+        """
+        if self.is_connected():
+            return True
+        if time.monotonic() < self.reconnect_at:
+            return False
+
+        try:
+            await self.connect()
+        except Exception:
+            self.reconnect_at = time.monotonic() + self.reconnect_delay
+            getLogger(__name__).warning(
+                f'Could not connect to the DB, retrying in {self.reconnect_delay:.1f} seconds',
+                exc_info=True
+            )
+            self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+            return False
+
+        self.reconnect_at = 0.0
+        self.reconnect_delay = MIN_RECONNECT_DELAY
+        return True
+
+    def trim_pending(self):
+        excess = len(self.pending) - self.max_pending
+        if excess > 0:
+            del self.pending[:excess]
+            getLogger(__name__).warning(f'DB unreachable, dropped {excess} records')
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME.size)
+                length, = _FRAME.unpack(header)
+                if length > self.max_frame_size:
+                    # the stream can not be trusted anymore, do not read the payload
+                    getLogger(__name__).warning(f'Closing connection after a frame of {length} bytes')
+                    break
+                payload = await reader.readexactly(length)
+                try:
+                    self.pending.append(decode_record(payload))
+                except (struct.error, UnicodeDecodeError):
+                    getLogger(__name__).warning('Dropping malformed frame')
+                    continue
+                if len(self.pending) >= self.batch_size:
+                    self.flush_requested.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def flush(self):
+        if len(self.pending) == 0:
+            return
+        if not await self.ensure_connected():
+            # keep the records until the DB is back
+            self.trim_pending()
+            return
+        batch = self.pending
+        self.pending = []
+
+        try:
+            if self.run_mode == 'async':
+                await self.write_async(batch)
+            else:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.write_sync, batch)
+        except Exception:
+            # dimensions created in the failed transaction are gone, do not keep them cached
+            self.src_cache.clear()
+            self.func_cache.clear()
+            self.logger_cache.clear()
+            self.host_cache.clear()
+            self.tag_cache.clear()
+            self.exception_cache.clear()
+            if self.is_connected():
+                getLogger(__name__).exception(f'Could not write batch of {len(batch)} records')
+            else:
+                # retried after reconnecting
+                getLogger(__name__).warning('Lost the DB connection', exc_info=True)
+                self.pending = batch + self.pending
+                self.trim_pending()
+
+    async def write_async(self, batch: List[Dict[str, Any]]):
+        from .async_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException
+
+        host_key = socket.gethostname()
+        async with self.db.transaction():
+            entries: List[Dict[str, Any]] = []
+            entry_tags: List[List[Any]] = []
+            for item in batch:
+                src = self.src_cache.get(item['pathname'], None)
+                if src is None:
+                    src = await LogSource.get_or_create(self.db, path=item['pathname'])
+                    self.src_cache[item['pathname']] = src
+
+                func_key = f'{item["name"]}.{item["funcName"]}:{item["lineno"]}@{src.path}'
+                func = self.func_cache.get(func_key, None)
+                if func is None:
+                    func = await LogFunction.get_or_create(
+                        self.db,
+                        name=f'{item["name"]}.{item["funcName"]}',
+                        line_number=item['lineno'],
+                        source_id=src.pk,
+                    )
+                    self.func_cache[func_key] = func
+
+                logger = self.logger_cache.get(item['logger_name'], None)
+                if logger is None:
+                    logger = await LogLogger.get_or_create(self.db, name=item['logger_name'])
+                    self.logger_cache[item['logger_name']] = logger
+
+                host = self.host_cache.get(host_key, None)
+                if host is None:
+                    host = await LogHost.get_or_create(self.db, name=host_key)
+                    self.host_cache[host_key] = host
+
+                tags: List[Any] = []
+                for tag_name in item['tags']:
+                    tag = self.tag_cache.get(tag_name, None)
+                    if tag is None:
+                        tag = await LogTag.get_or_create(self.db, name=tag_name)
+                        self.tag_cache[tag_name] = tag
+                    tags.append(tag)
+
+                exception = None
+                normalized = item['normalized_traceback']
+                if normalized is not None:
+                    exception = self.exception_cache.get(normalized, None)
+                    if exception is None:
+                        exc_hash = traceback_hash(normalized)
+                        exception = await LogException.load(self.db, hash=exc_hash)
+                        if exception is None:
+                            exception = await LogException.create(self.db, hash=exc_hash, traceback=item['traceback'])
+                        self.exception_cache[normalized] = exception
+
+                entries.append(dict(
+                    level=item['levelno'],
+                    message=item['message'],
+                    pid=item['process'],
+                    time=datetime.fromtimestamp(item['created']),
+                    function_id=func.pk,
+                    logger_id=logger.pk,
+                    hostname_id=host.pk,
+                    exception_id=exception.pk if exception is not None else None,
+                    extra=item['extra']
+                ))
+                entry_tags.append(tags)
+
+            created = await LogEntry.create_many(self.db, entries)
+            await LogEntry.add_tags_many(self.db, list(zip(created, entry_tags)))
+
+    def write_sync(self, batch: List[Dict[str, Any]]):
+        if self.run_mode == 'psycopg':
+            from .psycopg_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException
+        elif self.run_mode == 'sqlite':
+            from .sqlite_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException
+        else:
+            from .sync_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException
+
+        host_key = socket.gethostname()
+        cursor = self.db.cursor()
+        try:
+            entries: List[Dict[str, Any]] = []
+            entry_tags: List[List[Any]] = []
+            for item in batch:
+                src = self.src_cache.get(item['pathname'], None)
+                if src is None:
+                    src = LogSource.get_or_create(cursor, path=item['pathname'])
+                    self.src_cache[item['pathname']] = src
+
+                func_key = f'{item["name"]}.{item["funcName"]}:{item["lineno"]}@{src.path}'
+                func = self.func_cache.get(func_key, None)
+                if func is None:
+                    func = LogFunction.get_or_create(
+                        cursor,
+                        name=f'{item["name"]}.{item["funcName"]}',
+                        line_number=item['lineno'],
+                        source_id=src.pk,
+                    )
+                    self.func_cache[func_key] = func
+
+                logger = self.logger_cache.get(item['logger_name'], None)
+                if logger is None:
+                    logger = LogLogger.get_or_create(cursor, name=item['logger_name'])
+                    self.logger_cache[item['logger_name']] = logger
+
+                host = self.host_cache.get(host_key, None)
+                if host is None:
+                    host = LogHost.get_or_create(cursor, name=host_key)
+                    self.host_cache[host_key] = host
+
+                tags: List[Any] = []
+                for tag_name in item['tags']:
+                    tag = self.tag_cache.get(tag_name, None)
+                    if tag is None:
+                        tag = LogTag.get_or_create(cursor, name=tag_name)
+                        self.tag_cache[tag_name] = tag
+                    tags.append(tag)
+
+                exception = None
+                normalized = item['normalized_traceback']
+                if normalized is not None:
+                    exception = self.exception_cache.get(normalized, None)
+                    if exception is None:
+                        exc_hash = traceback_hash(normalized)
+                        exception = LogException.load(cursor, hash=exc_hash)
+                        if exception is None:
+                            exception = LogException.create(cursor, hash=exc_hash, traceback=item['traceback'])
+                        self.exception_cache[normalized] = exception
+
+                entries.append(dict(
+                    level=item['levelno'],
+                    message=item['message'],
+                    pid=item['process'],
+                    time=datetime.fromtimestamp(item['created']),
+                    function_id=func.pk,
+                    logger_id=logger.pk,
+                    hostname_id=host.pk,
+                    exception_id=exception.pk if exception is not None else None,
+                    extra=item['extra']
+                ))
+                entry_tags.append(tags)
+
+            created = LogEntry.create_many(cursor, entries)
+            LogEntry.add_tags_many(cursor, list(zip(created, entry_tags)))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
@@ -0,0 +1,188 @@
+from typing import List, Any, Optional, Dict
+
+from .models.entry import COLUMNAR_FIELDS
+
+__all__ = ['LogColumns', 'Categorical', 'parse_binary_copy', 'arrays_from_rows', 'DIMENSIONS']
+
+# dictionary encoded name columns as (attribute, id column, table)
+DIMENSIONS = [
+    ('function', 'function_id', 'logger_function'),
+    ('logger', 'logger_id', 'logger_logger'),
+    ('hostname', 'hostname_id', 'logger_hosts'),
+]
+
+_COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+_BINARY_TYPES = {
+    'int4': '>i4',
+    'int8': '>i8',
+    'float8': '>f8',
+}
+_NATIVE_TYPES = {
+    'int4': 'int32',
+    'int8': 'int64',
+    'float8': 'float64',
+}
+
+
+def require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError('Please install `numpy` to load entries as columns')
+    return numpy
+
+
+def parse_binary_copy(data: bytes) -> Dict[str, Any]:
+    """
+    Parse the binary ``COPY`` output of the ``COLUMNAR_FIELDS`` query into one NumPy array
+    per column. All fields are fixed size and not ``NULL``, so the rows are read as a
+    structured array without touching the single rows.
+    """
+    np = require_numpy()
+
+    if data[:len(_COPY_SIGNATURE)] != _COPY_SIGNATURE:
+        raise ValueError('Not in binary COPY format')
+    header_size = len(_COPY_SIGNATURE) + 4
+    extension_size = int.from_bytes(data[header_size:header_size + 4], 'big')
+    start = header_size + 4 + extension_size
+
+    fields = [('field_count', '>i2')]
+    for name, _, pg_type in COLUMNAR_FIELDS:
+        fields.append((f'{name}_length', '>i4'))
+        fields.append((name, _BINARY_TYPES[pg_type]))
+    dtype = np.dtype(fields)
+
+    # the data ends with a field count of -1
+    body = data[start:len(data) - 2]
+    rows = np.frombuffer(body, dtype=dtype, count=len(body) // dtype.itemsize)
+
+    return {
+        name: rows[name].astype(_NATIVE_TYPES[pg_type])
+        for name, _, pg_type in COLUMNAR_FIELDS
+    }
+
+
+def arrays_from_rows(rows: List[Any]) -> Dict[str, Any]:
+    """
+    Convert the rows of the ``COLUMNAR_FIELDS`` query, as tuples, into the arrays
+    ``parse_binary_copy`` returns, for drivers without binary ``COPY``
+    """
+    np = require_numpy()
+
+    columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(COLUMNAR_FIELDS)
+    return {
+        name: np.array(column, dtype=_NATIVE_TYPES[pg_type])
+        for (name, _, pg_type), column in zip(COLUMNAR_FIELDS, columns)
+    }
+
+
+class Categorical:
+    """
+    Dictionary encoded column, the value of row ``i`` is ``categories[codes[i]]``
+    """
+
+    codes: Any
+    categories: List[Optional[str]]
+
+    def __init__(self, ids: Any, names: Dict[int, str]):
+        """
+        Encode a column of dimension ids
+
+        :param ids: NumPy array of dimension ids
+        :param names: Dimension names by id, ids without a name are ``None``
+        """
+        np = require_numpy()
+        unique, inverse = np.unique(ids, return_inverse=True)
+        self.codes = inverse.astype('int32')
+        self.categories = [names.get(pk, None) for pk in unique.tolist()]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def decode(self) -> Any:
+        """
+        Values as a NumPy object array
+        """
+        np = require_numpy()
+        return np.array(self.categories, dtype=object)[self.codes]
+
+    def counts(self, weights: Optional[Any]=None) -> Dict[Optional[str], int]:
+        """
+        Number of rows per value, or the sum of ``weights`` (an integer array with one
+        value per row) per value
+        """
+        np = require_numpy()
+        counts = np.bincount(self.codes, weights=weights, minlength=len(self.categories))
+
+        # different ids may share a name (e.g. functions on different lines)
+        result: Dict[Optional[str], int] = {}
+        for name, count in zip(self.categories, counts.astype('int64').tolist()):
+            result[name] = result.get(name, 0) + count
+        return result
+
+
+class LogColumns:
+    """
+    Entries of a query as column arrays, returned by ``LogEntry.load_columns``.
+
+    ``id``, ``time`` (seconds since the epoch), ``level``, ``pid``, ``function_id``,
+    ``logger_id``, ``hostname_id``, ``exception_id``, ``template_id`` and ``repeat_count``
+    are NumPy arrays (missing ids are ``0``), ``function``, ``logger`` and ``hostname``
+    are dictionary encoded names.
+    """
+
+    id: Any
+    time: Any
+    level: Any
+    pid: Any
+    function_id: Any
+    logger_id: Any
+    hostname_id: Any
+    exception_id: Any
+    template_id: Any
+    repeat_count: Any
+
+    function: Categorical
+    logger: Categorical
+    hostname: Categorical
+
+    def __init__(self, arrays: Dict[str, Any], names: Dict[str, Dict[int, str]]):
+        """
+        :param arrays: Result of ``parse_binary_copy``
+        :param names: Dimension names by id for every attribute in ``DIMENSIONS``
+        """
+        for name, _, _ in COLUMNAR_FIELDS:
+            setattr(self, name, arrays[name])
+        for name, column, _ in DIMENSIONS:
+            setattr(self, name, Categorical(arrays[column], names.get(name, {})))
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def datetime64(self) -> Any:
+        """
+        ``time`` as ``datetime64[us]`` array (UTC)
+        """
+        return (self.time * 1000000).astype('datetime64[us]')
+
+    def count_by(self, column: str) -> Dict[Any, int]:
+        """
+        Number of records per value of a column, e.g. ``count_by('level')`` or
+        ``count_by('hostname')``, coalesced entries count as often as they were repeated
+        """
+        values = getattr(self, column)
+        if isinstance(values, Categorical):
+            return values.counts(self.repeat_count)
+
+        np = require_numpy()
+        unique, inverse = np.unique(values, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=self.repeat_count, minlength=len(unique))
+        return dict(zip(unique.tolist(), counts.astype('int64').tolist()))
+
+
+def unique_ids(arrays: Dict[str, Any], column: str) -> List[int]:
+    """
+    Distinct non-zero ids of a dimension column, to load the names for ``LogColumns``
+    """
+    np = require_numpy()
+    return [pk for pk in np.unique(arrays[column]).tolist() if pk != 0]
@@ -0,0 +1,64 @@
+from typing import Optional
+
+__all__ = ['Durability']
+
+
+class Durability:
+    """
+    Trades a bounded window of loss for write throughput for records below ``level``
+    (all records if ``level`` is not set):
+
+    - ``synchronous_commit=False`` commits them without waiting for the WAL flush, a crash of
+      the DB server may lose the last few hundred milliseconds of them
+    - ``group_commit`` folds all of them that arrive within the window into one transaction,
+      a crash of the process loses the open window
+    - ``staging`` writes them to an unlogged table that is merged into ``logger_log`` every
+      ``merge_interval`` seconds, a crash of the DB server loses everything not merged yet
+
+    Records at or above ``level`` are written to ``logger_log`` and committed right away with
+    a synchronous commit, together with everything that is pending at that time.
+    """
+
+    # config
+    level: Optional[int]
+    synchronous_commit: bool
+    group_commit: float
+    staging: bool
+    merge_interval: float
+
+    # counters
+    lost: int
+    merged: int
+
+    def __init__(
+        self,
+        level: Optional[int]=None,
+        synchronous_commit: bool=True,
+        group_commit: float=0.0,
+        staging: bool=False,
+        merge_interval: float=5.0
+    ):
+        """
+        Initialize durability settings
+
+        :param level: Records below this level are relaxed, ``None`` relaxes all records
+        :param synchronous_commit: ``False`` to commit relaxed records with
+                                   ``synchronous_commit = off``
+        :param group_commit: Seconds relaxed records are collected into one transaction,
+                             ``0`` commits every record
+        :param staging: Write relaxed records to the unlogged ``logger_log_staging`` table
+        :param merge_interval: Seconds between merges of the staging table
+        """
+        self.level = level
+        self.synchronous_commit = synchronous_commit
+        self.group_commit = group_commit
+        self.staging = staging
+        self.merge_interval = merge_interval
+        self.lost = 0
+        self.merged = 0
+
+    def relaxed(self, levelno: int) -> bool:
+        """
+        Check if a record of this level may be written with relaxed durability
+        """
+        return self.level is None or levelno < self.level
@@ -0,0 +1,284 @@
+from typing import List, Any, Optional, Dict, Tuple, Callable, IO
+import asyncio
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+from datetime import datetime
+from logging import getLevelName
+
+from . import get_run_mode, connect_sync
+
+__all__ = ['export', 'split_range', 'entry_to_row', 'FORMATS', 'COMPRESSIONS', 'COLUMNS']
+
+FORMATS = ('ndjson', 'csv', 'parquet')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+COLUMNS = [
+    'id', 'time', 'level', 'level_name', 'logger', 'hostname', 'function', 'line_number',
+    'source', 'pid', 'message', 'tags', 'extra', 'repeat_count', 'traceback'
+]
+
+
+def entry_to_row(entry: Any) -> Dict[str, Any]:
+    """
+    Flatten a joined ``LogEntry`` (as returned by the ``load_all_*`` and ``iterate_*``
+    class methods) into a dictionary with the columns in ``COLUMNS``
+    """
+    function = getattr(entry, '_function', None)
+    source = getattr(function, '_source', None) if function is not None else None
+    logger = getattr(entry, '_logger', None)
+    hostname = getattr(entry, '_hostname', None)
+    exception = getattr(entry, '_exception', None)
+    tags = getattr(entry, '_tags', None) or []
+
+    return {
+        'id': entry.pk,
+        'time': entry.time.isoformat(),
+        'level': entry.level,
+        'level_name': getLevelName(entry.level),
+        'logger': logger.name if logger is not None else None,
+        'hostname': hostname.name if hostname is not None else None,
+        'function': function.name if function is not None else None,
+        'line_number': function.line_number if function is not None else None,
+        'source': source.path if source is not None else None,
+        'pid': entry.pid,
+        'message': entry.message,
+        'tags': [tag.name for tag in tags],
+        'extra': entry.extra,
+        'repeat_count': entry.repeat_count,
+        'traceback': exception.traceback if exception is not None else None,
+    }
+
+
+def split_range(from_date: datetime, to_date: datetime, parts: int) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a time range into ``parts`` consecutive sub-ranges of equal length
+    """
+    step = (to_date - from_date) / parts
+    ranges = []
+    for idx in range(parts):
+        start = from_date + step * idx
+        end = to_date if idx == parts - 1 else from_date + step * (idx + 1)
+        ranges.append((start, end))
+    return ranges
+
+
+def open_output(path: str, compression: str) -> IO[bytes]:
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError('Please install `zstandard` to use zstd compression')
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+class RowWriter:
+    """
+    Writes rows to one output part in the selected format
+    """
+
+    def __init__(self, path: str, fmt: str, compression: str, header: bool, batch_size: int):
+        self.fmt = fmt
+        self.rows = 0
+        self.batch: List[Dict[str, Any]] = []
+        self.batch_size = batch_size
+
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError('Please install `pyarrow` to export to parquet')
+            self.pyarrow = pyarrow
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(
+                path,
+                self.parquet_schema(),
+                compression='snappy' if compression == 'none' else compression
+            )
+            return
+
+        self.fp = open_output(path, compression)
+        if fmt == 'csv':
+            self.text = io.TextIOWrapper(self.fp, encoding='utf-8', newline='')
+            self.csv = csv.DictWriter(self.text, fieldnames=COLUMNS)
+            if header:
+                self.csv.writeheader()
+
+    def parquet_schema(self):
+        pa = self.pyarrow
+        return pa.schema([
+            ('id', pa.int64()), ('time', pa.string()), ('level', pa.int32()), ('level_name', pa.string()),
+            ('logger', pa.string()), ('hostname', pa.string()), ('function', pa.string()),
+            ('line_number', pa.int32()), ('source', pa.string()), ('pid', pa.int32()),
+            ('message', pa.string()), ('tags', pa.list_(pa.string())), ('extra', pa.string()),
+            ('repeat_count', pa.int32()), ('traceback', pa.string())
+        ])
+
+    def write(self, row: Dict[str, Any]):
+        self.rows += 1
+        if self.fmt == 'ndjson':
+            self.fp.write(json.dumps(row, separators=(',', ':'), default=str).encode('utf-8') + b'\n')
+        elif self.fmt == 'csv':
+            row = dict(row)
+            row['tags'] = ','.join(row['tags'])
+            row['extra'] = json.dumps(row['extra'], default=str) if row['extra'] is not None else None
+            self.csv.writerow(row)
+        else:
+            row = dict(row)
+            row['extra'] = json.dumps(row['extra'], default=str) if row['extra'] is not None else None
+            self.batch.append(row)
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+        table = self.pyarrow.Table.from_pylist(self.batch, schema=self.parquet_writer.schema)
+        self.parquet_writer.write_table(table)
+        self.batch = []
+
+    def close(self):
+        if self.fmt == 'parquet':
+            self.flush()
+            self.parquet_writer.close()
+        elif self.fmt == 'csv':
+            self.text.close()
+        else:
+            self.fp.close()
+
+
+async def export_part_async(db_url: str, from_date: datetime, to_date: datetime, writer: RowWriter, batch_size: int):
+    from asyncpg import connect
+    from .async_models import LogEntry
+
+    db = await connect(dsn=db_url)
+    try:
+        async with db.transaction():
+            async for entry in LogEntry.iterate_with_date(db, from_date, to_date, batch_size=batch_size):
+                writer.write(entry_to_row(entry))
+    finally:
+        await db.close()
+
+
+def export_part_sync(
+    db_url: str,
+    run_mode: str,
+    from_date: datetime,
+    to_date: datetime,
+    writer: RowWriter,
+    batch_size: int
+):
+    if run_mode == 'sqlite':
+        from .sqlite_models import LogEntry
+    else:
+        from .sync_models import LogEntry
+
+    conn = connect_sync(db_url, run_mode)
+    try:
+        if run_mode == 'sqlite':
+            # SQLite cursors step through the result without loading it at once
+            cursor = conn.cursor()
+        else:
+            # server side cursor, inherits the row factory of the connection
+            cursor = conn.cursor(name='dblogger_export')
+            cursor.itersize = batch_size
+        for entry in LogEntry.iterate_with_date(cursor, from_date, to_date, batch_size=batch_size):
+            writer.write(entry_to_row(entry))
+    finally:
+        conn.close()
+
+
+def export_part(task: Tuple[str, str, datetime, datetime, str, str, str, bool, int]) -> int:
+    """
+    Worker process entry point, exports one sub-range into one part file
+
+    :return: Number of rows written
+    """
+    db_url, run_mode, from_date, to_date, path, fmt, compression, header, batch_size = task
+    writer = RowWriter(path, fmt, compression, header, batch_size)
+    try:
+        if run_mode == 'async':
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(export_part_async(db_url, from_date, to_date, writer, batch_size))
+            finally:
+                loop.close()
+        else:
+            export_part_sync(db_url, run_mode, from_date, to_date, writer, batch_size)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def export(
+    db_url: str,
+    from_date: datetime,
+    to_date: datetime,
+    output: str,
+    fmt: str='ndjson',
+    compression: str='none',
+    workers: int=4,
+    parts: Optional[int]=None,
+    batch_size: int=5000,
+    progress: Optional[Callable[[int, int, int, float], None]]=None
+) -> int:
+    """
+    Export all entries in a time range, the range is split into ``parts`` sub-ranges
+    that are read in parallel by ``workers`` processes over their own connections.
+
+    NDJSON and CSV parts are concatenated into ``output`` in order (concatenated gzip and
+    zstd streams are valid), parquet parts are written as a dataset into the ``output``
+    directory.
+
+    :param progress: Called with finished parts, total parts, rows so far and elapsed seconds
+    :return: Number of exported rows
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'`fmt` has to be one of {", ".join(FORMATS)}')
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'`compression` has to be one of {", ".join(COMPRESSIONS)}')
+    if parts is None:
+        parts = workers * 4
+
+    run_mode = get_run_mode()
+    if fmt == 'parquet':
+        os.makedirs(output, exist_ok=True)
+        paths = [os.path.join(output, f'part-{idx:05d}.parquet') for idx in range(parts)]
+    else:
+        paths = [f'{output}.part-{idx:05d}' for idx in range(parts)]
+
+    tasks = [
+        (db_url, run_mode, start, end, paths[idx], fmt, compression, idx == 0, batch_size)
+        for idx, (start, end) in enumerate(split_range(from_date, to_date, parts))
+    ]
+
+    started = time.monotonic()
+    total = 0
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for done, rows in enumerate(pool.imap_unordered(export_part, tasks)):
+                total += rows
+                if progress is not None:
+                    progress(done + 1, parts, total, time.monotonic() - started)
+
+        if fmt != 'parquet':
+            with open(output, 'wb') as fp:
+                for path in paths:
+                    with open(path, 'rb') as part:
+                        shutil.copyfileobj(part, fp)
+    finally:
+        if fmt != 'parquet':
+            # parts are only intermediate files, do not leave them behind on errors
+            for path in paths:
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    return total
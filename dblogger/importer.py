@@ -0,0 +1,612 @@
+from typing import List, Any, Optional, Dict, Tuple, Callable, Iterator
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import socket
+import time
+
+from datetime import datetime, timezone
+from logging import getLevelName, BASIC_FORMAT
+
+from . import get_run_mode, connect_sync
+from .tracebacks import normalize_traceback_text, traceback_hash
+
+__all__ = ['Importer', 'parse_chunk', 'compile_format', 'FORMATS']
+
+FORMATS = ('text', 'ndjson')
+
+# patterns for the ``LogRecord`` attributes that may show up in a ``logging`` format string
+_FIELD_PATTERNS = {
+    'asctime': r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[,.]\d+)?',
+    'created': r'\d+(?:\.\d+)?',
+    'msecs': r'\d+(?:\.\d+)?',
+    'relativeCreated': r'\d+(?:\.\d+)?',
+    'levelname': r'\w+',
+    'levelno': r'\d+',
+    'name': r'\S+',
+    'module': r'\S+',
+    'filename': r'\S+',
+    'pathname': r'\S+',
+    'funcName': r'\S+',
+    'lineno': r'\d+',
+    'process': r'\d+',
+    'processName': r'\S+',
+    'thread': r'\d+',
+    'threadName': r'\S+',
+    'message': r'.*',
+}
+_FORMAT_FIELD = re.compile(r'%\((?P<name>\w+)\)(?P<flags>[-#0 +]*)(?P<width>\d*)(?:\.\d+)?[sdfrxXeEgGiu]')
+_TRACEBACK_START = ('Traceback (most recent call last):', 'Stack (most recent call last):')
+
+# compiled format strings, shared by all chunks a worker process parses
+_format_cache: Dict[Tuple[str, Optional[str]], Any] = {}
+
+
+def compile_format(log_format: str) -> Any:
+    """
+    Convert a ``logging`` format string (e.g. ``%(asctime)s %(levelname)-8s %(message)s``)
+    into a regular expression with one named group per field
+    """
+    pattern = '^'
+    seen = set()
+    pos = 0
+    for match in _FORMAT_FIELD.finditer(log_format):
+        pattern += re.escape(log_format[pos:match.start()])
+        pos = match.end()
+
+        name = match.group('name')
+        field = _FIELD_PATTERNS.get(name, r'.*?')
+        if name in seen:
+            field = f'(?:{field})'
+        else:
+            field = f'(?P<{name}>{field})'
+            seen.add(name)
+
+        # padded fields, ``%(levelname)-8s`` is followed and ``%(levelname)8s`` preceded by blanks
+        if match.group('width') != '':
+            field = field + ' *' if '-' in match.group('flags') else ' *' + field
+        pattern += field
+    pattern += re.escape(log_format[pos:]) + '$'
+    return re.compile(pattern)
+
+
+def parse_time(value: str, datefmt: Optional[str]=None) -> float:
+    """
+    Parse an ``asctime`` value, the log file is assumed to be written in local time
+    """
+    if datefmt is not None:
+        return datetime.strptime(value, datefmt).timestamp()
+    value = value.replace('T', ' ').replace(',', '.')
+    if '.' in value:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f').timestamp()
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+def parse_level(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    level = getLevelName(str(value).upper())
+    return level if isinstance(level, int) else 0
+
+
+def append_continuation(item: Dict[str, Any], line: str):
+    """
+    Attach a line that does not start a new record to the previous record, lines
+    starting a traceback and all lines after it go into the traceback
+    """
+    if item['traceback'] is not None:
+        item['traceback'] += '\n' + line
+    elif line.startswith(_TRACEBACK_START):
+        item['traceback'] = line
+    else:
+        item['message'] += '\n' + line
+
+
+def finish_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    if item['traceback'] is not None:
+        item['normalized_traceback'] = normalize_traceback_text(item['traceback'])
+    return item
+
+
+def parse_text_line(match: Any, datefmt: Optional[str], hostname: str) -> Dict[str, Any]:
+    fields = match.groupdict()
+
+    if 'created' in fields:
+        created = float(fields['created'])
+    elif 'asctime' in fields:
+        created = parse_time(fields['asctime'], datefmt)
+        if 'msecs' in fields and datefmt is not None:
+            created += float(fields['msecs']) / 1000
+    else:
+        created = time.time()
+
+    if 'levelno' in fields:
+        level = int(fields['levelno'])
+    else:
+        level = parse_level(fields.get('levelname', 'NOTSET'))
+
+    logger_name = fields.get('name', None) or 'root'
+    pathname = fields.get('pathname', None) or fields.get('filename', None) or fields.get('module', None) or '<unknown>'
+    return {
+        'created': created,
+        'levelno': level,
+        'logger_name': logger_name,
+        'function': f'{logger_name}.{fields.get("funcName", None) or "<unknown>"}',
+        'lineno': int(fields.get('lineno', None) or 0),
+        'pathname': pathname,
+        'process': int(fields['process']) if fields.get('process', None) else None,
+        'hostname': hostname,
+        'message': fields.get('message', None) or '',
+        'tags': [],
+        'extra': None,
+        'repeat_count': 1,
+        'traceback': None,
+        'normalized_traceback': None,
+    }
+
+
+def parse_json_line(line: str, hostname: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one NDJSON line, understands the output of ``dblogger_export`` as well as
+    objects using the ``LogRecord`` attribute names
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    if isinstance(data.get('created', None), (int, float)):
+        created = float(data['created'])
+    elif isinstance(data.get('time', None), str):
+        # exported times are UTC
+        parsed = datetime.fromisoformat(data['time'])
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        created = parsed.timestamp()
+    elif isinstance(data.get('asctime', None), str):
+        created = parse_time(data['asctime'])
+    else:
+        created = time.time()
+
+    level = data.get('levelno', None)
+    if level is None:
+        level = data.get('level', None)
+    if level is None:
+        level = data.get('levelname', None) or data.get('level_name', None) or 'NOTSET'
+
+    logger_name = data.get('logger', None) or data.get('name', None) or 'root'
+    function = data.get('function', None)
+    if function is None:
+        function = f'{logger_name}.{data.get("funcName", None) or "<unknown>"}'
+
+    message = data.get('message', None)
+    if message is None:
+        message = data.get('msg', '')
+
+    traceback = data.get('traceback', None) or data.get('exc_info', None) or None
+    extra = data.get('extra', None)
+    tags = data.get('tags', None) or []
+    if isinstance(tags, str):
+        tags = [tag for tag in tags.split(',') if tag != '']
+    pid = data.get('pid', data.get('process', None))
+
+    return finish_item({
+        'created': created,
+        'levelno': parse_level(level),
+        'logger_name': logger_name,
+        'function': function,
+        'lineno': int(data.get('line_number', None) or data.get('lineno', None) or 0),
+        'pathname': data.get('source', None) or data.get('pathname', None) or '<unknown>',
+        'process': int(pid) if pid is not None else None,
+        'hostname': data.get('hostname', None) or hostname,
+        'message': str(message),
+        'tags': [str(tag) for tag in tags],
+        'extra': extra if isinstance(extra, dict) else None,
+        'repeat_count': int(data.get('repeat_count', None) or 1),
+        'traceback': str(traceback) if traceback is not None else None,
+        'normalized_traceback': None,
+    })
+
+
+def parse_chunk(
+    task: Tuple[str, int, int, str, str, Optional[str], str]
+) -> Tuple[int, int, List[str], List[Tuple[int, Dict[str, Any]]], int]:
+    """
+    Worker process entry point, parses the lines between two offsets of a file
+
+    :return: Tuple of start and end offset, continuation lines before the first record
+             (they belong to the last record of the previous chunk), the records with the
+             offset of their first line and the number of lines that could not be parsed
+    """
+    path, start, end, fmt, log_format, datefmt, hostname = task
+
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+
+    leading: List[str] = []
+    records: List[Tuple[int, Dict[str, Any]]] = []
+    skipped = 0
+
+    if fmt == 'text':
+        regex = _format_cache.get((log_format, datefmt), None)
+        if regex is None:
+            regex = compile_format(log_format)
+            _format_cache[(log_format, datefmt)] = regex
+
+    offset = start
+    for raw in data.splitlines(keepends=True):
+        line_offset = offset
+        offset += len(raw)
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+
+        if fmt == 'ndjson':
+            if line.strip() == '':
+                continue
+            item = parse_json_line(line, hostname)
+            if item is None:
+                skipped += 1
+            else:
+                records.append((line_offset, item))
+            continue
+
+        match = regex.match(line)
+        if match is not None:
+            if len(records) > 0:
+                finish_item(records[-1][1])
+            records.append((line_offset, parse_text_line(match, datefmt, hostname)))
+        elif len(records) > 0:
+            append_continuation(records[-1][1], line)
+        else:
+            leading.append(line)
+
+    # the last record may still get continuation lines from the next chunk
+    return start, end, leading, records, skipped
+
+
+def split_file(path: str, start: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split a file into chunks of roughly ``chunk_size`` bytes that end at line boundaries
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fp:
+        while start < size:
+            fp.seek(min(size, start + chunk_size))
+            fp.readline()
+            end = min(size, fp.tell())
+            yield start, end
+            start = end
+
+
+class Importer:
+    """
+    Bulk import of log files.
+
+    Parse worker processes turn chunks of the files into records, while the main
+    process resolves the dimensions of a batch of records with a few batched lookups
+    and loads the entries with ``COPY``. Every batch is committed together with the
+    file offset it reached, so an interrupted import resumes where it stopped.
+    """
+
+    # db config and connection
+    db: Any = None
+    db_config: str
+    run_mode: str
+    loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # config
+    fmt: str
+    log_format: str
+    datefmt: Optional[str]
+    hostname: str
+    workers: int
+    batch_size: int
+    chunk_size: int
+
+    # caches
+    src_cache: Dict[str, Any]
+    func_cache: Dict[Tuple[str, int, str], Any]
+    logger_cache: Dict[str, Any]
+    host_cache: Dict[str, Any]
+    tag_cache: Dict[str, Any]
+    exception_cache: Dict[str, Any]
+
+    # counters
+    entries: int
+    skipped: int
+
+    def __init__(
+        self,
+        db_config: str,
+        fmt: str='text',
+        log_format: str=BASIC_FORMAT,
+        datefmt: Optional[str]=None,
+        hostname: Optional[str]=None,
+        workers: int=4,
+        batch_size: int=50000,
+        chunk_size: int=4 * 1024 * 1024,
+        run_mode: Optional[str]=None
+    ):
+        """
+        Initialize the importer
+
+        :param db_config: DB connection URI
+        :param fmt: ``text`` for files written by a ``logging.Formatter``, ``ndjson`` for
+                    one JSON object per line
+        :param log_format: Format string of the formatter that wrote the text files
+        :param datefmt: ``datefmt`` of the formatter if it was set
+        :param hostname: Hostname for records that do not carry one, defaults to this host
+        :param workers: Number of parse worker processes
+        :param batch_size: Number of records that are resolved and loaded in one transaction
+        :param chunk_size: Size in bytes of the file chunks handed to the parse workers
+        :param run_mode: ``async`` (asyncpg), ``sync`` (psycopg2), ``psycopg`` (psycopg 3) or
+                         ``sqlite``, auto-detected if not set
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'`fmt` has to be one of {", ".join(FORMATS)}')
+        if run_mode is None:
+            run_mode = get_run_mode()
+
+        self.db_config = db_config
+        self.run_mode = run_mode
+        self.fmt = fmt
+        self.log_format = log_format
+        self.datefmt = datefmt
+        self.hostname = hostname if hostname is not None else socket.gethostname()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.src_cache = {}
+        self.func_cache = {}
+        self.logger_cache = {}
+        self.host_cache = {}
+        self.tag_cache = {}
+        self.exception_cache = {}
+        self.entries = 0
+        self.skipped = 0
+
+    def run_async(self, coroutine: Any) -> Any:
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def connect(self):
+        if self.run_mode == 'async':
+            from asyncpg import connect
+            self.db = self.run_async(connect(dsn=self.db_config))
+        else:
+            self.db = connect_sync(self.db_config, self.run_mode)
+
+    def close(self):
+        if self.db is None:
+            return
+        if self.run_mode == 'async':
+            self.run_async(self.db.close())
+            self.loop.close()
+            self.loop = None
+        else:
+            self.db.close()
+        self.db = None
+
+    def import_files(
+        self,
+        paths: List[str],
+        restart: bool=False,
+        progress: Optional[Callable[[str, int, int, int, float], None]]=None
+    ) -> int:
+        """
+        Import files one after another
+
+        :param restart: Ignore the recorded progress and import the files from the start
+        :param progress: Called after every batch with the path, bytes done, file size,
+                         entries imported so far and elapsed seconds
+        :return: Number of imported entries
+        """
+        self.connect()
+        try:
+            for path in paths:
+                self.import_file(path, restart=restart, progress=progress)
+        finally:
+            self.close()
+        return self.entries
+
+    def import_file(
+        self,
+        path: str,
+        restart: bool=False,
+        progress: Optional[Callable[[str, int, int, int, float], None]]=None
+    ):
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        start = 0 if restart else self.load_offset(path)
+        if start > size:
+            # the file has been truncated or replaced since the last run
+            start = 0
+
+        tasks = (
+            (path, chunk_start, chunk_end, self.fmt, self.log_format, self.datefmt, self.hostname)
+            for chunk_start, chunk_end in split_file(path, start, self.chunk_size)
+        )
+
+        started = time.monotonic()
+        batch: List[Dict[str, Any]] = []
+        carry: Optional[Tuple[int, Dict[str, Any]]] = None
+        with multiprocessing.Pool(self.workers) as pool:
+            for chunk_start, chunk_end, leading, records, skipped in pool.imap(parse_chunk, tasks):
+                self.skipped += skipped
+                for line in leading:
+                    if carry is not None:
+                        append_continuation(carry[1], line)
+                    else:
+                        self.skipped += 1
+
+                if len(records) > 0:
+                    if carry is not None:
+                        batch.append(finish_item(carry[1]))
+                    batch.extend(item for _, item in records[:-1])
+                    carry = records[-1]
+
+                if len(batch) >= self.batch_size:
+                    # resume at the record that may still get continuation lines
+                    self.load(path, batch, carry[0] if carry is not None else chunk_end)
+                    batch = []
+                    if progress is not None:
+                        progress(path, chunk_end, size, self.entries, time.monotonic() - started)
+
+        if carry is not None:
+            batch.append(finish_item(carry[1]))
+        self.load(path, batch, size)
+        if progress is not None:
+            progress(path, size, size, self.entries, time.monotonic() - started)
+
+    def load_offset(self, path: str) -> int:
+        if self.run_mode == 'async':
+            from .async_models import LogImport
+            state = self.run_async(LogImport.load(self.db, path=path))
+        else:
+            if self.run_mode == 'sqlite':
+                from .sqlite_models import LogImport
+            else:
+                from .sync_models import LogImport
+            cursor = self.db.cursor()
+            state = LogImport.load(cursor, path=path)
+            self.db.commit()
+        return state.offset if state is not None else 0
+
+    def load(self, path: str, batch: List[Dict[str, Any]], offset: int):
+        try:
+            if self.run_mode == 'async':
+                self.run_async(self.load_async(path, batch, offset))
+            else:
+                self.load_sync(path, batch, offset)
+        except Exception:
+            # dimensions created in the failed transaction are gone, do not keep them cached
+            self.src_cache.clear()
+            self.func_cache.clear()
+            self.logger_cache.clear()
+            self.host_cache.clear()
+            self.tag_cache.clear()
+            self.exception_cache.clear()
+            raise
+        self.entries += len(batch)
+
+    async def load_async(self, path: str, batch: List[Dict[str, Any]], offset: int):
+        from .async_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, LogException, \
+            LogImport
+
+        async with self.db.transaction():
+            for cache, model, key, values in (
+                (self.src_cache, LogSource, 'path', [item['pathname'] for item in batch]),
+                (self.logger_cache, LogLogger, 'name', [item['logger_name'] for item in batch]),
+                (self.host_cache, LogHost, 'name', [item['hostname'] for item in batch]),
+                (self.tag_cache, LogTag, 'name', [tag for item in batch for tag in item['tags']]),
+            ):
+                names = [name for name in dict.fromkeys(values) if name not in cache]
+                cache.update(zip(names, await model.get_or_create_many(self.db, [{key: name} for name in names])))
+
+            functions = self.missing_functions(batch)
+            resolved = await LogFunction.get_or_create_many(self.db, [
+                dict(name=name, line_number=lineno, source_id=self.src_cache[pathname].pk)
+                for name, lineno, pathname in functions
+            ])
+            self.func_cache.update(zip(functions, resolved))
+
+            normalized, defaults = self.missing_exceptions(batch)
+            resolved = await LogException.get_or_create_many(
+                self.db,
+                [dict(hash=traceback_hash(item)) for item in normalized],
+                defaults=defaults
+            )
+            self.exception_cache.update(zip(normalized, resolved))
+
+            await LogEntry.copy_many(self.db, self.make_entries(batch), [
+                [self.tag_cache[tag].pk for tag in dict.fromkeys(item['tags'])] for item in batch
+            ])
+            await LogImport.save_progress(self.db, path, offset, len(batch))
+
+    def load_sync(self, path: str, batch: List[Dict[str, Any]], offset: int):
+        if self.run_mode == 'psycopg':
+            # same models as psycopg2 but the entries are loaded with binary COPY
+            from .psycopg_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, \
+                LogException, LogImport
+        elif self.run_mode == 'sqlite':
+            # one prepared INSERT per entry, SQLite has no COPY
+            from .sqlite_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, \
+                LogException, LogImport
+        else:
+            from .sync_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry, \
+                LogException, LogImport
+
+        cursor = self.db.cursor()
+        try:
+            for cache, model, key, values in (
+                (self.src_cache, LogSource, 'path', [item['pathname'] for item in batch]),
+                (self.logger_cache, LogLogger, 'name', [item['logger_name'] for item in batch]),
+                (self.host_cache, LogHost, 'name', [item['hostname'] for item in batch]),
+                (self.tag_cache, LogTag, 'name', [tag for item in batch for tag in item['tags']]),
+            ):
+                names = [name for name in dict.fromkeys(values) if name not in cache]
+                cache.update(zip(names, model.get_or_create_many(cursor, [{key: name} for name in names])))
+
+            functions = self.missing_functions(batch)
+            resolved = LogFunction.get_or_create_many(cursor, [
+                dict(name=name, line_number=lineno, source_id=self.src_cache[pathname].pk)
+                for name, lineno, pathname in functions
+            ])
+            self.func_cache.update(zip(functions, resolved))
+
+            normalized, defaults = self.missing_exceptions(batch)
+            resolved = LogException.get_or_create_many(
+                cursor,
+                [dict(hash=traceback_hash(item)) for item in normalized],
+                defaults=defaults
+            )
+            self.exception_cache.update(zip(normalized, resolved))
+
+            LogEntry.copy_many(cursor, self.make_entries(batch), [
+                [self.tag_cache[tag].pk for tag in dict.fromkeys(item['tags'])] for item in batch
+            ])
+            LogImport.save_progress(cursor, path, offset, len(batch))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def missing_functions(self, batch: List[Dict[str, Any]]) -> List[Tuple[str, int, str]]:
+        keys = dict.fromkeys((item['function'], item['lineno'], item['pathname']) for item in batch)
+        return [key for key in keys if key not in self.func_cache]
+
+    def missing_exceptions(self, batch: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+        tracebacks: Dict[str, str] = {}
+        for item in batch:
+            normalized = item['normalized_traceback']
+            if normalized is not None and normalized not in self.exception_cache and normalized not in tracebacks:
+                tracebacks[normalized] = item['traceback']
+        return list(tracebacks.keys()), [dict(traceback=traceback) for traceback in tracebacks.values()]
+
+    def make_entries(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        entries: List[Dict[str, Any]] = []
+        for item in batch:
+            exception = None
+            if item['normalized_traceback'] is not None:
+                exception = self.exception_cache[item['normalized_traceback']]
+            entries.append(dict(
+                level=item['levelno'],
+                message=item['message'],
+                pid=item['process'],
+                time=datetime.fromtimestamp(item['created']),
+                function_id=self.func_cache[(item['function'], item['lineno'], item['pathname'])].pk,
+                logger_id=self.logger_cache[item['logger_name']].pk,
+                hostname_id=self.host_cache[item['hostname']].pk,
+                exception_id=exception.pk if exception is not None else None,
+                extra=item['extra'],
+                repeat_count=item['repeat_count']
+            ))
+        return entries
+
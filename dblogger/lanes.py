@@ -0,0 +1,155 @@
+from typing import Optional, Dict, Deque, Tuple, Any
+import time
+
+from collections import deque
+from logging import LogRecord, ERROR
+
+__all__ = ['PriorityLanes', 'LaneStats']
+
+
+class LaneStats:
+    """
+    Counters of one lane, latencies are the seconds a record waited in the lane
+    """
+
+    written: int
+    dropped: int
+    max_depth: int
+    latency_total: float
+    latency_max: float
+
+    def __init__(self):
+        self.written = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def add(self, latency: float):
+        self.written += 1
+        self.latency_total += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+
+    @property
+    def latency_avg(self) -> float:
+        if self.written == 0:
+            return 0.0
+        return self.latency_total / self.written
+
+
+class PriorityLanes:
+    """
+    Level-aware queue for the async handler.
+
+    Records at or above ``level`` go into the immediate lane, they wake the emitter right
+    away and are always written before anything in the batched lane. Lower levels go into
+    the batched lane, the emitter is only woken once ``batch_size`` records are waiting or
+    the oldest one waited ``batch_delay`` seconds. If the batched lane grows beyond
+    ``max_batched`` records the oldest batched records are dropped, the immediate lane
+    is never shed.
+    """
+
+    # config
+    level: int
+    batch_size: int
+    batch_delay: float
+    max_batched: int
+
+    # lanes, items are (enqueue time, record)
+    immediate: Deque[Tuple[float, LogRecord]]
+    batched: Deque[Tuple[float, LogRecord]]
+
+    # counters
+    immediate_stats: LaneStats
+    batched_stats: LaneStats
+
+    def __init__(self, level: int=ERROR, batch_size: int=500, batch_delay: float=0.5, max_batched: int=100000):
+        """
+        Initialize priority lanes
+
+        :param level: Records at or above this level bypass batching
+        :param batch_size: Number of batched records that wake the emitter
+        :param batch_delay: Maximum seconds a batched record waits before the emitter is woken
+        :param max_batched: Maximum number of records in the batched lane, the oldest are
+                            dropped when more arrive
+        """
+        self.level = level
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_batched = max_batched
+        self.immediate = deque()
+        self.batched = deque()
+        self.immediate_stats = LaneStats()
+        self.batched_stats = LaneStats()
+
+    def __len__(self) -> int:
+        return len(self.immediate) + len(self.batched)
+
+    def put(self, record: LogRecord):
+        """
+        Add a record to the lane of its level
+        """
+        if record.levelno >= self.level:
+            self.immediate.append((time.monotonic(), record))
+            if len(self.immediate) > self.immediate_stats.max_depth:
+                self.immediate_stats.max_depth = len(self.immediate)
+            return
+
+        self.batched.append((time.monotonic(), record))
+        while len(self.batched) > self.max_batched:
+            self.batched.popleft()
+            self.batched_stats.dropped += 1
+        if len(self.batched) > self.batched_stats.max_depth:
+            self.batched_stats.max_depth = len(self.batched)
+
+    def get(self) -> Optional[LogRecord]:
+        """
+        Remove and return the next record to write, immediate records first
+        """
+        if len(self.immediate) > 0:
+            queued, record = self.immediate.popleft()
+            self.immediate_stats.add(time.monotonic() - queued)
+            return record
+        if len(self.batched) > 0:
+            queued, record = self.batched.popleft()
+            self.batched_stats.add(time.monotonic() - queued)
+            return record
+        return None
+
+    def ready(self) -> bool:
+        """
+        Check if the emitter should be woken up
+        """
+        if len(self.immediate) > 0 or len(self.batched) >= self.batch_size:
+            return True
+        if len(self.batched) == 0:
+            return False
+        return time.monotonic() - self.batched[0][0] >= self.batch_delay
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Seconds until the oldest batched record is due, ``None`` if the batched lane is empty
+        """
+        if len(self.batched) == 0:
+            return None
+        return max(0.0, self.batched[0][0] + self.batch_delay - time.monotonic())
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Depth, counters and latencies of both lanes
+        """
+        result: Dict[str, Dict[str, Any]] = {}
+        for name, lane, stats in (
+            ('immediate', self.immediate, self.immediate_stats),
+            ('batched', self.batched, self.batched_stats),
+        ):
+            result[name] = {
+                'depth': len(lane),
+                'max_depth': stats.max_depth,
+                'written': stats.written,
+                'dropped': stats.dropped,
+                'latency_avg': stats.latency_avg,
+                'latency_max': stats.latency_max,
+            }
+        return result
@@ -4,3 +4,7 @@ from .logger import BaseLogLogger
 from .source import BaseLogSource
 from .tag import BaseLogTag
 from .entry import BaseLogEntry
+from .exception import BaseLogException
+from .template import BaseLogTemplate
+from .rollup import BaseLogRollup
+from .import_state import BaseLogImport
@@ -1,11 +1,28 @@
 from typing import List, Dict, Any, Optional
+import json
 
 from logging import DEBUG
 from datetime import datetime, timezone
 
 from .model import BaseModel
+from ..templates import render_message
 
-__all__ = ['BaseLogEntry']
+__all__ = ['BaseLogEntry', 'SEARCH_MODES', 'COUNT_DIMENSIONS', 'STAGING_TABLE', 'STAGING_TAG_TABLE']
+
+SEARCH_MODES = ('substring', 'words')
+
+# dimensions ``count_by`` can group entries by
+COUNT_DIMENSIONS = ('functions', 'loggers', 'tags', 'messages')
+
+# unlogged staging tables, entries are moved to ``logger_log`` by ``merge_staging``
+STAGING_TABLE = 'logger_log_staging'
+STAGING_TAG_TABLE = 'logger_log_tag_staging'
+
+# columns moved from the staging table, ``messageVector`` is generated by ``logger_log``
+STAGING_COLUMNS = [
+    'id', 'level', 'message', 'pid', 'time', 'functionID', 'loggerID', 'hostnameID', 'exceptionID',
+    'templateID', 'args', 'extra', 'tagIDs', 'repeatCount', 'lastTime'
+]
 
 
 class BaseLogEntry(BaseModel):
@@ -18,6 +35,13 @@ class BaseLogEntry(BaseModel):
     function_id: int
     logger_id: int
     hostname_id: int
+    exception_id: Optional[int]
+    template_id: Optional[int]
+    args: Optional[Any]
+    extra: Optional[Dict[str, Any]]
+    tag_ids: Optional[List[int]]
+    repeat_count: int
+    last_time: Optional[datetime]
 
     def deserialize(self, rowdata: Dict) -> None:
         self.level = rowdata.get('level')
@@ -27,6 +51,30 @@ class BaseLogEntry(BaseModel):
         self.function_id = rowdata.get('functionID')
         self.logger_id = rowdata.get('loggerID')
         self.hostname_id = rowdata.get('hostnameID')
+        self.exception_id = rowdata.get('exceptionID')
+        self.template_id = rowdata.get('templateID')
+
+        args = rowdata.get('args')
+        if isinstance(args, str):
+            args = json.loads(args)
+        self.args = args
+
+        extra = rowdata.get('extra')
+        if isinstance(extra, str):
+            extra = json.loads(extra)
+        self.extra = extra
+
+        # ``None`` if the tags are stored in ``logger_log_tag``, a sorted list of tag ids otherwise
+        self.tag_ids = rowdata.get('tagIDs')
+
+        # coalesced entries, ``time`` is the first and ``last_time`` the last occurrence
+        self.repeat_count = rowdata.get('repeatCount') or 1
+        last_time = rowdata.get('lastTime')
+        self.last_time = datetime.utcfromtimestamp(last_time) if last_time is not None else None
+
+        # template storage mode, reconstruct the message if the template was joined in
+        if self.message is None and rowdata.get('template_text') is not None:
+            self.message = render_message(rowdata.get('template_text'), self.args)
 
     @classmethod
     def serialize_data(cls, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -46,30 +94,73 @@ class BaseLogEntry(BaseModel):
             result['loggerID'] = data['logger_id']
         if 'hostname_id' in data:
             result['hostnameID'] = data['hostname_id']
+        if data.get('exception_id') is not None:
+            result['exceptionID'] = data['exception_id']
+        if data.get('template_id') is not None:
+            result['templateID'] = data['template_id']
+        if data.get('args') is not None:
+            result['args'] = json.dumps(data['args'], separators=(',', ':'))
+        if data.get('extra') is not None:
+            result['extra'] = json.dumps(data['extra'], separators=(',', ':'), default=str)
+        if data.get('tag_ids') is not None:
+            result['tagIDs'] = list(data['tag_ids'])
+        if data.get('repeat_count', 1) != 1:
+            result['repeatCount'] = data['repeat_count']
+            if data.get('last_time') is not None:
+                result['lastTime'] = data['last_time'].timestamp()
 
         return result
 
+# columns of ``load_columns`` as (name, expression, type), missing ids are returned as ``0``
+# so every row has the same size in the binary ``COPY`` format
+COLUMNAR_FIELDS = [
+    ('id', 'le.id', 'int8'),
+    ('time', 'le.time', 'float8'),
+    ('level', 'le.level', 'int4'),
+    ('pid', 'coalesce(le.pid, 0)', 'int4'),
+    ('function_id', 'coalesce(le."functionID", 0)', 'int4'),
+    ('logger_id', 'coalesce(le."loggerID", 0)', 'int4'),
+    ('hostname_id', 'coalesce(le."hostnameID", 0)', 'int4'),
+    ('exception_id', 'coalesce(le."exceptionID", 0)', 'int4'),
+    ('template_id', 'coalesce(le."templateID", 0)', 'int4'),
+    ('repeat_count', 'le."repeatCount"', 'int4'),
+]
+
 def get_sql_for_entry_with_date(where_clause: List[str], limit:  Optional[int]=None):
     from .function import BaseLogFunction
     from .source import BaseLogSource
     from .logger import BaseLogLogger
     from .host import BaseLogHost
+    from .exception import BaseLogException
+    from .template import BaseLogTemplate
+    from .tag import BaseLogTag
 
     return f'''
         SELECT
             le.id, le.level, le.message, le.pid, le.time,
-            le."functionID", le."loggerID", le."hostnameID",
+            le."functionID", le."loggerID", le."hostnameID", le."exceptionID",
+            le."templateID", le.args, le.extra, le."tagIDs",
+            le."repeatCount", le."lastTime",
+            CASE WHEN le."tagIDs" IS NULL THEN NULL ELSE (
+                SELECT coalesce(json_agg(json_build_object('id', t.id, 'name', t.name)), '[]')
+                FROM {BaseLogTag.table} t
+                WHERE t.id = ANY(le."tagIDs")
+            ) END as tag_list,
             lf."name" as function_name,
             lf."lineNumber" as function_line_number,
             lf."sourceID" as "function_sourceID",
             ls.path as function_source_path,
             ll."name" as logger_name,
-            lh."name" as hostname_name
+            lh."name" as hostname_name,
+            lx.traceback as exception_traceback,
+            lt.template as template_text
         FROM {BaseLogEntry.table} le
         LEFT JOIN {BaseLogFunction.table} lf ON lf.id = le."functionID"
         LEFT JOIN {BaseLogSource.table} ls ON ls.id = lf."sourceID"
         LEFT JOIN {BaseLogLogger.table} ll ON ll.id = le."loggerID"
         LEFT JOIN {BaseLogHost.table} lh ON lh.id = le."hostnameID"
+        LEFT JOIN {BaseLogException.table} lx ON lx.id = le."exceptionID"
+        LEFT JOIN {BaseLogTemplate.table} lt ON lt.id = le."templateID"
         {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
         ORDER BY
             le."time" {'ASC' if limit is None else 'DESC'},
@@ -77,27 +168,218 @@ def get_sql_for_entry_with_date(where_clause: List[str], limit:  Optional[int]=N
         {f'LIMIT {int(limit)}' if limit is not None else ''}
     '''
 
-def get_sql_for_entry_after_id(parameter: str):
+def get_sql_for_columns(where_clause: str):
+    expressions = ', '.join([expression for _, expression, _ in COLUMNAR_FIELDS])
+    return f'''
+        SELECT {expressions}
+        FROM {BaseLogEntry.table} le
+        {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
+        ORDER BY le."time" ASC, le.id ASC
+    '''
+
+
+def get_sql_for_entry_after_id(parameter: str, where_clause: str=''):
     from .function import BaseLogFunction
     from .source import BaseLogSource
     from .logger import BaseLogLogger
     from .host import BaseLogHost
+    from .exception import BaseLogException
+    from .template import BaseLogTemplate
+    from .tag import BaseLogTag
 
     return f'''
         SELECT
             le.id, le.level, le.message, le.pid, le.time,
-            le."functionID", le."loggerID", le."hostnameID",
+            le."functionID", le."loggerID", le."hostnameID", le."exceptionID",
+            le."templateID", le.args, le.extra, le."tagIDs",
+            le."repeatCount", le."lastTime",
+            CASE WHEN le."tagIDs" IS NULL THEN NULL ELSE (
+                SELECT coalesce(json_agg(json_build_object('id', t.id, 'name', t.name)), '[]')
+                FROM {BaseLogTag.table} t
+                WHERE t.id = ANY(le."tagIDs")
+            ) END as tag_list,
             lf."name" as function_name,
             lf."lineNumber" as function_line_number,
             lf."sourceID" as "function_sourceID",
             ls.path as function_source_path,
             ll."name" as logger_name,
-            lh."name" as hostname_name
+            lh."name" as hostname_name,
+            lx.traceback as exception_traceback,
+            lt.template as template_text
         FROM {BaseLogEntry.table} le
         LEFT JOIN {BaseLogFunction.table} lf ON lf.id = le."functionID"
         LEFT JOIN {BaseLogSource.table} ls ON ls.id = lf."sourceID"
         LEFT JOIN {BaseLogLogger.table} ll ON ll.id = le."loggerID"
         LEFT JOIN {BaseLogHost.table} lh ON lh.id = le."hostnameID"
-        WHERE le.id > {parameter}
+        LEFT JOIN {BaseLogException.table} lx ON lx.id = le."exceptionID"
+        LEFT JOIN {BaseLogTemplate.table} lt ON lt.id = le."templateID"
+        WHERE le.id > {parameter} {'AND' if len(where_clause) > 0 else ''} {where_clause}
         ORDER BY id;
     '''
+
+def get_sql_for_search(parameter: str, mode: str='substring', template_parameter: Optional[str]=None) -> str:
+    """
+    Condition matching the message against a search term, ``substring`` is a case-insensitive
+    ``ILIKE`` served by the trigram indexes, ``words`` a web search style full text query served
+    by the index on the ``messageVector`` column. Entries stored in template mode have no
+    message, their template is searched instead (through the indexes on ``logger_template``).
+
+    :param template_parameter: Placeholder of the search value for the template condition,
+                               defaults to ``parameter`` (for numbered placeholders), positional
+                               placeholders need the value twice
+    """
+    from .template import BaseLogTemplate
+
+    if template_parameter is None:
+        template_parameter = parameter
+    if mode == 'substring':
+        return (
+            f'(le.message ILIKE {parameter} OR le."templateID" IN '
+            f'(SELECT id FROM {BaseLogTemplate.table} WHERE template ILIKE {template_parameter}))'
+        )
+    if mode == 'words':
+        return (
+            f"(le.\"messageVector\" @@ websearch_to_tsquery('simple', {parameter}) OR le.\"templateID\" IN "
+            f"(SELECT id FROM {BaseLogTemplate.table} "
+            f"WHERE to_tsvector('simple', template) @@ websearch_to_tsquery('simple', {template_parameter})))"
+        )
+    raise ValueError(f'`mode` has to be one of {", ".join(SEARCH_MODES)}')
+
+def get_search_value(search: str, mode: str='substring') -> str:
+    if mode == 'words':
+        return search
+    escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+def get_sql_for_template_counts(where_clause: str, limit: Optional[int]=None):
+    from .template import BaseLogTemplate
+
+    return f'''
+        SELECT lt.id, lt.hash, lt.template, sum(le."repeatCount") as count
+        FROM {BaseLogEntry.table} le
+        JOIN {BaseLogTemplate.table} lt ON lt.id = le."templateID"
+        {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
+        GROUP BY lt.id
+        ORDER BY count DESC
+        {f'LIMIT {int(limit)}' if limit is not None else ''}
+    '''
+
+
+def get_sql_for_time_bucket(seconds: int) -> str:
+    """
+    Start of the ``seconds`` wide time bucket of an entry
+    """
+    return f'floor(le."time" / {int(seconds)}) * {int(seconds)}'
+
+def get_sql_for_time_counts(where_clause: str, bucket: str):
+    """
+    Count entries per time bucket and level, coalesced entries count as often as they were
+    repeated
+
+    :param bucket: Bucket expression, see ``get_sql_for_time_bucket``
+    """
+    return f'''
+        SELECT {bucket} AS "time", le.level, sum(le."repeatCount") AS count
+        FROM {BaseLogEntry.table} le
+        {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
+        GROUP BY 1, le.level
+        ORDER BY 1, le.level
+    '''
+
+def get_sql_for_dimension_counts(
+    dimension: str,
+    where_clause: str,
+    limit: int,
+    tag_array: str='unnest(le."tagIDs") AS ta(value)'
+):
+    """
+    Count entries grouped by function, logger, tag or message (or message template),
+    most frequent first, coalesced entries count as often as they were repeated. For
+    ``tags`` the where clause is used twice (for the tag table and the tag array),
+    positional placeholders need their values twice.
+
+    :param tag_array: Table function expanding ``tagIDs`` into rows with a ``value`` column
+    """
+    from .function import BaseLogFunction
+    from .logger import BaseLogLogger
+    from .tag import BaseLogTag
+    from .template import BaseLogTemplate
+
+    where = f'WHERE {where_clause}' if len(where_clause) > 0 else ''
+    repeat_count = 'le."repeatCount"'
+    if dimension == 'functions':
+        name = "lf.name || ':' || lf.\"lineNumber\""
+        source = f'{BaseLogEntry.table} le JOIN {BaseLogFunction.table} lf ON lf.id = le."functionID"'
+        group = 'lf.id, lf.name, lf."lineNumber"'
+    elif dimension == 'loggers':
+        name = 'll.name'
+        source = f'{BaseLogEntry.table} le JOIN {BaseLogLogger.table} ll ON ll.id = le."loggerID"'
+        group = 'll.id, ll.name'
+    elif dimension == 'messages':
+        # entries written in template mode are counted by their template
+        name = 'coalesce(le.message, lt.template)'
+        source = f'{BaseLogEntry.table} le LEFT JOIN {BaseLogTemplate.table} lt ON lt.id = le."templateID"'
+        group = name
+    elif dimension == 'tags':
+        name = 't.name'
+        source = f'''(
+            SELECT lt."tagID" AS id, le."repeatCount"
+            FROM {BaseLogEntry.table} le
+            JOIN logger_log_tag lt ON lt."logID" = le.id
+            {where}
+            UNION ALL
+            SELECT ta.value AS id, le."repeatCount"
+            FROM {BaseLogEntry.table} le
+            CROSS JOIN {tag_array}
+            {where}
+        ) tags
+        JOIN {BaseLogTag.table} t ON t.id = tags.id'''
+        group = 't.id, t.name'
+        where = ''
+        repeat_count = 'tags."repeatCount"'
+    else:
+        raise ValueError(f'Can not count entries by `{dimension}`, use one of {", ".join(COUNT_DIMENSIONS)}')
+
+    return f'''
+        SELECT {name} AS name, sum({repeat_count}) AS count
+        FROM {source}
+        {where}
+        GROUP BY {group}
+        ORDER BY count DESC
+        LIMIT {int(limit)}
+    '''
+
+def get_sql_for_staged_entry(columns: List[str], params: List[str], tags_parameter: str):
+    value_list = ', '.join([f'"{column}"' for column in columns])
+    return f'''
+        WITH entry AS (
+            INSERT INTO {STAGING_TABLE} ({value_list})
+            VALUES ({', '.join(params)})
+            RETURNING id
+        ), tags AS (
+            INSERT INTO {STAGING_TAG_TABLE} ("logID", "tagID")
+            SELECT entry.id, unnest({tags_parameter}::integer[]) FROM entry
+        )
+        SELECT id FROM entry
+    '''
+
+
+def get_sql_for_merge_staging():
+    # both tables are read with the same snapshot, so tags are never moved before their entry
+    column_list = ', '.join([f'"{column}"' for column in STAGING_COLUMNS])
+    return f'''
+        WITH moved AS (
+            DELETE FROM {STAGING_TABLE} RETURNING *
+        ), moved_tags AS (
+            DELETE FROM {STAGING_TAG_TABLE} RETURNING *
+        ), inserted AS (
+            INSERT INTO {BaseLogEntry.table} ({column_list})
+            SELECT {column_list} FROM moved
+            RETURNING id
+        ), inserted_tags AS (
+            INSERT INTO logger_log_tag ("logID", "tagID")
+            SELECT "logID", "tagID" FROM moved_tags
+            ON CONFLICT DO NOTHING
+        )
+        SELECT count(*) AS count FROM inserted
+    '''
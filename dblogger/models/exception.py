@@ -0,0 +1,27 @@
+from typing import Dict, Any
+
+from .model import BaseModel
+
+__all__ = ['BaseLogException']
+
+
+class BaseLogException(BaseModel):
+    table = "logger_exception"
+
+    hash: str
+    traceback: str
+
+    def deserialize(self, rowdata: Dict) -> None:
+        self.hash = rowdata.get('hash')
+        self.traceback = rowdata.get('traceback')
+
+    @classmethod
+    def serialize_data(cls, data) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+
+        if 'hash' in data:
+            result['hash'] = data['hash']
+        if 'traceback' in data:
+            result['traceback'] = data['traceback']
+
+        return result
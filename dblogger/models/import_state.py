@@ -0,0 +1,31 @@
+from typing import Dict, Any
+
+from .model import BaseModel
+
+__all__ = ['BaseLogImport']
+
+
+class BaseLogImport(BaseModel):
+    table = "logger_import"
+
+    path: str
+    offset: int
+    entries: int
+
+    def deserialize(self, rowdata: Dict) -> None:
+        self.path = rowdata.get('path')
+        self.offset = rowdata.get('offset')
+        self.entries = rowdata.get('entries')
+
+    @classmethod
+    def serialize_data(cls, data) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+
+        if 'path' in data:
+            result['path'] = data['path']
+        if 'offset' in data:
+            result['offset'] = data['offset']
+        if 'entries' in data:
+            result['entries'] = data['entries']
+
+        return result
@@ -0,0 +1,84 @@
+from typing import List, Dict, Any
+from datetime import datetime
+
+from .model import BaseModel
+
+__all__ = ['BaseLogRollup']
+
+# columns the rollup stats can be grouped by, name -> select expression
+ROLLUP_GROUPS = {
+    'time': 'r.time',
+    'level': 'r.level',
+    'logger': 'll.name',
+    'hostname': 'lh.name',
+    'function': 'lf.name || \':\' || lf."lineNumber"',
+}
+
+
+class BaseLogRollup(BaseModel):
+    table = "logger_rollup"
+
+    time: datetime
+    logger_id: int
+    hostname_id: int
+    function_id: int
+    level: int
+    count: int
+
+    def deserialize(self, rowdata: Dict) -> None:
+        self.time = datetime.utcfromtimestamp(rowdata.get('time'))
+        self.logger_id = rowdata.get('loggerID')
+        self.hostname_id = rowdata.get('hostnameID')
+        self.function_id = rowdata.get('functionID')
+        self.level = rowdata.get('level')
+        self.count = rowdata.get('count')
+
+    @classmethod
+    def serialize_data(cls, data) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+
+        if 'time' in data:
+            result['time'] = data['time'].timestamp()
+        if 'logger_id' in data:
+            result['loggerID'] = data['logger_id']
+        if 'hostname_id' in data:
+            result['hostnameID'] = data['hostname_id']
+        if 'function_id' in data:
+            result['functionID'] = data['function_id']
+        if 'level' in data:
+            result['level'] = data['level']
+        if 'count' in data:
+            result['count'] = data['count']
+
+        return result
+
+
+def get_sql_for_rollup_upsert(placeholders: List[str]):
+    return f'''
+        INSERT INTO {BaseLogRollup.table} (time, "loggerID", "hostnameID", "functionID", level, count)
+        VALUES {', '.join(placeholders)}
+        ON CONFLICT (time, "loggerID", "hostnameID", "functionID", level)
+        DO UPDATE SET count = {BaseLogRollup.table}.count + EXCLUDED.count
+    '''
+
+
+def get_sql_for_rollup_stats(group_by: List[str], where_clause: str):
+    from .function import BaseLogFunction
+    from .logger import BaseLogLogger
+    from .host import BaseLogHost
+
+    for group in group_by:
+        if group not in ROLLUP_GROUPS:
+            raise ValueError(f'Can not group rollups by `{group}`, use one of {", ".join(ROLLUP_GROUPS.keys())}')
+
+    columns = [f'{ROLLUP_GROUPS[group]} as "{group}"' for group in group_by]
+    return f'''
+        SELECT {', '.join(columns + ['sum(r.count) as count'])}
+        FROM {BaseLogRollup.table} r
+        LEFT JOIN {BaseLogFunction.table} lf ON lf.id = r."functionID"
+        LEFT JOIN {BaseLogLogger.table} ll ON ll.id = r."loggerID"
+        LEFT JOIN {BaseLogHost.table} lh ON lh.id = r."hostnameID"
+        {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
+        {'GROUP BY' if len(group_by) > 0 else ''} {', '.join([f'"{group}"' for group in group_by])}
+        ORDER BY {'"time",' if 'time' in group_by else ''} count DESC
+    '''
@@ -0,0 +1,270 @@
+from typing import List
+
+__all__ = ['SCHEMA', 'SQLITE_SCHEMA']
+
+# Statements to create or upgrade the logging schema, every statement has to be
+# idempotent so the list can be run against an existing database.
+SCHEMA: List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS logger_source (
+        id serial PRIMARY KEY,
+        path text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_function (
+        id serial PRIMARY KEY,
+        name text NOT NULL,
+        "lineNumber" integer NOT NULL,
+        "sourceID" integer NOT NULL REFERENCES logger_source (id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_logger (
+        id serial PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_hosts (
+        id serial PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_tag (
+        id serial PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_log (
+        id bigserial PRIMARY KEY,
+        level integer NOT NULL,
+        message text NOT NULL,
+        pid integer,
+        time double precision NOT NULL,
+        "functionID" integer REFERENCES logger_function (id) ON DELETE CASCADE,
+        "loggerID" integer REFERENCES logger_logger (id) ON DELETE CASCADE,
+        "hostnameID" integer REFERENCES logger_hosts (id) ON DELETE CASCADE
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS logger_log_time_idx ON logger_log (time)',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_log_tag (
+        "logID" bigint NOT NULL REFERENCES logger_log (id) ON DELETE CASCADE,
+        "tagID" integer NOT NULL REFERENCES logger_tag (id) ON DELETE CASCADE,
+        PRIMARY KEY ("logID", "tagID")
+    )
+    ''',
+
+    # exceptions and stack traces, deduplicated by the hash of the normalized traceback
+    '''
+    CREATE TABLE IF NOT EXISTS logger_exception (
+        id serial PRIMARY KEY,
+        hash text NOT NULL UNIQUE,
+        traceback text NOT NULL
+    )
+    ''',
+    '''
+    ALTER TABLE logger_log
+        ADD COLUMN IF NOT EXISTS "exceptionID" integer REFERENCES logger_exception (id) ON DELETE SET NULL
+    ''',
+
+    # message templates, entries in template mode store the template id and the
+    # arguments instead of the formatted message
+    '''
+    CREATE TABLE IF NOT EXISTS logger_template (
+        id serial PRIMARY KEY,
+        hash text NOT NULL UNIQUE,
+        template text NOT NULL
+    )
+    ''',
+    'ALTER TABLE logger_log ALTER COLUMN message DROP NOT NULL',
+    '''
+    ALTER TABLE logger_log
+        ADD COLUMN IF NOT EXISTS "templateID" integer REFERENCES logger_template (id) ON DELETE SET NULL,
+        ADD COLUMN IF NOT EXISTS args jsonb
+    ''',
+    'CREATE INDEX IF NOT EXISTS logger_log_template_idx ON logger_log ("templateID")',
+
+    # structured extra fields, filtered with GIN-indexed containment queries (``@>``)
+    'ALTER TABLE logger_log ADD COLUMN IF NOT EXISTS extra jsonb',
+    'CREATE INDEX IF NOT EXISTS logger_log_extra_idx ON logger_log USING gin (extra jsonb_path_ops)',
+
+    # tag array storage mode, the sorted tag ids of an entry instead of ``logger_log_tag`` rows
+    'ALTER TABLE logger_log ADD COLUMN IF NOT EXISTS "tagIDs" integer[]',
+    'CREATE INDEX IF NOT EXISTS logger_log_tag_ids_idx ON logger_log USING gin ("tagIDs")',
+
+    # coalesced entries, ``time`` is the first and ``lastTime`` the last occurrence
+    '''
+    ALTER TABLE logger_log
+        ADD COLUMN IF NOT EXISTS "repeatCount" integer NOT NULL DEFAULT 1,
+        ADD COLUMN IF NOT EXISTS "lastTime" double precision
+    ''',
+
+    # pre-aggregated entry counts per time bucket, maintained by the handlers
+    '''
+    CREATE TABLE IF NOT EXISTS logger_rollup (
+        time double precision NOT NULL,
+        "loggerID" integer NOT NULL REFERENCES logger_logger (id) ON DELETE CASCADE,
+        "hostnameID" integer NOT NULL REFERENCES logger_hosts (id) ON DELETE CASCADE,
+        "functionID" integer NOT NULL REFERENCES logger_function (id) ON DELETE CASCADE,
+        level integer NOT NULL,
+        count bigint NOT NULL,
+        PRIMARY KEY (time, "loggerID", "hostnameID", "functionID", level)
+    )
+    ''',
+
+    # progress of bulk imports, updated in the same transaction as the imported entries
+    '''
+    CREATE TABLE IF NOT EXISTS logger_import (
+        path text PRIMARY KEY,
+        "offset" bigint NOT NULL,
+        entries bigint NOT NULL DEFAULT 0
+    )
+    ''',
+
+    # message search, a trigram index for substring searches and a generated tsvector
+    # column for word searches (generated columns need PostgreSQL 12)
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS logger_log_message_trgm_idx ON logger_log USING gin (message gin_trgm_ops)',
+    '''
+    ALTER TABLE logger_log
+        ADD COLUMN IF NOT EXISTS "messageVector" tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(message, ''))) STORED
+    ''',
+    'CREATE INDEX IF NOT EXISTS logger_log_message_vector_idx ON logger_log USING gin ("messageVector")',
+    # entries stored in template mode are found by their template
+    'CREATE INDEX IF NOT EXISTS logger_template_trgm_idx ON logger_template USING gin (template gin_trgm_ops)',
+    '''
+    CREATE INDEX IF NOT EXISTS logger_template_vector_idx
+        ON logger_template USING gin (to_tsvector('simple', template))
+    ''',
+
+    # unlogged staging tables for the ``staging`` durability mode, merged into ``logger_log``
+    # by the handlers, columns added to ``logger_log`` have to be added here as well
+    '''
+    CREATE UNLOGGED TABLE IF NOT EXISTS logger_log_staging (
+        id bigint NOT NULL DEFAULT nextval('logger_log_id_seq'::regclass),
+        level integer NOT NULL,
+        message text,
+        pid integer,
+        time double precision NOT NULL,
+        "functionID" integer,
+        "loggerID" integer,
+        "hostnameID" integer,
+        "exceptionID" integer,
+        "templateID" integer,
+        args jsonb,
+        extra jsonb,
+        "tagIDs" integer[],
+        "repeatCount" integer NOT NULL DEFAULT 1,
+        "lastTime" double precision
+    )
+    ''',
+    '''
+    CREATE UNLOGGED TABLE IF NOT EXISTS logger_log_tag_staging (
+        "logID" bigint NOT NULL,
+        "tagID" integer NOT NULL
+    )
+    ''',
+]
+
+
+# Schema for the SQLite backend, created in one go instead of upgraded step by step.
+# Arrays and JSON are stored as JSON text, ids are rowid aliases.
+SQLITE_SCHEMA: List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS logger_source (
+        id INTEGER PRIMARY KEY,
+        path text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_function (
+        id INTEGER PRIMARY KEY,
+        name text NOT NULL,
+        "lineNumber" integer NOT NULL,
+        "sourceID" integer NOT NULL REFERENCES logger_source (id) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_logger (
+        id INTEGER PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_hosts (
+        id INTEGER PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_tag (
+        id INTEGER PRIMARY KEY,
+        name text NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_exception (
+        id INTEGER PRIMARY KEY,
+        hash text NOT NULL UNIQUE,
+        traceback text NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_template (
+        id INTEGER PRIMARY KEY,
+        hash text NOT NULL UNIQUE,
+        template text NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_log (
+        id INTEGER PRIMARY KEY,
+        level integer NOT NULL,
+        message text,
+        pid integer,
+        time real NOT NULL,
+        "functionID" integer REFERENCES logger_function (id) ON DELETE CASCADE,
+        "loggerID" integer REFERENCES logger_logger (id) ON DELETE CASCADE,
+        "hostnameID" integer REFERENCES logger_hosts (id) ON DELETE CASCADE,
+        "exceptionID" integer REFERENCES logger_exception (id) ON DELETE SET NULL,
+        "templateID" integer REFERENCES logger_template (id) ON DELETE SET NULL,
+        args text,
+        extra text,
+        "tagIDs" text,
+        "repeatCount" integer NOT NULL DEFAULT 1,
+        "lastTime" real
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS logger_log_time_idx ON logger_log (time)',
+    'CREATE INDEX IF NOT EXISTS logger_log_template_idx ON logger_log ("templateID")',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_log_tag (
+        "logID" integer NOT NULL REFERENCES logger_log (id) ON DELETE CASCADE,
+        "tagID" integer NOT NULL REFERENCES logger_tag (id) ON DELETE CASCADE,
+        PRIMARY KEY ("logID", "tagID")
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_rollup (
+        time real NOT NULL,
+        "loggerID" integer NOT NULL REFERENCES logger_logger (id) ON DELETE CASCADE,
+        "hostnameID" integer NOT NULL REFERENCES logger_hosts (id) ON DELETE CASCADE,
+        "functionID" integer NOT NULL REFERENCES logger_function (id) ON DELETE CASCADE,
+        level integer NOT NULL,
+        count integer NOT NULL,
+        PRIMARY KEY (time, "loggerID", "hostnameID", "functionID", level)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS logger_import (
+        path text PRIMARY KEY,
+        "offset" integer NOT NULL,
+        entries integer NOT NULL DEFAULT 0
+    )
+    ''',
+]
@@ -0,0 +1,27 @@
+from typing import Dict, Any
+
+from .model import BaseModel
+
+__all__ = ['BaseLogTemplate']
+
+
+class BaseLogTemplate(BaseModel):
+    table = "logger_template"
+
+    hash: str
+    template: str
+
+    def deserialize(self, rowdata: Dict) -> None:
+        self.hash = rowdata.get('hash')
+        self.template = rowdata.get('template')
+
+    @classmethod
+    def serialize_data(cls, data) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+
+        if 'hash' in data:
+            result['hash'] = data['hash']
+        if 'template' in data:
+            result['template'] = data['template']
+
+        return result
@@ -0,0 +1,205 @@
+from typing import Dict, List, Optional, Callable
+import re
+import sys
+import threading
+import time
+
+__all__ = ['QueryTracer', 'StatementStats', 'statement_shape', 'set_tracer', 'get_tracer', 'traced']
+
+_WHITESPACE = re.compile(r'\s+')
+_NUMBERED_PLACEHOLDER = re.compile(r'\$\d+')
+_NUMBER = re.compile(r'(?<![\w$.])\d+(?:\.\d+)?\b')
+_VALUE_GROUPS = re.compile(r'(\((?:%s|\$n)(?:, (?:%s|\$n))*\))(?:, \1)+')
+_CONDITION_GROUPS = re.compile(r'(\([^()]*\))(?: OR \1)+')
+_PLACEHOLDER_LISTS = re.compile(r'((?:%s|\$n))(?:, \1){2,}')
+
+
+def statement_shape(sql: str) -> str:
+    """
+    Normalize a statement so all executions of the same query are counted together:
+    whitespace is collapsed, placeholders are replaced by ``$n``/``%s``, numbers by ``N``
+    and repeated ``VALUES`` tuples, ``OR`` conditions and placeholder lists by ``...``
+    """
+    shape = _WHITESPACE.sub(' ', sql).strip()
+    shape = _NUMBERED_PLACEHOLDER.sub('$n', shape)
+    shape = _NUMBER.sub('N', shape)
+    shape = _VALUE_GROUPS.sub(r'\1, ...', shape)
+    shape = _CONDITION_GROUPS.sub(r'\1 OR ...', shape)
+    shape = _PLACEHOLDER_LISTS.sub(r'\1, ...', shape)
+    return shape
+
+
+class StatementStats:
+    """
+    Aggregated executions of one statement shape
+    """
+
+    shape: str
+    calls: int
+    total: float
+    max: float
+    rows: int
+    parameters: int
+
+    def __init__(self, shape: str):
+        self.shape = shape
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.parameters = 0
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.calls if self.calls > 0 else 0.0
+
+
+class QueryTracer:
+    """
+    Records every statement the model layer runs, with the number of parameters, the
+    duration and the number of rows, aggregated by statement shape. Install it with
+    ``set_tracer`` to trace the models for handlers and tools alike.
+    """
+
+    # config
+    slow_threshold: Optional[float]
+    slow_log: Callable[[str, int, float, Optional[int]], None]
+
+    # state
+    statements: Dict[str, StatementStats]
+    shapes: Dict[str, str]
+    slow: int
+    lock: threading.Lock
+
+    def __init__(
+        self,
+        slow_threshold: Optional[float]=None,
+        slow_log: Optional[Callable[[str, int, float, Optional[int]], None]]=None
+    ):
+        """
+        Initialize query tracer
+
+        :param slow_threshold: Seconds after which a statement counts as slow, ``None``
+                               disables the slow query log
+        :param slow_log: Called with statement, number of parameters, duration and rows
+                         for every slow statement, writes to ``stderr`` if not set. Do
+                         not log to a DB handler from here, it would trace itself.
+        """
+        self.slow_threshold = slow_threshold
+        self.slow_log = slow_log if slow_log is not None else self.print_slow
+        self.statements = {}
+        self.shapes = {}
+        self.slow = 0
+        self.lock = threading.Lock()
+
+    def record(self, sql: str, parameters: int, duration: float, rows: Optional[int]=None):
+        """
+        Record one execution of a statement
+
+        :param sql: The statement as sent to the DB
+        :param parameters: Number of bind parameters
+        :param duration: Seconds the statement took
+        :param rows: Number of rows returned or affected if known
+        """
+        shape = self.shapes.get(sql, None)
+        if shape is None:
+            shape = statement_shape(sql)
+            if len(self.shapes) < 10000:
+                self.shapes[sql] = shape
+
+        with self.lock:
+            stats = self.statements.get(shape, None)
+            if stats is None:
+                stats = self.statements[shape] = StatementStats(shape)
+            stats.calls += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            stats.parameters += parameters
+            if rows is not None and rows >= 0:
+                stats.rows += rows
+
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            self.slow += 1
+            self.slow_log(sql, parameters, duration, rows)
+
+    def print_slow(self, sql: str, parameters: int, duration: float, rows: Optional[int]):
+        shape = statement_shape(sql)
+        sys.stderr.write(f'Slow query ({duration * 1000:.1f} ms, {parameters} parameters, {rows} rows): {shape}\n')
+
+    def top(self, limit: int=10, key: str='total') -> List[StatementStats]:
+        """
+        Statements with the highest value of ``key`` (``total``, ``avg``, ``max``, ``calls``
+        or ``rows``)
+        """
+        with self.lock:
+            statements = list(self.statements.values())
+        statements.sort(key=lambda stats: getattr(stats, key), reverse=True)
+        return statements[:limit]
+
+    def report(self, limit: int=10, key: str='total', width: int=120) -> str:
+        """
+        Format the top statements as a table
+        """
+        lines = [f'{"calls":>8} {"total ms":>10} {"avg ms":>9} {"max ms":>9} {"rows":>9} {"params":>7}  statement']
+        for stats in self.top(limit, key):
+            shape = stats.shape if len(stats.shape) <= width else stats.shape[:width - 3] + '...'
+            lines.append(
+                f'{stats.calls:>8} {stats.total * 1000:>10.1f} {stats.avg * 1000:>9.2f} '
+                f'{stats.max * 1000:>9.2f} {stats.rows:>9} {stats.parameters // stats.calls:>7}  {shape}'
+            )
+        if self.slow > 0:
+            lines.append(f'{self.slow} slow statements')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.slow = 0
+
+
+_tracer: Optional[QueryTracer] = None
+
+
+def set_tracer(tracer: Optional[QueryTracer]) -> Optional[QueryTracer]:
+    """
+    Install a tracer for all model queries, ``None`` disables tracing. Returns the
+    previously installed tracer.
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer
+    return previous
+
+
+def get_tracer() -> Optional[QueryTracer]:
+    return _tracer
+
+
+class traced:
+    """
+    Time one statement for the installed tracer, set ``rows`` in the block if known:
+
+    .. code-block:: python
+
+        with traced(sql, len(values)) as trace:
+            db.execute(sql, values)
+            trace.rows = db.rowcount
+    """
+
+    __slots__ = ('tracer', 'sql', 'parameters', 'rows', 'start')
+
+    def __init__(self, sql: str, parameters: int=0):
+        self.tracer = _tracer
+        self.sql = sql
+        self.parameters = parameters
+        self.rows: Optional[int] = None
+
+    def __enter__(self) -> 'traced':
+        if self.tracer is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
+        if self.tracer is not None:
+            self.tracer.record(self.sql, self.parameters, time.perf_counter() - self.start, self.rows)
+        return None
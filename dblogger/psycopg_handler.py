@@ -0,0 +1,32 @@
+from typing import List, Any, Dict
+
+import psycopg
+from psycopg.rows import dict_row
+
+from . import psycopg_models
+from .psycopg_models import LogTag
+from .sync_handler import DBLogHandler as SyncDBLogHandler
+
+__all__ = ['DBLogHandler']
+
+
+class DBLogHandler(SyncDBLogHandler):
+    """
+    Log handler for psycopg 3, the entry, its tags and the commit are sent to the
+    server in one round trip using pipeline mode
+    """
+
+    models = psycopg_models
+
+    def connect(self) -> Any:
+        return psycopg.connect(self.db_config, row_factory=dict_row)
+
+    def insert(self, cursor: Any, data: Dict[str, Any], tags: List[LogTag], relaxed: bool):
+        # apart from the id of staged entries nothing is read back, so the inserts and the
+        # commit are sent without waiting
+        with self.db.pipeline():
+            if relaxed and self.durability.staging:
+                self.models.LogEntry.create_staged(cursor, tags, **data)
+            else:
+                self.models.LogEntry.insert_with_tags(cursor, tags, **data)
+            self.commit(cursor, relaxed)
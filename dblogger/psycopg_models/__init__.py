@@ -0,0 +1,7 @@
+# psycopg 3 uses the same DB-API calls and placeholders as psycopg2, so the sync models are
+# shared, only the entry model uses psycopg 3 specific features (pipelining and binary COPY)
+from dblogger.sync_models import LogFunction, LogHost, LogLogger, LogSource, LogTag, LogException, \
+    LogTemplate, LogRollup, LogImport
+from .entry import LogEntry
+
+__all__ = ['LogEntry', 'LogFunction', 'LogHost', 'LogLogger', 'LogSource', 'LogTag', 'LogException', 'LogTemplate', 'LogRollup', 'LogImport']
@@ -0,0 +1,104 @@
+from typing import List, Dict, Any, Optional
+
+from psycopg.types.json import Jsonb
+
+from dblogger.models.tracing import traced
+from dblogger.sync_models.entry import LogEntry as SyncLogEntry
+from dblogger.sync_models.tag import LogTag
+from dblogger.sync_models.model import execute
+
+__all__ = ['LogEntry']
+
+# column types for binary ``COPY``, the binary format has to match the column type exactly
+COPY_TYPES = {
+    'id': 'int8',
+    'level': 'int4',
+    'message': 'text',
+    'pid': 'int4',
+    'time': 'float8',
+    'functionID': 'int4',
+    'loggerID': 'int4',
+    'hostnameID': 'int4',
+    'exceptionID': 'int4',
+    'templateID': 'int4',
+    'args': 'jsonb',
+    'extra': 'jsonb',
+    'tagIDs': 'int4[]',
+    'repeatCount': 'int4',
+    'lastTime': 'float8',
+}
+
+
+def _serialized_json(value: str) -> str:
+    return value
+
+
+class LogEntry(SyncLogEntry):
+
+    @classmethod
+    def insert_with_tags(cls, db: Any, tags: List[LogTag], **kwargs):
+        """
+        Insert an entry and its ``logger_log_tag`` rows without reading anything back, so
+        both statements can be sent without waiting in pipeline mode. The tag rows refer
+        to the new entry by ``currval`` of the id sequence.
+        """
+        ser = cls.serialize_data(kwargs)
+
+        value_list = [f'"{v}"' for v in ser.keys()]
+        params = ', '.join(['%s' for _ in ser.keys()])
+        execute(db, f'''
+            INSERT INTO {cls.table} ({', '.join(value_list)})
+            VALUES ({params})
+        ''', list(ser.values()))
+
+        if len(tags) > 0:
+            execute(db, f'''
+                INSERT INTO logger_log_tag ("logID", "tagID")
+                SELECT currval(pg_get_serial_sequence('{cls.table}', 'id')), unnest(%s::integer[])
+            ''', [[tag.pk for tag in tags]])
+
+    @classmethod
+    def copy_many(cls, db: Any, items: List[Dict[str, Any]], tag_ids: Optional[List[List[int]]]=None) -> List[int]:
+        """
+        Bulk load entries with binary ``COPY``, the ids are allocated from the sequence up
+        front so the tags can be copied into ``logger_log_tag`` right away
+
+        :param items: Entry data like for ``create``
+        :param tag_ids: Optional list of tag ids for every item
+        :return: ids of the new entries in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        execute(
+            db,
+            f"SELECT nextval(pg_get_serial_sequence('{cls.table}', 'id')) AS id FROM generate_series(1, %s);",
+            [len(items)]
+        )
+        ids = [row['id'] for row in db.fetchall()]
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(dict.fromkeys(key for ser in sers for key in ser.keys()))
+        json_keys = [key for key in keys if COPY_TYPES[key] == 'jsonb']
+        columns = ', '.join(['id'] + [f'"{key}"' for key in keys])
+        sql = f'COPY {cls.table} ({columns}) FROM STDIN (FORMAT BINARY)'
+        with traced(sql) as trace, db.copy(sql) as copy:
+            copy.set_types(['int8'] + [COPY_TYPES[key] for key in keys])
+            for pk, ser in zip(ids, sers):
+                # the JSON columns are already serialized, pass them through unchanged
+                for key in json_keys:
+                    if ser.get(key, None) is not None:
+                        ser[key] = Jsonb(ser[key], dumps=_serialized_json)
+                copy.write_row([pk] + [ser.get(key, None) for key in keys])
+            trace.rows = len(ids)
+
+        if tag_ids is not None:
+            sql = 'COPY logger_log_tag ("logID", "tagID") FROM STDIN (FORMAT BINARY)'
+            with traced(sql) as trace, db.copy(sql) as copy:
+                copy.set_types(['int8', 'int4'])
+                for pk, tags in zip(ids, tag_ids):
+                    for tag_id in tags:
+                        copy.write_row((pk, tag_id))
+                trace.rows = sum(len(tags) for tags in tag_ids)
+
+        return ids
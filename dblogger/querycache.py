@@ -0,0 +1,545 @@
+from typing import List, Any, Optional, Dict, Tuple, Iterator, Set
+import asyncio
+import functools
+import json
+import os
+import socket
+import struct
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from logging import getLogger
+
+from . import get_run_mode, connect_sync
+from .models import BaseLogEntry, BaseLogFunction, BaseLogSource, BaseLogLogger, BaseLogHost, BaseLogTag, \
+    BaseLogException
+
+__all__ = [
+    'QueryCache', 'QueryCacheClient', 'encode_entry', 'decode_entry', 'DEFAULT_QUERY_SOCKET_PATH',
+    'DEFAULT_QUERY_SOCKET_MODE'
+]
+
+DEFAULT_QUERY_SOCKET_PATH = '/tmp/dblogger-query.sock'
+
+# only the owner and the group of the socket may query, the log may contain sensitive data
+DEFAULT_QUERY_SOCKET_MODE = 0o660
+
+# Wire format: u32 length prefix (network byte order) followed by a UTF-8 JSON object.
+#
+# requests:  {"op": "range", "from": <timestamp>, "to": <timestamp>, "filters": {...}}
+#            {"op": "follow", "filters": {...}}
+#            filters are ``extra``, ``search`` and ``search_mode`` like for ``LogEntry``
+# responses: {"entries": [...]} pages, a range ends with {"done": true}, follow mode sends
+#            a page whenever new entries arrive, failures are sent as {"error": "..."}
+_FRAME = struct.Struct('!I')
+
+# entries per response page
+PAGE_SIZE = 1000
+
+# number of latest entries a follow subscription starts with
+FOLLOW_BACKLOG = 10
+
+# subscribers that do not read their updates are dropped when this many bytes are buffered
+MAX_SUBSCRIBER_BUFFER = 16 * 1024 * 1024
+
+# requests are small JSON objects, connections sending larger frames are closed
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    payload = json.dumps(message, separators=(',', ':'), default=str).encode('utf-8')
+    return _FRAME.pack(len(payload)) + payload
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    # entry times are naive UTC
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def encode_entry(entry: Any) -> Dict[str, Any]:
+    """
+    Serialize a joined ``LogEntry`` (as returned by the ``load_all_*`` and ``iterate_*``
+    class methods) with its function, source, logger, host, exception and tags
+    """
+    function = getattr(entry, '_function', None)
+    source = getattr(function, '_source', None) if function is not None else None
+    logger = getattr(entry, '_logger', None)
+    hostname = getattr(entry, '_hostname', None)
+    exception = getattr(entry, '_exception', None)
+    tags = getattr(entry, '_tags', None) or []
+
+    return {
+        'id': entry.pk,
+        'level': entry.level,
+        'message': entry.message,
+        'pid': entry.pid,
+        'time': _timestamp(entry.time),
+        'functionID': entry.function_id,
+        'loggerID': entry.logger_id,
+        'hostnameID': entry.hostname_id,
+        'exceptionID': entry.exception_id,
+        'extra': entry.extra,
+        'repeatCount': entry.repeat_count,
+        'lastTime': _timestamp(entry.last_time),
+        'function_name': function.name if function is not None else None,
+        'function_line_number': function.line_number if function is not None else None,
+        'function_sourceID': function.source_id if function is not None else None,
+        'function_source_path': source.path if source is not None else None,
+        'logger_name': logger.name if logger is not None else None,
+        'hostname_name': hostname.name if hostname is not None else None,
+        'exception_traceback': exception.traceback if exception is not None else None,
+        'tags': [[tag.pk, tag.name] for tag in tags],
+    }
+
+
+def decode_entry(row: Dict[str, Any]) -> Tuple[BaseLogEntry, BaseLogLogger, List[BaseLogTag], Optional[BaseLogException]]:
+    """
+    De-serialize an entry of a response page
+
+    :return: Tuple of entry, logger, tags and exception like ``logtail`` renders them, the
+             joined models are cached on the entry as well
+    """
+    entry = BaseLogEntry(rowdata=row)
+    function = BaseLogFunction(rowdata={
+        'id': row['functionID'],
+        'name': row['function_name'],
+        'lineNumber': row['function_line_number'],
+        'sourceID': row['function_sourceID']
+    })
+    setattr(function, '_source', BaseLogSource(rowdata={
+        'id': row['function_sourceID'],
+        'path': row['function_source_path']
+    }))
+    logger = BaseLogLogger(rowdata={'id': row['loggerID'], 'name': row['logger_name']})
+    hostname = BaseLogHost(rowdata={'id': row['hostnameID'], 'name': row['hostname_name']})
+    tags = [BaseLogTag(rowdata={'id': pk, 'name': name}) for pk, name in row['tags']]
+    exception: Optional[BaseLogException] = None
+    if row['exceptionID'] is not None:
+        exception = BaseLogException(rowdata={'id': row['exceptionID'], 'traceback': row['exception_traceback']})
+
+    setattr(entry, '_function', function)
+    setattr(entry, '_logger', logger)
+    setattr(entry, '_hostname', hostname)
+    setattr(entry, '_tags', tags)
+    setattr(entry, '_exception', exception)
+    return entry, logger, tags, exception
+
+
+def filter_key(filters: Dict[str, Any]) -> str:
+    return json.dumps(
+        [filters.get('extra', None), filters.get('search', None), filters.get('search_mode', 'substring')],
+        sort_keys=True,
+        default=str
+    )
+
+
+class Subscription:
+    """
+    Follow mode for one filter set, polled once for all subscribers
+    """
+
+    filters: Dict[str, Any]
+    writers: Set[asyncio.StreamWriter]
+    last_id: int
+    backlog: List[Dict[str, Any]]
+    ready: asyncio.Event
+    task: Optional[asyncio.Task] = None
+
+    def __init__(self, filters: Dict[str, Any]):
+        self.filters = filters
+        self.writers = set()
+        self.last_id = 0
+        self.backlog = []
+        self.ready = asyncio.Event()
+
+
+class QueryCache:
+    """
+    Query daemon for ``logtail`` (see ``bin/dblogger_querycache``). Identical range queries
+    that run at the same time are executed once, results of closed windows (ending more than
+    ``settle`` seconds ago) are kept in an LRU cache, and all clients following the log with
+    the same filters share one poll of the DB.
+    """
+
+    # db config and connection
+    db: Any = None
+    db_config: str
+    run_mode: str
+    db_lock: asyncio.Lock
+
+    # config
+    socket_path: str
+    socket_mode: int
+    max_bytes: int
+    settle: float
+    poll_interval: float
+
+    # state
+    windows: 'OrderedDict[Tuple[float, float, str], List[bytes]]'
+    size: int
+    inflight: Dict[Tuple[float, float, str], asyncio.Future]
+    subscriptions: Dict[str, Subscription]
+
+    # counters
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        db_config: str,
+        socket_path: str=DEFAULT_QUERY_SOCKET_PATH,
+        max_bytes: int=256 * 1024 * 1024,
+        settle: float=60.0,
+        poll_interval: float=0.5,
+        run_mode: Optional[str]=None,
+        socket_mode: int=DEFAULT_QUERY_SOCKET_MODE
+    ):
+        """
+        Initialize the query cache
+
+        :param db_config: DB connection URI
+        :param socket_path: Path of the Unix domain socket to listen on
+        :param max_bytes: Size of the cached responses after which the least recently used
+                          windows are evicted
+        :param settle: Seconds after which a window is considered closed, entries may still
+                       arrive late for buffered or group committed handlers before that
+        :param poll_interval: Seconds between polls for follow mode
+        :param run_mode: ``async``, ``sync``, ``psycopg`` or ``sqlite``, auto-detected if not set
+        :param socket_mode: Permissions of the socket, defaults to read and write access for
+                            the owner and the group of the daemon
+        """
+        if run_mode is None:
+            run_mode = get_run_mode()
+
+        self.db_config = db_config
+        self.run_mode = run_mode
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.max_bytes = max_bytes
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.windows = OrderedDict()
+        self.size = 0
+        self.inflight = {}
+        self.subscriptions = {}
+        self.hits = 0
+        self.misses = 0
+
+        if run_mode == 'async':
+            from .async_models import LogEntry
+        elif run_mode == 'psycopg':
+            from .psycopg_models import LogEntry
+        elif run_mode == 'sqlite':
+            from .sqlite_models import LogEntry
+        else:
+            from .sync_models import LogEntry
+        self.entry_model = LogEntry
+
+    async def run(self):
+        self.db_lock = asyncio.Lock()
+        await self.connect()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, self.socket_mode)
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.close()
+            for subscription in self.subscriptions.values():
+                if subscription.task is not None:
+                    subscription.task.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def connect(self):
+        if self.run_mode == 'async':
+            from asyncpg import create_pool
+            self.db = await create_pool(dsn=self.db_config)
+        else:
+            self.db = connect_sync(self.db_config, self.run_mode)
+
+    async def query(self, kind: str, **kwargs) -> List[Any]:
+        """
+        Run a ``LogEntry`` query: ``range`` (``iterate_with_date``), ``latest``
+        (``load_all_with_date`` with a limit) or ``after`` (``load_all_after_id``)
+        """
+        if self.run_mode == 'async':
+            async with self.db.acquire() as db:
+                if kind == 'range':
+                    async with db.transaction():
+                        return [entry async for entry in self.entry_model.iterate_with_date(db, **kwargs)]
+                if kind == 'latest':
+                    return await self.entry_model.load_all_with_date(db, limit=FOLLOW_BACKLOG, **kwargs)
+                return await self.entry_model.load_all_after_id(db, **kwargs)
+
+        # one connection, the sync drivers block so the queries run in the executor one at a time
+        async with self.db_lock:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, functools.partial(self.query_sync, kind, **kwargs))
+
+    def query_sync(self, kind: str, **kwargs) -> List[Any]:
+        if getattr(self.db, 'closed', False):
+            self.db = connect_sync(self.db_config, self.run_mode)
+
+        cursor = self.db.cursor()
+        try:
+            if kind == 'range':
+                result = list(self.entry_model.iterate_with_date(cursor, **kwargs))
+            elif kind == 'latest':
+                result = self.entry_model.load_all_with_date(cursor, limit=FOLLOW_BACKLOG, **kwargs)
+            else:
+                result = self.entry_model.load_all_after_id(cursor, **kwargs)
+        finally:
+            # do not keep a snapshot open between polls
+            self.db.rollback()
+        return result
+
+    async def load_range(self, from_ts: float, to_ts: float, filters: Dict[str, Any]) -> List[bytes]:
+        """
+        Response pages for a time window, from the cache if the window is closed
+        """
+        key = (from_ts, to_ts, filter_key(filters))
+        cached = self.windows.get(key, None)
+        if cached is not None:
+            self.windows.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        pending = self.inflight.get(key, None)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[key] = future
+        try:
+            entries = await self.query(
+                'range',
+                from_date=datetime.fromtimestamp(from_ts, timezone.utc),
+                to_date=datetime.fromtimestamp(to_ts, timezone.utc),
+                extra=filters.get('extra', None),
+                search=filters.get('search', None),
+                search_mode=filters.get('search_mode', 'substring')
+            )
+            pages = [
+                encode_frame({'entries': [encode_entry(entry) for entry in entries[start:start + PAGE_SIZE]]})
+                for start in range(0, len(entries), PAGE_SIZE)
+            ]
+            pages.append(encode_frame({'done': True}))
+            future.set_result(pages)
+        except BaseException as e:
+            # waiting clients get an error if the owner is cancelled, they would hang otherwise
+            if isinstance(e, asyncio.CancelledError):
+                future.set_exception(RuntimeError('The query was cancelled'))
+            else:
+                future.set_exception(e)
+            # mark the exception as retrieved if nobody else waits for it
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+
+        if to_ts <= time.time() - self.settle:
+            self.store(key, pages)
+        return pages
+
+    def store(self, key: Tuple[float, float, str], pages: List[bytes]):
+        size = sum(len(page) for page in pages)
+        if size > self.max_bytes:
+            return
+        self.windows[key] = pages
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.windows.popitem(last=False)
+            self.size -= sum(len(page) for page in evicted)
+
+    async def subscribe(self, writer: asyncio.StreamWriter, filters: Dict[str, Any]):
+        key = filter_key(filters)
+        subscription = self.subscriptions.get(key, None)
+        if subscription is None:
+            subscription = Subscription(filters)
+            self.subscriptions[key] = subscription
+            subscription.task = asyncio.ensure_future(self.poll(key, subscription))
+        await subscription.ready.wait()
+
+        if len(subscription.backlog) > 0:
+            writer.write(encode_frame({'entries': subscription.backlog}))
+        subscription.writers.add(writer)
+
+    def unsubscribe(self, writer: asyncio.StreamWriter, filters: Dict[str, Any]):
+        key = filter_key(filters)
+        subscription = self.subscriptions.get(key, None)
+        if subscription is None:
+            return
+        subscription.writers.discard(writer)
+        if len(subscription.writers) == 0 and subscription.ready.is_set():
+            subscription.task.cancel()
+            del self.subscriptions[key]
+
+    async def poll(self, key: str, subscription: Subscription):
+        filters = dict(
+            extra=subscription.filters.get('extra', None),
+            search=subscription.filters.get('search', None),
+            search_mode=subscription.filters.get('search_mode', 'substring')
+        )
+        try:
+            latest = await self.query('latest', **filters)
+            latest.sort(key=lambda entry: (entry.time, entry.pk))
+            subscription.backlog = [encode_entry(entry) for entry in latest]
+            subscription.last_id = max([entry.pk for entry in latest], default=0)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            getLogger(__name__).exception('Could not load the latest entries')
+        finally:
+            subscription.ready.set()
+
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if len(subscription.writers) == 0:
+                self.subscriptions.pop(key, None)
+                return
+            try:
+                entries = await self.query('after', lowest_id=subscription.last_id, **filters)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                getLogger(__name__).exception('Could not poll for new entries')
+                continue
+            if len(entries) == 0:
+                continue
+
+            subscription.last_id = entries[-1].pk
+            encoded = [encode_entry(entry) for entry in entries]
+            subscription.backlog = (subscription.backlog + encoded)[-FOLLOW_BACKLOG:]
+            frame = encode_frame({'entries': encoded})
+            for writer in list(subscription.writers):
+                writer.write(frame)
+                if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                    subscription.writers.discard(writer)
+                    writer.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME.size)
+                length, = _FRAME.unpack(header)
+                if length > MAX_REQUEST_SIZE:
+                    writer.write(encode_frame({'error': 'Request too large'}))
+                    return
+                request = json.loads((await reader.readexactly(length)).decode('utf-8'))
+                filters = request.get('filters', None) or {}
+
+                if request.get('op') == 'range':
+                    try:
+                        pages = await self.load_range(float(request['from']), float(request['to']), filters)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        writer.write(encode_frame({'error': str(e)}))
+                        continue
+                    for page in pages:
+                        writer.write(page)
+                        await writer.drain()
+                elif request.get('op') == 'follow':
+                    await self.subscribe(writer, filters)
+                    try:
+                        # the client only closes the connection from now on
+                        await reader.read()
+                    finally:
+                        self.unsubscribe(writer, filters)
+                    return
+                else:
+                    writer.write(encode_frame({'error': 'Unknown operation'}))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class QueryCacheClient:
+    """
+    Blocking client for the query cache daemon, used by ``logtail --cache``
+    """
+
+    socket_path: str
+    sock: Optional[socket.socket] = None
+
+    def __init__(self, socket_path: str=DEFAULT_QUERY_SOCKET_PATH):
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, request: Dict[str, Any]):
+        if self.sock is None:
+            self.connect()
+        self.sock.sendall(encode_frame(request))
+
+    def receive(self) -> Dict[str, Any]:
+        length, = _FRAME.unpack(self.read_exactly(_FRAME.size))
+        message = json.loads(self.read_exactly(length).decode('utf-8'))
+        if 'error' in message:
+            raise RuntimeError(f'Query cache error: {message["error"]}')
+        return message
+
+    def read_exactly(self, size: int) -> bytes:
+        chunks: List[bytes] = []
+        while size > 0:
+            chunk = self.sock.recv(min(size, 1024 * 1024))
+            if len(chunk) == 0:
+                raise ConnectionError('Query cache closed the connection')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def load_range(
+        self,
+        from_date: datetime,
+        to_date: datetime,
+        extra: Optional[Dict[str, Any]]=None,
+        search: Optional[str]=None,
+        search_mode: str='substring'
+    ) -> Iterator[Tuple[BaseLogEntry, BaseLogLogger, List[BaseLogTag], Optional[BaseLogException]]]:
+        """
+        Entries with ``from_date <= time < to_date`` ordered by time, see ``decode_entry``
+        """
+        self.send({
+            'op': 'range',
+            'from': from_date.timestamp(),
+            'to': to_date.timestamp(),
+            'filters': {'extra': extra, 'search': search, 'search_mode': search_mode}
+        })
+        while True:
+            message = self.receive()
+            if message.get('done', False):
+                return
+            for row in message['entries']:
+                yield decode_entry(row)
+
+    def follow(
+        self,
+        extra: Optional[Dict[str, Any]]=None,
+        search: Optional[str]=None,
+        search_mode: str='substring'
+    ) -> Iterator[List[Tuple[BaseLogEntry, BaseLogLogger, List[BaseLogTag], Optional[BaseLogException]]]]:
+        """
+        The latest entries followed by every batch of new entries, does not return
+        """
+        self.send({'op': 'follow', 'filters': {'extra': extra, 'search': search, 'search_mode': search_mode}})
+        while True:
+            yield [decode_entry(row) for row in self.receive()['entries']]
@@ -0,0 +1,149 @@
+from typing import List, Optional, Dict
+import random
+import time
+
+from logging import LogRecord, makeLogRecord
+
+__all__ = ['RateLimiter', 'callsite_key']
+
+
+def callsite_key(record: LogRecord) -> str:
+    """
+    Key identifying the code location a record was logged from, same format as the
+    function cache key of the handlers
+    """
+    return f'{record.name}.{record.funcName}:{record.lineno}@{record.pathname}'
+
+
+class RateLimiter:
+    """
+    Per-callsite token bucket rate limiting and per-level probabilistic sampling.
+
+    Records that are dropped are counted per callsite and periodically replaced by
+    a summary record ("suppressed N similar records") from the same callsite.
+    """
+
+    # config
+    rate: Optional[float]
+    burst: float
+    sample_rates: Dict[int, float]
+    summary_interval: float
+
+    # token buckets, callsite key -> [tokens, last update]
+    buckets: Dict[str, List[float]]
+
+    # callsite key -> [suppressed count since last summary, last suppressed record]
+    pending: Dict[str, list]
+    next_summary: float
+
+    # counters
+    rate_limited: Dict[str, int]
+    sampled: Dict[str, int]
+
+    def __init__(
+        self,
+        rate: Optional[float]=None,
+        burst: int=10,
+        sample_rates: Optional[Dict[int, float]]=None,
+        summary_interval: float=60.0
+    ):
+        """
+        Initialize rate limiter
+
+        :param rate: Records per second allowed per callsite, ``None`` disables rate limiting
+        :param burst: Number of records a callsite may log at once before being limited
+        :param sample_rates: Probability to keep a record by level, e.g. ``{DEBUG: 0.1}``,
+                             levels that are not in the dict are always kept
+        :param summary_interval: Seconds between summary records for suppressed callsites
+        """
+        self.rate = rate
+        self.burst = float(burst)
+        self.sample_rates = dict(sample_rates) if sample_rates is not None else {}
+        self.summary_interval = summary_interval
+        self.buckets = {}
+        self.pending = {}
+        self.next_summary = time.time() + summary_interval
+        self.rate_limited = {}
+        self.sampled = {}
+
+    def allow(self, record: LogRecord) -> bool:
+        """
+        Check if a record should be written, records that are not allowed are
+        counted and will show up in the next summary
+        """
+        key: Optional[str] = None
+
+        sample_rate = self.sample_rates.get(record.levelno, None)
+        if sample_rate is not None and random.random() >= sample_rate:
+            key = callsite_key(record)
+            self.sampled[key] = self.sampled.get(key, 0) + 1
+            self.suppress(key, record)
+            return False
+
+        if self.rate is None:
+            return True
+
+        if key is None:
+            key = callsite_key(record)
+        now = record.created
+        bucket = self.buckets.get(key, None)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self.buckets[key] = bucket
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True
+
+        self.rate_limited[key] = self.rate_limited.get(key, 0) + 1
+        self.suppress(key, record)
+        return False
+
+    def suppress(self, key: str, record: LogRecord):
+        item = self.pending.get(key, None)
+        if item is None:
+            self.pending[key] = [1, record]
+        else:
+            item[0] += 1
+            item[1] = record
+
+    def summaries(self, now: Optional[float]=None, force: bool=False) -> List[LogRecord]:
+        """
+        Build summary records for all callsites that suppressed records since the
+        last summary, if the summary interval has passed (or ``force`` is set)
+        """
+        if now is None:
+            now = time.time()
+        if not force and now < self.next_summary:
+            return []
+        self.next_summary = now + self.summary_interval
+
+        result: List[LogRecord] = []
+        for count, record in self.pending.values():
+            summary = makeLogRecord(record.__dict__)
+            summary.msg = 'suppressed %d similar records'
+            summary.args = (count, )
+            summary.created = now
+            summary.msecs = (now - int(now)) * 1000
+            summary.exc_info = None
+            summary.exc_text = None
+            summary.stack_info = None
+            result.append(summary)
+        self.pending = {}
+        return result
+
+    def next_summary_due(self) -> Optional[float]:
+        """
+        Time of the next summary if records were suppressed since the last one,
+        ``None`` if there is nothing to summarize
+        """
+        if not self.pending:
+            return None
+        return self.next_summary
+
+    @property
+    def suppressed_total(self) -> int:
+        return sum(self.rate_limited.values()) + sum(self.sampled.values())
@@ -0,0 +1,73 @@
+from typing import Dict, Tuple, Optional
+import logging
+import sys
+import time
+import traceback
+
+__all__ = ['RollupCounter']
+
+
+class RollupCounter:
+    """
+    In-memory entry counters per (bucket, logger, host, function, level) that are
+    periodically upserted into the ``logger_rollup`` table by the handlers.
+    """
+
+    # config
+    bucket_size: int
+    flush_interval: float
+
+    # (bucket start, logger id, hostname id, function id, level) -> count
+    counters: Dict[Tuple[float, int, int, int, int], int]
+    next_flush: float
+
+    def __init__(self, flush_interval: float=60.0, bucket_size: int=60):
+        """
+        Initialize rollup counters
+
+        :param flush_interval: Seconds between upserts into the rollup table
+        :param bucket_size: Size of the time buckets in seconds, defaults to one minute
+        """
+        self.bucket_size = bucket_size
+        self.flush_interval = flush_interval
+        self.counters = {}
+        self.next_flush = time.time() + flush_interval
+
+    def add(self, created: float, logger_id: int, hostname_id: int, function_id: int, level: int, count: int=1):
+        bucket = float(int(created // self.bucket_size) * self.bucket_size)
+        key = (bucket, logger_id, hostname_id, function_id, level)
+        self.counters[key] = self.counters.get(key, 0) + count
+
+    def due(self, now: Optional[float]=None) -> bool:
+        """
+        Check if the flush interval has passed and there is something to flush
+        """
+        if now is None:
+            now = time.time()
+        return len(self.counters) > 0 and now >= self.next_flush
+
+    def take(self) -> Dict[Tuple[float, int, int, int, int], int]:
+        """
+        Remove and return all counters
+        """
+        counters = self.counters
+        self.counters = {}
+        self.next_flush = time.time() + self.flush_interval
+        return counters
+
+    def restore(self, counters: Dict[Tuple[float, int, int, int, int], int]):
+        """
+        Put counters back after a failed upsert so they are retried with the next flush
+        """
+        for key, count in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + count
+
+
+def report_flush_error():
+    """
+    Report a failed upsert of the rollup counters on ``stderr`` like ``Handler.handleError``
+    does, the entries themselves have been written and are not affected
+    """
+    if logging.raiseExceptions and sys.stderr:
+        sys.stderr.write('--- Logging error: could not flush the rollup counters ---\n')
+        traceback.print_exc(file=sys.stderr)
@@ -0,0 +1,220 @@
+from typing import List, Any, Optional, Dict, Tuple, FrozenSet
+import socket
+import threading
+
+from logging import Handler, NOTSET, ERROR, LogRecord
+
+from . import sqlite_models
+from .sqlite_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogException, LogTemplate, \
+    connect, create_schema
+from .sqlite_models.model import dict_row
+from .ratelimit import RateLimiter
+from .coalesce import Coalescer
+from .rollup import RollupCounter
+from .durability import Durability
+from .cache import LRUCache, TAG_CACHE_SIZE
+from .sync_handler import DBLogHandler as SyncDBLogHandler
+
+__all__ = ['DBLogHandler']
+
+
+class DBLogHandler(SyncDBLogHandler):
+    """
+    Log handler for SQLite, for local development and edge devices without a PostgreSQL
+    server. The database runs in WAL mode and records are committed in batches: records
+    below ``ERROR`` are grouped into one transaction per half second, errors commit the
+    open batch right away (see ``Durability``).
+    """
+
+    models = sqlite_models
+
+    # caches, not shared with the PostgreSQL handlers as the ids belong to another database
+    src_cache: Dict[str, LogSource] = {}
+    func_cache: Dict[str, LogFunction] = {}
+    logger_cache: Dict[str, LogLogger] = {}
+    host_cache: Dict[str, LogHost] = {}
+    # tags and tag sets may be unique per request, these caches are bounded
+    tag_cache: Dict[str, LogTag] = LRUCache(TAG_CACHE_SIZE)
+    exception_cache: Dict[str, LogException] = {}
+    template_cache: Dict[str, LogTemplate] = {}
+    tag_set_cache: Dict[FrozenSet[str], List[int]] = LRUCache(TAG_CACHE_SIZE)
+    tag_list_cache: Dict[FrozenSet[str], List[LogTag]] = LRUCache(TAG_CACHE_SIZE)
+    # (function_id, logger_id, hostname_id) by logger name and record code location
+    callsite_cache: Dict[Tuple[str, str, str, int, str], Tuple[int, int, int]] = {}
+
+    # internal state
+    durability: Durability
+    closed: bool = False
+
+    def __init__(
+        self, name: str,
+        db_name: Optional[str]=None,
+        db: Optional[Any]=None,
+        db_user: Optional[str]=None,
+        db_password: Optional[str]=None,
+        db_host: str='localhost',
+        db_port: int=5432,
+        level: int = NOTSET,
+        message_templates: bool = False,
+        extra_fields: Optional[List[str]] = None,
+        tag_storage: str = 'table',
+        rate_limiter: Optional[RateLimiter] = None,
+        coalescer: Optional[Coalescer] = None,
+        rollup: Optional[RollupCounter] = None,
+        durability: Optional[Durability] = None
+    ):
+        """
+        Initialize new SQLite logging handler, the schema is created if it does not exist
+
+        :param name: Name of the logger in the DB
+        :param db_name: Path of the database file or a ``sqlite:///`` DSN (exclusive with ``db``)
+        :param db: Connection from ``dblogger.sqlite_models.connect`` (exclusive with ``db_name``)
+        :param db_user: Ignored, accepted so the PostgreSQL configuration can be reused
+        :param db_password: Ignored
+        :param db_host: Ignored
+        :param db_port: Ignored
+        :param level: Log level, defaults to ``NOTSET`` which inherits the level from the logger
+        :param message_templates: Store the message template once and only the arguments
+                                  with the entry instead of the formatted message
+        :param extra_fields: Names of ``extra`` attributes of the log record to store in
+                             the ``extra`` JSON column of the entry (e.g. ``['request_id']``)
+        :param tag_storage: ``table`` to store one ``logger_log_tag`` row per tag or ``array``
+                            to store the sorted tag ids as JSON in the ``tagIDs`` column
+        :param rate_limiter: Per-callsite rate limiting and sampling, suppressed records are
+                             replaced by periodic summary entries (optional)
+        :param coalescer: Fold identical records within a time window into one entry with
+                          a repeat count (optional)
+        :param rollup: Count entries per minute, logger, host, function and level and
+                       periodically add the counts to the ``logger_rollup`` table (optional)
+        :param durability: Batching of the commits, defaults to a group commit of 0.5 seconds
+                           for records below ``ERROR``. ``synchronous_commit`` has no effect
+                           (WAL mode never waits for an ``fsync`` on commit), ``staging`` is
+                           not supported.
+        """
+        if tag_storage not in ('table', 'array'):
+            raise ValueError('`tag_storage` has to be one of `table` or `array`')
+        if durability is None:
+            durability = Durability(level=ERROR, group_commit=0.5)
+        if durability.staging:
+            raise ValueError('The SQLite handler does not support `staging`')
+
+        if db is not None:
+            self.db = db
+        else:
+            if db_name is None:
+                raise ValueError('Define one of `db_name` or `db`')
+            self.db = connect(db_name)
+        create_schema(self.db)
+
+        self.logger_name = name
+        self.hostname = socket.gethostname()
+        self.message_templates = message_templates
+        self.extra_fields = list(extra_fields) if extra_fields is not None else []
+        self.tag_storage = tag_storage
+        self.rate_limiter = rate_limiter
+        self.coalescer = coalescer
+        self.rollup = rollup
+        self.durability = durability
+        self.createLock()
+        # the PostgreSQL setup of the sync handler does not apply
+        Handler.__init__(self, level=level)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.coalescer is not None:
+                if self.flush_timer is not None:
+                    self.flush_timer.cancel()
+                    self.flush_timer = None
+                for item in self.coalescer.flush():
+                    self.process(item)
+            if self.rate_limiter is not None:
+                if self.summary_timer is not None:
+                    self.summary_timer.cancel()
+                    self.summary_timer = None
+                for summary in self.rate_limiter.summaries(force=True):
+                    self.write(summary)
+            if not self.closed:
+                if self.rollup is not None:
+                    self.flush_rollup(self.cursor())
+                if self.uncommitted > 0:
+                    self.commit_pending()
+                self.closed = True
+        finally:
+            self.release()
+        Handler.close(self)
+
+    def cursor(self) -> Any:
+        cursor = self.db.cursor()
+        cursor.row_factory = dict_row
+        return cursor
+
+    def commit(self, cursor: Any, relaxed: bool):
+        """
+        Commit the transaction of the current record, relaxed records are committed
+        together with the records of the next ``group_commit`` seconds
+        """
+        if not relaxed:
+            self.commit_pending()
+            return
+
+        self.uncommitted += 1
+        if self.durability.group_commit <= 0:
+            self.commit_pending()
+        elif self.commit_timer is None:
+            self.commit_timer = threading.Timer(self.durability.group_commit, self.commit_group)
+            self.commit_timer.daemon = True
+            self.commit_timer.start()
+
+    def commit_pending(self):
+        if self.commit_timer is not None:
+            self.commit_timer.cancel()
+            self.commit_timer = None
+        self.db.commit()
+        self.uncommitted = 0
+
+    def commit_group(self):
+        self.acquire()
+        try:
+            self.commit_timer = None
+            if self.uncommitted > 0 and not self.closed:
+                try:
+                    self.commit_pending()
+                except Exception:
+                    self.rollback()
+        finally:
+            self.release()
+
+    def rollback(self):
+        """
+        Roll back the open transaction, the records of an open commit group are lost and
+        cached rows that may have been created in the transaction are forgotten
+        """
+        if self.commit_timer is not None:
+            self.commit_timer.cancel()
+            self.commit_timer = None
+        self.db.rollback()
+        self.durability.lost += self.uncommitted
+        self.uncommitted = 0
+
+        for cache in (
+            self.src_cache, self.func_cache, self.logger_cache, self.host_cache,
+            self.tag_cache, self.exception_cache, self.template_cache, self.tag_set_cache,
+            self.tag_list_cache, self.callsite_cache
+        ):
+            cache.clear()
+
+    def write(self, record: LogRecord):
+        if self.closed:
+            raise RuntimeWarning('DB handle was closed, can not continue')
+
+        try:
+            self.write_entry(self.cursor(), record)
+        except Exception:
+            self.rollback()
+            self.handleError(record)
+
+    def insert(self, cursor: Any, data: Dict[str, Any], tags: List[LogTag], relaxed: bool):
+        entry = self.models.LogEntry.create(cursor, **data)
+        entry.add_tags(cursor, tags)
+        self.commit(cursor, relaxed)
@@ -0,0 +1,14 @@
+# SQLite backend for local development and edge devices, same API as the sync models
+from .model import SqliteModel, connect, create_schema
+from .tag import LogTag
+from .entry import LogEntry
+from .function import LogFunction
+from .host import LogHost
+from .logger import LogLogger
+from .source import LogSource
+from .exception import LogException
+from .template import LogTemplate
+from .rollup import LogRollup
+from .import_state import LogImport
+
+__all__ = ['LogEntry', 'LogFunction', 'LogHost', 'LogLogger', 'LogSource', 'LogTag', 'LogException', 'LogTemplate', 'LogRollup', 'LogImport', 'connect', 'create_schema']
@@ -0,0 +1,560 @@
+from typing import List, Dict, Any, Generator, Optional, Tuple
+import json
+
+from datetime import datetime
+
+from dblogger.models.entry import BaseLogEntry, SEARCH_MODES, get_search_value, get_sql_for_template_counts, \
+    get_sql_for_columns, get_sql_for_time_counts, get_sql_for_dimension_counts
+from dblogger.columnar import LogColumns, DIMENSIONS, arrays_from_rows, unique_ids
+
+from .model import SqliteModel, MAX_PARAMETERS, execute
+from .tag import LogTag
+from .function import LogFunction
+from .logger import LogLogger
+from .host import LogHost
+from .source import LogSource
+from .exception import LogException
+from .template import LogTemplate
+
+__all__ = ['LogEntry']
+
+
+def deserialize_joined(entry: "LogEntry", result: Dict[str, Any]):
+    function = LogFunction(rowdata={
+        "id": result['functionID'],
+        "name": result['function_name'],
+        "lineNumber": result['function_line_number'],
+        "sourceID": result['function_sourceID']
+    })
+    source = LogSource(rowdata={
+        "id": result['function_sourceID'],
+        "path": result['function_source_path']
+    })
+    logger = LogLogger(rowdata={
+        "id": result['loggerID'],
+        "name": result['logger_name']
+    })
+    hostname = LogHost(rowdata={
+        "id": result['hostnameID'],
+        "name": result['hostname_name']
+    })
+    setattr(function, '_source', source)
+    setattr(entry, '_function', function)
+    setattr(entry, '_logger', logger)
+    setattr(entry, '_hostname', hostname)
+    if result['exceptionID'] is not None:
+        exception = LogException(rowdata={
+            "id": result['exceptionID'],
+            "traceback": result['exception_traceback']
+        })
+        setattr(entry, '_exception', exception)
+    if result['templateID'] is not None:
+        template = LogTemplate(rowdata={
+            "id": result['templateID'],
+            "template": result['template_text']
+        })
+        setattr(entry, '_template', template)
+    if result['tagIDs'] is not None:
+        tag_list = result['tag_list']
+        if isinstance(tag_list, str):
+            tag_list = json.loads(tag_list)
+        setattr(entry, '_tags', [LogTag(rowdata=tag) for tag in tag_list])
+
+
+def get_sql_for_entries(where_clause: str, limit: Optional[int]=None, after_id: bool=False):
+    """
+    SQLite version of ``get_sql_for_entry_with_date`` and ``get_sql_for_entry_after_id``,
+    the tags of array mode entries are aggregated with the JSON1 functions
+    """
+    if after_id:
+        order = 'le.id ASC'
+    else:
+        order = f'le."time" {"ASC" if limit is None else "DESC"}, le.id {"ASC" if limit is None else "DESC"}'
+
+    return f'''
+        SELECT
+            le.id, le.level, le.message, le.pid, le.time,
+            le."functionID", le."loggerID", le."hostnameID", le."exceptionID",
+            le."templateID", le.args, le.extra, le."tagIDs",
+            le."repeatCount", le."lastTime",
+            CASE WHEN le."tagIDs" IS NULL THEN NULL ELSE (
+                SELECT json_group_array(json_object('id', t.id, 'name', t.name))
+                FROM {LogTag.table} t
+                WHERE t.id IN (SELECT value FROM json_each(le."tagIDs"))
+            ) END as tag_list,
+            lf."name" as function_name,
+            lf."lineNumber" as function_line_number,
+            lf."sourceID" as "function_sourceID",
+            ls.path as function_source_path,
+            ll."name" as logger_name,
+            lh."name" as hostname_name,
+            lx.traceback as exception_traceback,
+            lt.template as template_text
+        FROM {LogEntry.table} le
+        LEFT JOIN logger_function lf ON lf.id = le."functionID"
+        LEFT JOIN logger_source ls ON ls.id = lf."sourceID"
+        LEFT JOIN {LogLogger.table} ll ON ll.id = le."loggerID"
+        LEFT JOIN {LogHost.table} lh ON lh.id = le."hostnameID"
+        LEFT JOIN {LogException.table} lx ON lx.id = le."exceptionID"
+        LEFT JOIN {LogTemplate.table} lt ON lt.id = le."templateID"
+        {'WHERE' if len(where_clause) > 0 else ''} {where_clause}
+        ORDER BY {order}
+        {f'LIMIT {int(limit)}' if limit is not None else ''}
+    '''
+
+
+def get_sql_for_time_bucket(seconds: int) -> str:
+    """
+    Start of the ``seconds`` wide time bucket of an entry, ``floor`` is only available if
+    SQLite was built with the math functions (entry times are positive so truncating works)
+    """
+    return f'CAST(le."time" / {int(seconds)} AS INTEGER) * {int(seconds)}'
+
+
+def get_filters(
+    extra: Optional[Dict[str, Any]],
+    search: Optional[str],
+    search_mode: str
+) -> Tuple[List[str], List[Any]]:
+    """
+    Conditions for the ``extra`` and ``search`` filters. Extra fields are compared one by one
+    with ``json_extract`` (nested objects have to match exactly instead of being contained),
+    the search is a ``LIKE`` which is case-insensitive for ASCII. SQLite has no full text
+    search without FTS5, so only ``substring`` searches are supported.
+    """
+    where_clause: List[str] = []
+    values: List[Any] = []
+    if extra is not None:
+        for key, value in extra.items():
+            where_clause.append('json_extract(le.extra, ?) = json_extract(?, \'$\')')
+            values.append('$."' + key.replace('"', '\\"') + '"')
+            values.append(json.dumps(value))
+    if search is not None:
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f'`mode` has to be one of {", ".join(SEARCH_MODES)}')
+        if search_mode != 'substring':
+            raise ValueError('SQLite only supports `substring` searches')
+        # entries stored in template mode have no message, their template is searched instead
+        where_clause.append(
+            "(le.message LIKE ? ESCAPE '\\' OR le.\"templateID\" IN "
+            "(SELECT id FROM logger_template WHERE template LIKE ? ESCAPE '\\'))"
+        )
+        values.extend([get_search_value(search, search_mode)] * 2)
+    return where_clause, values
+
+
+class LogEntry(BaseLogEntry, SqliteModel):
+
+    def deserialize(self, rowdata: Dict) -> None:
+        super().deserialize(rowdata)
+        if isinstance(self.tag_ids, str):
+            self.tag_ids = json.loads(self.tag_ids)
+
+    @classmethod
+    def serialize_data(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        result = super().serialize_data(data)
+        if 'tagIDs' in result:
+            result['tagIDs'] = json.dumps(result['tagIDs'])
+        return result
+
+    @classmethod
+    def load_all_with_date(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> List["LogEntry"]:
+        """
+        Load entries in a time range or the latest ``limit`` entries
+
+        :param extra: Only load entries whose extra fields have all of these values
+        :param search: Only load entries whose message contains this text
+        :param search_mode: Only ``substring`` is supported by SQLite
+        """
+        if from_date is None and to_date is None and limit is None:
+            raise ValueError('Define at least one of `from_date`, `to_date` or `limit`')
+        where_clause = []
+        values = []
+        if from_date is not None:
+            where_clause.append('"time" > ?')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('"time" < ?')
+            values.append(to_date.timestamp())
+        filters, filter_values = get_filters(extra, search, search_mode)
+
+        execute(db, get_sql_for_entries(' AND '.join(where_clause + filters), limit), values + filter_values)
+
+        entries = []
+        for result in db.fetchall():
+            entry = cls(rowdata=result)
+            deserialize_joined(entry, result)
+            entries.append(entry)
+        return entries
+
+    @classmethod
+    def iterate_with_date(
+        cls,
+        db: Any,
+        from_date: datetime,
+        to_date: datetime,
+        batch_size: int = 5000,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> Generator["LogEntry", None, None]:
+        """
+        Stream all entries with ``from_date <= time < to_date`` in batches, SQLite cursors
+        step through the result so it is never loaded at once. Tags are prefetched per batch
+        on a second cursor of the same connection.
+
+        :param extra: Only load entries whose extra fields have all of these values
+        :param search: Only load entries whose message contains this text
+        :param search_mode: Only ``substring`` is supported by SQLite
+        """
+        where_clause = ['"time" >= ?', '"time" < ?']
+        values: List[Any] = [from_date.timestamp(), to_date.timestamp()]
+        filters, filter_values = get_filters(extra, search, search_mode)
+        execute(db, get_sql_for_entries(' AND '.join(where_clause + filters)), values + filter_values)
+
+        tag_cursor = db.connection.cursor()
+        while True:
+            results = db.fetchmany(batch_size)
+            if len(results) == 0:
+                break
+
+            entries = []
+            for result in results:
+                entry = cls(rowdata=result)
+                deserialize_joined(entry, result)
+                entries.append(entry)
+            cls.prefetch_tags(tag_cursor, entries)
+            yield from entries
+
+    @classmethod
+    def load_columns(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> LogColumns:
+        """
+        Load entries with ``from_date <= time < to_date`` as NumPy column arrays (needs
+        ``numpy``), the rows are read as tuples and converted column by column.
+
+        :param extra: Only load entries whose extra fields have all of these values
+        :param search: Only load entries whose message contains this text
+        :param search_mode: Only ``substring`` is supported by SQLite
+        """
+        where_clause: List[str] = []
+        values: List[Any] = []
+        if from_date is not None:
+            where_clause.append('"time" >= ?')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('"time" < ?')
+            values.append(to_date.timestamp())
+        filters, filter_values = get_filters(extra, search, search_mode)
+
+        cursor = db.connection.cursor()
+        cursor.row_factory = None
+        execute(cursor, get_sql_for_columns(' AND '.join(where_clause + filters)), values + filter_values)
+        arrays = arrays_from_rows(cursor.fetchall())
+
+        names: Dict[str, Dict[int, str]] = {}
+        for name, column, table in DIMENSIONS:
+            ids = unique_ids(arrays, column)
+            names[name] = {}
+            if len(ids) == 0:
+                continue
+            execute(db, f'SELECT id, name FROM {table} WHERE id IN (SELECT value FROM json_each(?));', [json.dumps(ids)])
+            for row in db.fetchall():
+                names[name][row['id']] = row['name']
+
+        return LogColumns(arrays, names)
+
+    @classmethod
+    def prefetch_tags(cls, db: Any, entries: List["LogEntry"]):
+        """
+        Load the tags of all entries that have no cached tags with one query
+        """
+        missing: Dict[int, "LogEntry"] = {}
+        for entry in entries:
+            if getattr(entry, '_tags', None) is None:
+                setattr(entry, '_tags', [])
+                missing[entry.pk] = entry
+        if len(missing) == 0:
+            return
+
+        sql = f"""
+            SELECT lt."logID", t.* FROM logger_log_tag lt
+            JOIN logger_tag t ON t.id = lt."tagID"
+            WHERE lt."logID" IN (SELECT value FROM json_each(?));
+        """
+        execute(db, sql, [json.dumps(list(missing.keys()))])
+        for result in db.fetchall():
+            getattr(missing[result['logID']], '_tags').append(LogTag(rowdata=result))
+
+    @classmethod
+    def count_by_template(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[LogTemplate, int]]:
+        """
+        Count entries stored in template mode grouped by their message template,
+        most frequent templates first
+        """
+        where_clause = []
+        values = []
+        if from_date is not None:
+            where_clause.append('"time" > ?')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('"time" < ?')
+            values.append(to_date.timestamp())
+
+        execute(db, get_sql_for_template_counts(' AND '.join(where_clause), limit), values)
+        return [(LogTemplate(rowdata=result), result['count']) for result in db.fetchall()]
+
+    @classmethod
+    def count_by_time(
+        cls,
+        db: Any,
+        from_date: datetime,
+        to_date: datetime,
+        bucket: int = 60,
+        level: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Count entries per time bucket and level, like ``LogRollup.load_stats`` but for any
+        bucket width and without the rollup table
+
+        :param bucket: Width of a bucket in seconds
+        :param level: Only count entries with this level or higher
+        :return: One dict with ``time`` (start of the bucket), ``level`` and ``count`` per bucket and level
+        """
+        where_clause = ['le.level >= ?', 'le."time" >= ?', 'le."time" < ?']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+
+        execute(db, get_sql_for_time_counts(' AND '.join(where_clause), get_sql_for_time_bucket(bucket)), values)
+        results = db.fetchall()
+        return [
+            dict(time=datetime.utcfromtimestamp(result['time']), level=result['level'], count=result['count'])
+            for result in results
+        ]
+
+    @classmethod
+    def count_by(
+        cls,
+        db: Any,
+        dimension: str,
+        from_date: datetime,
+        to_date: datetime,
+        level: int = 0,
+        limit: int = 10
+    ) -> List[Tuple[str, int]]:
+        """
+        Count entries grouped by ``functions``, ``loggers``, ``tags`` or ``messages``,
+        most frequent first
+
+        :param level: Only count entries with this level or higher
+        :return: Tuples of name and count, functions are named ``name:line``
+        """
+        where_clause = ['le.level >= ?', 'le."time" >= ?', 'le."time" < ?']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+        if dimension == 'tags':
+            # the conditions are used for the tag table and the tag array
+            values = values * 2
+
+        execute(
+            db,
+            get_sql_for_dimension_counts(
+                dimension,
+                ' AND '.join(where_clause),
+                limit,
+                tag_array='json_each(le."tagIDs") AS ta'
+            ),
+            values
+        )
+        results = db.fetchall()
+        return [(result['name'], result['count']) for result in results]
+
+    @classmethod
+    def load_all_after_id(
+        cls,
+        db: Any,
+        lowest_id: int,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> List["LogEntry"]:
+        """
+        Load all entries newer than ``lowest_id``
+
+        :param extra: Only load entries whose extra fields have all of these values
+        :param search: Only load entries whose message contains this text
+        :param search_mode: Only ``substring`` is supported by SQLite
+        """
+        filters, filter_values = get_filters(extra, search, search_mode)
+        execute(db, get_sql_for_entries(' AND '.join(['le.id > ?'] + filters), after_id=True), [lowest_id] + filter_values)
+
+        entries = []
+        for result in db.fetchall():
+            entry = cls(rowdata=result)
+            deserialize_joined(entry, result)
+            entries.append(entry)
+        return entries
+
+    def add_tag(self, db: Any, tag: LogTag):
+        self.add_tags(db, [tag])
+
+    def add_tags(self, db: Any, tags: List[LogTag]):
+        cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
+        if cached_tags is not None:
+            for tag in tags:
+                cached_tags.append(tag)
+
+        if len(tags) == 0:
+            return
+
+        if self.tag_ids is not None:
+            self.tag_ids = sorted(set(self.tag_ids) | set(tag.pk for tag in tags))
+            execute(db, f'UPDATE {self.table} SET "tagIDs" = ? WHERE id = ?;', [json.dumps(self.tag_ids), self.pk])
+            return
+
+        # one prepared statement per tag, SQLite has no round trips to save
+        for tag in tags:
+            execute(db, 'INSERT INTO logger_log_tag ("logID", "tagID") VALUES (?, ?);', [self.pk, tag.pk])
+
+    @classmethod
+    def add_tags_many(cls, db: Any, entries: List[Tuple["LogEntry", List[LogTag]]]):
+        """
+        Tag multiple entries with one multi-row insert per chunk
+        """
+        values: List[int] = []
+        for entry, tags in entries:
+            cached_tags: Optional[List[LogTag]] = getattr(entry, '_tags', None)
+            if cached_tags is not None:
+                cached_tags.extend(tags)
+            for tag in tags:
+                values.append(entry.pk)
+                values.append(tag.pk)
+
+        chunk_size = MAX_PARAMETERS - (MAX_PARAMETERS % 2)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            placeholders = ['(?, ?)' for _ in range(0, len(chunk), 2)]
+            sql = f'INSERT INTO logger_log_tag ("logID", "tagID") VALUES {", ".join(placeholders)};'
+            execute(db, sql, chunk)
+
+    @classmethod
+    def copy_many(cls, db: Any, items: List[Dict[str, Any]], tag_ids: Optional[List[List[int]]]=None) -> List[int]:
+        """
+        Bulk load entries, SQLite has no ``COPY`` so every entry is one prepared ``INSERT``
+        in the current transaction
+
+        :param items: Entry data like for ``create``
+        :param tag_ids: Optional list of tag ids for every item
+        :return: ids of the new entries in the same order as ``items``
+        """
+        ids: List[int] = []
+        for item in items:
+            ser = cls.serialize_data(item)
+            value_list = ', '.join([f'"{key}"' for key in ser.keys()])
+            params = ', '.join(['?' for _ in ser.keys()])
+            execute(db, f'INSERT INTO {cls.table} ({value_list}) VALUES ({params})', list(ser.values()))
+            ids.append(db.lastrowid)
+
+        if tag_ids is not None:
+            for pk, tags in zip(ids, tag_ids):
+                for tag_id in tags:
+                    execute(db, 'INSERT INTO logger_log_tag ("logID", "tagID") VALUES (?, ?);', [pk, tag_id])
+
+        return ids
+
+    def remove_tag(self, db: Any, tag: LogTag):
+        cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
+        if cached_tags is not None:
+            cached_tags.remove(tag)
+
+        if self.tag_ids is not None:
+            self.tag_ids = [tag_id for tag_id in self.tag_ids if tag_id != tag.pk]
+            execute(db, f'UPDATE {self.table} SET "tagIDs" = ? WHERE id = ?;', [json.dumps(self.tag_ids), self.pk])
+            return
+
+        execute(
+            db,
+            'DELETE FROM logger_log_tag WHERE "logID" = ? AND "tagID" = ?;',
+            [self.pk, tag.pk]
+        )
+
+    def tags(self, db: Any) -> List[LogTag]:
+        cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
+
+        if cached_tags is None:
+            if self.tag_ids is not None:
+                execute(
+                    db,
+                    f'SELECT * FROM {LogTag.table} WHERE id IN (SELECT value FROM json_each(?));',
+                    [json.dumps(self.tag_ids)]
+                )
+            else:
+                sql = f"""
+                    SELECT t.* FROM logger_log_tag lt
+                    JOIN logger_tag t ON t.id = lt."tagID"
+                    WHERE "logID" = ?;
+                """
+                execute(db, sql, [self.pk])
+            cached_tags = [LogTag(rowdata=result) for result in db.fetchall()]
+
+        setattr(self, '_tags', cached_tags)
+        return cached_tags
+
+    def function(self, db: Any) -> LogFunction:
+        result = getattr(self, '_function', None)
+        if result is None:
+            result = LogFunction.load(db, pk=self.function_id)
+            setattr(self, '_function', result)
+        return result
+
+    def logger(self, db: Any) -> LogLogger:
+        result = getattr(self, '_logger', None)
+        if result is None:
+            result = LogLogger.load(db, pk=self.logger_id)
+            setattr(self, '_logger', result)
+        return result
+
+    def hostname(self, db: Any) -> LogHost:
+        result = getattr(self, '_hostname', None)
+        if result is None:
+            result = LogHost.load(db, pk=self.hostname_id)
+            setattr(self, '_hostname', result)
+        return result
+
+    def exception(self, db: Any) -> Optional[LogException]:
+        if self.exception_id is None:
+            return None
+        result = getattr(self, '_exception', None)
+        if result is None:
+            result = LogException.load(db, pk=self.exception_id)
+            setattr(self, '_exception', result)
+        return result
+
+    def template(self, db: Any) -> Optional[LogTemplate]:
+        if self.template_id is None:
+            return None
+        result = getattr(self, '_template', None)
+        if result is None:
+            result = LogTemplate.load(db, pk=self.template_id)
+            setattr(self, '_template', result)
+        return result
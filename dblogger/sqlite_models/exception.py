@@ -0,0 +1,6 @@
+from dblogger.models.exception import BaseLogException
+from .model import SqliteModel
+
+
+class LogException(BaseLogException, SqliteModel):
+    pass
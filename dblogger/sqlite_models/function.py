@@ -0,0 +1,15 @@
+from typing import Any
+
+from dblogger.models.function import BaseLogFunction
+from .model import SqliteModel
+from .source import LogSource
+
+
+class LogFunction(BaseLogFunction, SqliteModel):
+
+    def source(self, db: Any) -> LogSource:
+        result = getattr(self, '_source', None)
+        if result is None:
+            result = LogSource.load(db, pk=self.source_id)
+            setattr(self, '_source', result)
+        return result
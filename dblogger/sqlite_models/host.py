@@ -0,0 +1,6 @@
+from dblogger.models.host import BaseLogHost
+from .model import SqliteModel
+
+
+class LogHost(BaseLogHost, SqliteModel):
+    pass
@@ -0,0 +1,6 @@
+from dblogger.models.logger import BaseLogLogger
+from .model import SqliteModel
+
+
+class LogLogger(BaseLogLogger, SqliteModel):
+    pass
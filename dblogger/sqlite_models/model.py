@@ -0,0 +1,188 @@
+from typing import List, Dict, Any, Tuple, Optional
+import sqlite3
+
+from dblogger.models.model import BaseModel
+from dblogger.models.schema import SQLITE_SCHEMA
+from dblogger.models.tracing import traced
+
+__all__ = ['SqliteModel', 'connect', 'create_schema', 'dict_row', 'sqlite_path']
+
+# conservative limit of bind parameters per statement, SQLite before 3.32 allows 999
+MAX_PARAMETERS = 999
+
+
+def dict_row(cursor: sqlite3.Cursor, row: Tuple[Any, ...]) -> Dict[str, Any]:
+    """
+    Row factory that returns rows as dicts like ``DictCursor`` does for psycopg2
+    """
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def sqlite_path(dsn: str) -> str:
+    """
+    Path of the database file for a ``sqlite:///relative.db``, ``sqlite:////absolute.db``
+    or plain path DSN
+    """
+    if dsn.startswith('sqlite:///'):
+        return dsn[len('sqlite:///'):]
+    if '://' in dsn:
+        raise ValueError(f'Not a SQLite DSN: {dsn}')
+    return dsn
+
+
+def connect(dsn: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database for logging: rows are returned as dicts, the journal is switched
+    to WAL so readers (e.g. ``logtail``) do not block the writer and commits only wait for the
+    WAL write, not for an ``fsync``. The connection may be used from multiple threads as long
+    as the callers serialize access (the handlers hold their lock).
+    """
+    db = sqlite3.connect(
+        sqlite_path(dsn),
+        check_same_thread=False,
+        # compiled statements are reused for every statement text seen before
+        cached_statements=256
+    )
+    db.row_factory = dict_row
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('PRAGMA busy_timeout = 5000')
+    return db
+
+
+def create_schema(db: sqlite3.Connection):
+    for statement in SQLITE_SCHEMA:
+        db.execute(statement)
+    db.commit()
+
+
+def execute(db: Any, sql: str, values: Optional[Any]=None):
+    """
+    Execute a statement on a cursor, timed by the installed query tracer
+    """
+    with traced(sql, len(values) if values else 0) as trace:
+        db.execute(sql, values if values is not None else ())
+        trace.rows = db.rowcount
+
+
+class SqliteModel(BaseModel):
+
+    @classmethod
+    def make_where_statement(cls, data: Dict[str, Any], prefix: Optional[str]=None) -> Tuple[str, List[Any]]:
+        where: List[str] = []
+        values: List[Any] = []
+        for item in data.items():
+            key, value = item
+            key = key.replace("'", "''")
+            if prefix is not None:
+                where.append(f'"{prefix}.{key}" = ?')
+            else:
+                where.append(f'"{key}" = ?')
+            values.append(value)
+
+        where_clause = ' AND '.join(where)
+        return where_clause, values
+
+    @classmethod
+    def load(cls, db: Any, **kwargs) -> Optional[Any]:
+        pk = kwargs.pop('pk', None)
+        ser = cls.serialize_data(kwargs)
+        if pk is not None:
+            ser['id'] = pk
+        where_clause, values = SqliteModel.make_where_statement(ser)
+
+        execute(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
+        data = db.fetchone()
+        if data is None:
+            return None
+        return cls(rowdata=data)
+
+    @classmethod
+    def load_all(cls, db: Any, **kwargs) -> List[Any]:
+        ser = cls.serialize_data(kwargs)
+        where_clause, values = SqliteModel.make_where_statement(ser)
+
+        execute(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
+        return [cls(rowdata=data) for data in db.fetchall()]
+
+    @classmethod
+    def create(cls, db: Any, ignore_conflicts: bool=False, **kwargs) -> Any:
+        ser = cls.serialize_data(kwargs)
+
+        value_list = [f'"{v}"' for v in ser.keys()]
+        params = ', '.join(['?' for _ in ser.keys()])
+
+        sql = f'''
+            INSERT {'OR IGNORE ' if ignore_conflicts else ''}INTO {cls.table} ({', '.join(value_list)})
+            VALUES ({params})
+        '''
+        execute(db, sql, list(ser.values()))
+        if db.rowcount == 0:
+            # conflicting row already exists
+            return cls.load(db, **kwargs)
+
+        # ``RETURNING`` needs SQLite 3.35, the inserted values are known anyway
+        return cls(rowdata=dict(ser, id=db.lastrowid))
+
+    @classmethod
+    def create_many(cls, db: Any, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Insert multiple rows, SQLite has no network round trips so this is one prepared
+        ``INSERT`` per item in the current transaction
+
+        :return: List of created models in the same order as ``items``
+        """
+        return [cls.create(db, **item) for item in items]
+
+    @classmethod
+    def get_or_create_many(
+        cls,
+        db: Any,
+        items: List[Dict[str, Any]],
+        defaults: Optional[List[Dict[str, Any]]]=None
+    ) -> List[Any]:
+        """
+        Batched ``get_or_create``, looks up all distinct items with one query per chunk
+        and creates the missing ones with ``create_many``. All items have to use the same keys.
+
+        :param items: Lookup data of every item
+        :param defaults: Optional additional data for every item that is only used when creating
+        :return: List of models in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(sers[0].keys())
+        row_keys = [tuple(ser[key] for key in keys) for ser in sers]
+        unique = list(dict.fromkeys(row_keys))
+        row_clause = '(' + ' AND '.join([f'"{key}" = ?' for key in keys]) + ')'
+        chunk_size = max(1, MAX_PARAMETERS // max(1, len(keys)))
+
+        found: Dict[Tuple[Any, ...], Any] = {}
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            values: List[Any] = []
+            for row_key in chunk:
+                values.extend(row_key)
+            execute(db, f'SELECT * FROM {cls.table} WHERE {" OR ".join([row_clause for _ in chunk])};', values)
+            for data in db.fetchall():
+                found[tuple(data[key] for key in keys)] = cls(rowdata=data)
+
+        missing: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for idx, (row_key, item) in enumerate(zip(row_keys, items)):
+            if row_key not in found and row_key not in missing:
+                if defaults is not None:
+                    item = dict(item, **defaults[idx])
+                missing[row_key] = item
+        created = cls.create_many(db, list(missing.values()))
+        found.update(zip(missing.keys(), created))
+
+        return [found[row_key] for row_key in row_keys]
+
+    @classmethod
+    def get_or_create(cls, db: Any, **kwargs) -> Any:
+        item = cls.load(db, **kwargs)
+        if item is None:
+            item = cls.create(db, **kwargs)
+        return item
@@ -0,0 +1,61 @@
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+
+from dblogger.models.rollup import BaseLogRollup, get_sql_for_rollup_upsert, get_sql_for_rollup_stats
+from .model import SqliteModel, MAX_PARAMETERS, execute
+
+
+class LogRollup(BaseLogRollup, SqliteModel):
+
+    @classmethod
+    def upsert_counters(cls, db: Any, counters: Dict[Tuple[float, int, int, int, int], int]):
+        """
+        Add the counters of a ``RollupCounter`` to the rollup table
+        """
+        rows = list(counters.items())
+        chunk_size = MAX_PARAMETERS // 6
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            values: List[Any] = []
+            for key, count in chunk:
+                values.extend(key)
+                values.append(count)
+            placeholders = ['(?, ?, ?, ?, ?, ?)' for _ in chunk]
+            execute(db, get_sql_for_rollup_upsert(placeholders), values)
+
+    @classmethod
+    def load_stats(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        group_by: Optional[List[str]] = None,
+        level: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Sum up the rollup counters in a time range
+
+        :param group_by: Columns to group by, any of ``time``, ``level``, ``logger``,
+                         ``hostname`` and ``function``, defaults to ``['time']``
+        :param level: Only count entries with this level or higher
+        :return: One dict per group with the group columns and ``count``
+        """
+        if group_by is None:
+            group_by = ['time']
+        where_clause = ['r.level >= ?']
+        values: List[Any] = [level]
+        if from_date is not None:
+            where_clause.append('r.time >= ?')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('r.time < ?')
+            values.append(to_date.timestamp())
+
+        execute(db, get_sql_for_rollup_stats(group_by, ' AND '.join(where_clause)), values)
+        result = []
+        for row in db.fetchall():
+            item = dict(row)
+            if 'time' in item:
+                item['time'] = datetime.utcfromtimestamp(item['time'])
+            result.append(item)
+        return result
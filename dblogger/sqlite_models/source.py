@@ -0,0 +1,6 @@
+from dblogger.models.source import BaseLogSource
+from .model import SqliteModel
+
+
+class LogSource(BaseLogSource, SqliteModel):
+    pass
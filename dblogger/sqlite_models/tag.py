@@ -0,0 +1,6 @@
+from dblogger.models.tag import BaseLogTag
+from .model import SqliteModel
+
+
+class LogTag(BaseLogTag, SqliteModel):
+    pass
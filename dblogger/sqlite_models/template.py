@@ -0,0 +1,6 @@
+from dblogger.models.template import BaseLogTemplate
+from .model import SqliteModel
+
+
+class LogTemplate(BaseLogTemplate, SqliteModel):
+    pass
@@ -1,18 +1,34 @@
-from typing import List, Any, Optional, Dict, Tuple
+from typing import List, Any, Optional, Dict, Tuple, FrozenSet
 import socket
+import threading
+import time
 
 from datetime import datetime
 from logging import Handler, Logger, NOTSET, LogRecord
 
-import psycopg2
-from psycopg2.extras import DictCursor
-
-from .sync_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogEntry
+from . import sync_models
+from .sync_models import LogLogger, LogSource, LogHost, LogFunction, LogTag, LogException, LogTemplate
+from .tracebacks import normalize_traceback, format_traceback, traceback_hash
+from .templates import split_message, template_hash
+from .ratelimit import RateLimiter
+from .coalesce import Coalescer
+from .rollup import RollupCounter, report_flush_error
+from .circuit import CircuitBreaker
+from .durability import Durability
+from .cache import LRUCache, TAG_CACHE_SIZE
+from .tagscope import TagSet, intern_tags, attach_scope_tags
 
 __all__ = ['DBLogHandler']
 
 
 class DBLogHandler(Handler):
+    """
+    Log handler for psycopg2. The handlers of the other sync drivers subclass it, they
+    replace ``models`` and override ``connect`` and ``insert``.
+    """
+
+    # models of the driver
+    models: Any = sync_models
 
     # db config and connection
     db_config: Optional[str] = None
@@ -22,10 +38,34 @@ class DBLogHandler(Handler):
     func_cache: Dict[str, LogFunction] = {}
     logger_cache: Dict[str, LogLogger] = {}
     host_cache: Dict[str, LogHost] = {}
-    tag_cache: Dict[str, LogTag] = {}
+    # tags and tag sets may be unique per request, these caches are bounded
+    tag_cache: Dict[str, LogTag] = LRUCache(TAG_CACHE_SIZE)
+    exception_cache: Dict[str, LogException] = {}
+    template_cache: Dict[str, LogTemplate] = {}
+    tag_set_cache: Dict[FrozenSet[str], List[int]] = LRUCache(TAG_CACHE_SIZE)
+    tag_list_cache: Dict[FrozenSet[str], List[LogTag]] = LRUCache(TAG_CACHE_SIZE)
+    # (function_id, logger_id, hostname_id) by logger name and record code location
+    callsite_cache: Dict[Tuple[str, str, str, int, str], Tuple[int, int, int]] = {}
 
     # internal state
     logger_name: str
+    hostname: str
+    message_templates: bool = False
+    extra_fields: List[str]
+    tag_storage: str = 'table'
+    rate_limiter: Optional[RateLimiter] = None
+    coalescer: Optional[Coalescer] = None
+    rollup: Optional[RollupCounter] = None
+    flush_timer: Optional[threading.Timer] = None
+    summary_timer: Optional[threading.Timer] = None
+    circuit_breaker: CircuitBreaker
+    durability: Optional[Durability] = None
+
+    # group commit state, records in the open transaction and if it commits asynchronously
+    uncommitted: int = 0
+    relaxed_commit: bool = False
+    commit_timer: Optional[threading.Timer] = None
+    merge_timer: Optional[threading.Timer] = None
 
     def __init__(
         self, name: str,
@@ -35,7 +75,15 @@ class DBLogHandler(Handler):
         db_password: Optional[str]=None,
         db_host: str='localhost',
         db_port: int=5432,
-        level: int = NOTSET
+        level: int = NOTSET,
+        message_templates: bool = False,
+        extra_fields: Optional[List[str]] = None,
+        tag_storage: str = 'table',
+        rate_limiter: Optional[RateLimiter] = None,
+        coalescer: Optional[Coalescer] = None,
+        rollup: Optional[RollupCounter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        durability: Optional[Durability] = None
     ):
         """
         Initialize new DB logging handler
@@ -48,7 +96,25 @@ class DBLogHandler(Handler):
         :param db_host: DB hostname (optional, defaults to ``localhost``)
         :param db_port: DB port (optional, defaults to ``5432``)
         :param level: Log level, defaults to ``NOTSET`` which inherits the level from the logger
+        :param message_templates: Store the message template once and only the arguments
+                                  with the entry instead of the formatted message
+        :param extra_fields: Names of ``extra`` attributes of the log record to store in
+                             the ``extra`` JSON column of the entry (e.g. ``['request_id']``)
+        :param tag_storage: ``table`` to store one ``logger_log_tag`` row per tag or ``array``
+                            to store the sorted tag ids in the ``tagIDs`` column of the entry
+        :param rate_limiter: Per-callsite rate limiting and sampling, suppressed records are
+                             replaced by periodic summary entries (optional)
+        :param coalescer: Fold identical records within a time window into one entry with
+                          a repeat count (optional)
+        :param rollup: Count entries per minute, logger, host, function and level and
+                       periodically add the counts to the ``logger_rollup`` table (optional)
+        :param circuit_breaker: Reconnect backoff and fallback while the DB is unreachable,
+                                defaults to a ``CircuitBreaker`` that drops the records
+        :param durability: Relaxed commits, group commit or an unlogged staging table for
+                           low levels, trading a bounded window of loss for throughput (optional)
         """
+        if tag_storage not in ('table', 'array'):
+            raise ValueError('`tag_storage` has to be one of `table` or `array`')
 
         if db is not None:
             self.db = db
@@ -61,73 +127,433 @@ class DBLogHandler(Handler):
                     self.db_config = f'postgresql://{db_user}@{db_host}:{db_port}/{db_name}'
             else:
                 self.db_config = f'postgresql://{db_host}:{db_port}/{db_name}'
-            self.db = psycopg2.connect(self.db_config, cursor_factory=DictCursor)
+            self.db = self.connect()
 
         self.logger_name = name
+        self.hostname = socket.gethostname()
+        self.message_templates = message_templates
+        self.extra_fields = list(extra_fields) if extra_fields is not None else []
+        self.tag_storage = tag_storage
+        self.rate_limiter = rate_limiter
+        self.coalescer = coalescer
+        self.rollup = rollup
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.durability = durability
         self.createLock()
         super().__init__(level=level)
 
+        if durability is not None and durability.staging:
+            self.schedule_merge()
+
     def emit(self, record: LogRecord):
-        if self.db.closed and self.db_config is not None:
-            self.db = psycopg2.connect(self.db_config, cursor_factory=DictCursor)
-        elif self.db.closed:
-            raise RuntimeWarning('DB handle was closed, can not continue')
+        attach_scope_tags(record)
+        if self.coalescer is None:
+            self.process(record)
+            return
 
-        cursor = self.db.cursor()
+        for item in self.coalescer.add(record):
+            self.process(item)
+        self.schedule_flush()
+
+    def process(self, record: LogRecord):
+        if self.rate_limiter is not None:
+            for summary in self.rate_limiter.summaries(record.created):
+                self.write(summary)
+            if not self.rate_limiter.allow(record):
+                self.schedule_summary()
+                return
+
+        self.write(record)
+
+    def schedule_summary(self):
+        """
+        Make sure the summary of suppressed records is written once the summary
+        interval has passed even if no further records arrive
+        """
+        due = self.rate_limiter.next_summary_due()
+        if self.summary_timer is not None or due is None:
+            return
+        self.summary_timer = threading.Timer(max(0.01, due - time.time()), self.flush_summaries)
+        self.summary_timer.daemon = True
+        self.summary_timer.start()
+
+    def flush_summaries(self):
+        self.acquire()
+        try:
+            self.summary_timer = None
+            for summary in self.rate_limiter.summaries():
+                self.write(summary)
+            self.schedule_summary()
+        finally:
+            self.release()
+
+    def schedule_flush(self):
+        """
+        Make sure coalesced records are written once their window closes even if
+        no further records arrive
+        """
+        next_expiry = self.coalescer.next_expiry()
+        if self.flush_timer is not None or next_expiry is None:
+            return
+        self.flush_timer = threading.Timer(max(0.01, next_expiry - time.time()), self.flush_coalesced)
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+    def flush_coalesced(self):
+        self.acquire()
+        try:
+            self.flush_timer = None
+            for item in self.coalescer.expired(time.time()):
+                self.process(item)
+            self.schedule_flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.coalescer is not None:
+                if self.flush_timer is not None:
+                    self.flush_timer.cancel()
+                    self.flush_timer = None
+                for item in self.coalescer.flush():
+                    self.process(item)
+            if self.rate_limiter is not None:
+                if self.summary_timer is not None:
+                    self.summary_timer.cancel()
+                    self.summary_timer = None
+                for summary in self.rate_limiter.summaries(force=True):
+                    self.write(summary)
+            if self.rollup is not None and not self.db.closed:
+                self.flush_rollup(self.db.cursor())
+            if self.durability is not None and not self.db.closed:
+                if self.merge_timer is not None:
+                    self.merge_timer.cancel()
+                    self.merge_timer = None
+                if self.uncommitted > 0:
+                    self.commit_pending()
+                if self.durability.staging:
+                    self.durability.merged += self.models.LogEntry.merge_staging(self.db.cursor())
+                    self.db.commit()
+        finally:
+            self.release()
+        super().close()
+
+    def connect(self) -> Any:
+        """
+        Open a connection to ``db_config``, rows have to be accessible by column name
+        """
+        import psycopg2
+        from psycopg2.extras import DictCursor
+        return psycopg2.connect(self.db_config, cursor_factory=DictCursor)
+
+    def flush_rollup(self, cursor: Any):
+        """
+        Add the rollup counters to the rollup table, a failed upsert is rolled back to a
+        savepoint so the entries of the transaction are kept, the counters are retried
+        with the next flush
+        """
+        counters = self.rollup.take()
+        if len(counters) == 0:
+            return
+        try:
+            cursor.execute('SAVEPOINT rollup')
+            self.models.LogRollup.upsert_counters(cursor, counters)
+            cursor.execute('RELEASE SAVEPOINT rollup')
+        except Exception:
+            self.rollup.restore(counters)
+            report_flush_error()
+            try:
+                cursor.execute('ROLLBACK TO SAVEPOINT rollup')
+                cursor.execute('RELEASE SAVEPOINT rollup')
+            except Exception:
+                # the transaction is broken, the pending entries are lost
+                self.rollback()
+            return
+
+        try:
+            self.commit_pending()
+        except Exception:
+            self.rollup.restore(counters)
+            raise
+
+    def commit(self, cursor: Any, relaxed: bool):
+        """
+        Commit the transaction of the current record, relaxed records may be committed
+        without waiting for the WAL flush or together with later records
+        """
+        if self.durability is None:
+            self.db.commit()
+            return
+
+        if not relaxed:
+            if self.relaxed_commit:
+                cursor.execute('SET LOCAL synchronous_commit TO ON')
+            self.commit_pending()
+            return
+
+        if not self.durability.synchronous_commit and not self.relaxed_commit:
+            cursor.execute('SET LOCAL synchronous_commit TO OFF')
+            self.relaxed_commit = True
+        self.uncommitted += 1
+
+        if self.durability.group_commit <= 0:
+            self.commit_pending()
+        elif self.commit_timer is None:
+            self.commit_timer = threading.Timer(self.durability.group_commit, self.commit_group)
+            self.commit_timer.daemon = True
+            self.commit_timer.start()
+
+    def commit_pending(self):
+        if self.commit_timer is not None:
+            self.commit_timer.cancel()
+            self.commit_timer = None
+        self.db.commit()
+        self.uncommitted = 0
+        self.relaxed_commit = False
 
+    def commit_group(self):
+        self.acquire()
         try:
-            src = self.src_cache.get(record.pathname, None)
-            if src is None:
-                src = LogSource.get_or_create(cursor, path=record.pathname)
-                self.src_cache[record.pathname] = src
-
-            func_key = f'{record.name}.{record.funcName}:{record.lineno}@{src.path}'
-            func = self.func_cache.get(func_key, None)
-            if func is None:
-                func = LogFunction.get_or_create(
-                    cursor,
-                    name=f'{record.name}.{record.funcName}',
-                    line_number=record.lineno,
-                    source_id=src.pk,
-                )
-                self.func_cache[func_key] = func
-
-            logger = self.logger_cache.get(self.logger_name, None)
-            if logger is None:
-                logger = LogLogger.get_or_create(cursor, name=self.logger_name)
-                self.logger_cache[self.logger_name] = logger
-
-            host_key = socket.gethostname()
-            host = self.host_cache.get(host_key, None)
-            if host is None:
-                host = LogHost.get_or_create(cursor, name=host_key)
-                self.host_cache[host_key] = host
-
-            entry = LogEntry.create(
+            self.commit_timer = None
+            if self.uncommitted > 0 and not self.db.closed:
+                try:
+                    self.commit_pending()
+                except Exception:
+                    self.rollback()
+        finally:
+            self.release()
+
+    def rollback(self):
+        """
+        Roll back the open transaction, the records of an open commit group are lost and
+        cached rows that may have been created in the transaction are forgotten
+        """
+        if self.commit_timer is not None:
+            self.commit_timer.cancel()
+            self.commit_timer = None
+        if not self.db.closed:
+            self.db.rollback()
+        if self.durability is not None:
+            self.durability.lost += self.uncommitted
+        self.uncommitted = 0
+        self.relaxed_commit = False
+
+        for cache in (
+            self.src_cache, self.func_cache, self.logger_cache, self.host_cache,
+            self.tag_cache, self.exception_cache, self.template_cache, self.tag_set_cache,
+            self.tag_list_cache, self.callsite_cache
+        ):
+            cache.clear()
+
+    def schedule_merge(self):
+        self.merge_timer = threading.Timer(self.durability.merge_interval, self.merge_staging)
+        self.merge_timer.daemon = True
+        self.merge_timer.start()
+
+    def merge_staging(self):
+        """
+        Move the staging table into ``logger_log``, runs every ``merge_interval`` seconds
+        """
+        self.acquire()
+        try:
+            if self.merge_timer is not threading.current_thread():
+                # cancelled by ``close``
+                return
+            if not self.db.closed:
+                try:
+                    if self.uncommitted > 0:
+                        self.commit_pending()
+                    self.durability.merged += self.models.LogEntry.merge_staging(self.db.cursor())
+                    self.db.commit()
+                except Exception:
+                    # the entries stay in the staging table for the next merge
+                    self.rollback()
+            self.schedule_merge()
+        finally:
+            self.release()
+
+    def resolve_tags(self, cursor: Any, tag_set: TagSet) -> List[LogTag]:
+        tags: List[LogTag] = []
+        for tag_name in tag_set:
+            tag = self.tag_cache.get(tag_name, None)
+            if tag is None:
+                tag = self.models.LogTag.get_or_create(cursor, name=tag_name)
+                self.tag_cache[tag_name] = tag
+            tags.append(tag)
+        return tags
+
+    def resolve_callsite(self, cursor: Any, record: LogRecord) -> Tuple[int, int, int]:
+        """
+        Look up or create the source, function, logger and host rows of a call site
+        """
+        models = self.models
+        src = self.src_cache.get(record.pathname, None)
+        if src is None:
+            src = models.LogSource.get_or_create(cursor, path=record.pathname)
+            self.src_cache[record.pathname] = src
+
+        func_key = f'{record.name}.{record.funcName}:{record.lineno}@{src.path}'
+        func = self.func_cache.get(func_key, None)
+        if func is None:
+            func = models.LogFunction.get_or_create(
                 cursor,
-                level=record.levelno,
-                message=record.getMessage(),
-                pid=record.process,
-                time=datetime.fromtimestamp(record.created),
-                function_id=func.pk,
-                logger_id=logger.pk,
-                hostname_id=host.pk
+                name=f'{record.name}.{record.funcName}',
+                line_number=record.lineno,
+                source_id=src.pk,
             )
+            self.func_cache[func_key] = func
 
-            tags_names = getattr(record, 'tags', set())
-            tags: List[LogTag] = []
-            for tag_name in tags_names:
-                if tag_name is None or tag_name == '':
-                    continue
-                tag = self.tag_cache.get(tag_name, None)
-                if tag is None:
-                    tag = LogTag.get_or_create(cursor, name=tag_name)
-                    self.tag_cache[tag_name] = tag
+        logger = self.logger_cache.get(self.logger_name, None)
+        if logger is None:
+            logger = models.LogLogger.get_or_create(cursor, name=self.logger_name)
+            self.logger_cache[self.logger_name] = logger
 
-                tags.append(tag)
+        host_key = self.hostname
+        host = self.host_cache.get(host_key, None)
+        if host is None:
+            host = models.LogHost.get_or_create(cursor, name=host_key)
+            self.host_cache[host_key] = host
 
-            entry.add_tags(cursor, tags)
-            self.db.commit()
+        return func.pk, logger.pk, host.pk
+
+    def write(self, record: LogRecord):
+        # do not block on connection attempts while the DB is known to be down
+        if not self.circuit_breaker.allow():
+            self.circuit_breaker.reject(record)
+            return
+
+        if self.db.closed and self.db_config is not None:
+            try:
+                self.db = self.connect()
+                # health probe
+                self.db.cursor().execute('SELECT 1')
+            except Exception:
+                if not self.db.closed:
+                    self.db.close()
+                self.circuit_breaker.failure()
+                self.circuit_breaker.reject(record)
+                return
+            self.circuit_breaker.success()
+        elif self.db.closed:
+            raise RuntimeWarning('DB handle was closed, can not continue')
 
+        cursor = self.db.cursor()
+
+        try:
+            self.write_entry(cursor, record)
         except Exception:
+            self.rollback()
+            if self.db.closed and self.db_config is not None:
+                # connection lost, reconnect with backoff
+                self.circuit_breaker.failure()
+                self.circuit_breaker.reject(record)
+                return
             self.handleError(record)
+
+    def write_entry(self, cursor: Any, record: LogRecord):
+        """
+        Resolve the rows the entry of a record refers to, insert it and update the rollup
+        """
+        models = self.models
+        callsite_key = (self.logger_name, record.name, record.funcName, record.lineno, record.pathname)
+        callsite = self.callsite_cache.get(callsite_key, None)
+        if callsite is None:
+            callsite = self.resolve_callsite(cursor, record)
+            self.callsite_cache[callsite_key] = callsite
+        function_id, logger_id, hostname_id = callsite
+
+        exception: Optional[LogException] = None
+        normalized = normalize_traceback(record)
+        if normalized is not None:
+            exception = self.exception_cache.get(normalized, None)
+            if exception is None:
+                exc_hash = traceback_hash(normalized)
+                exception = models.LogException.load(cursor, hash=exc_hash)
+                if exception is None:
+                    exception = models.LogException.create(
+                        cursor,
+                        hash=exc_hash,
+                        traceback=format_traceback(record)
+                    )
+                self.exception_cache[normalized] = exception
+
+        message: Optional[str] = None
+        template: Optional[LogTemplate] = None
+        args: Optional[Any] = None
+        split = split_message(record) if self.message_templates else None
+        if split is None:
+            message = record.getMessage()
+        else:
+            template_text, args = split
+            template = self.template_cache.get(template_text, None)
+            if template is None:
+                tpl_hash = template_hash(template_text)
+                template = models.LogTemplate.load(cursor, hash=tpl_hash)
+                if template is None:
+                    template = models.LogTemplate.create(cursor, hash=tpl_hash, template=template_text)
+                self.template_cache[template_text] = template
+
+        extra: Optional[Dict[str, Any]] = None
+        for key in self.extra_fields:
+            value = getattr(record, key, None)
+            if value is not None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+
+        # interned tag sets are resolved once, later records only do one lookup
+        tag_set = intern_tags(getattr(record, 'tags', None) or ())
+        tags: List[LogTag] = []
+        tag_ids: Optional[List[int]] = None
+        if self.tag_storage == 'array':
+            tag_ids = self.tag_set_cache.get(tag_set, None)
+            if tag_ids is None:
+                tag_ids = sorted(set(tag.pk for tag in self.resolve_tags(cursor, tag_set)))
+                self.tag_set_cache[tag_set] = tag_ids
+        elif len(tag_set) > 0:
+            tags = self.tag_list_cache.get(tag_set, None)
+            if tags is None:
+                tags = self.resolve_tags(cursor, tag_set)
+                self.tag_list_cache[tag_set] = tags
+
+        data = dict(
+            level=record.levelno,
+            message=message,
+            pid=record.process,
+            time=datetime.fromtimestamp(record.created),
+            function_id=function_id,
+            logger_id=logger_id,
+            hostname_id=hostname_id,
+            exception_id=exception.pk if exception is not None else None,
+            template_id=template.pk if template is not None else None,
+            args=args,
+            extra=extra,
+            tag_ids=tag_ids,
+            repeat_count=getattr(record, 'repeat_count', 1),
+            last_time=datetime.fromtimestamp(record.last_created) if hasattr(record, 'last_created') else None
+        )
+        relaxed = self.durability is not None and self.durability.relaxed(record.levelno)
+        self.insert(cursor, data, tags, relaxed)
+
+        if self.rollup is not None:
+            self.rollup.add(
+                record.created, logger_id, hostname_id, function_id, record.levelno,
+                getattr(record, 'repeat_count', 1)
+            )
+            if self.rollup.due():
+                self.flush_rollup(cursor)
+
+    def insert(self, cursor: Any, data: Dict[str, Any], tags: List[LogTag], relaxed: bool):
+        """
+        Insert an entry with its tags (empty for ``array`` tag storage) and commit
+
+        :param data: Entry data like for ``LogEntry.create``
+        :param relaxed: The record may use the relaxed ``durability`` settings
+        """
+        if relaxed and self.durability.staging:
+            self.models.LogEntry.create_staged(cursor, tags, **data)
+        else:
+            entry = self.models.LogEntry.create(cursor, **data)
+            entry.add_tags(cursor, tags)
+        self.commit(cursor, relaxed)
@@ -1,21 +1,47 @@
-from typing import List, Dict, Any, Generator, Optional
+from typing import List, Dict, Any, Generator, Optional, Tuple
+import io
+import json
 
 from logging import DEBUG
 from datetime import datetime, timezone
 
-from dblogger.models.entry import BaseLogEntry, get_sql_for_entry_with_date, get_sql_for_entry_after_id
+from dblogger.models.entry import BaseLogEntry, get_sql_for_entry_with_date, get_sql_for_entry_after_id, \
+    get_sql_for_template_counts, get_sql_for_search, get_search_value, get_sql_for_staged_entry, \
+    get_sql_for_merge_staging, get_sql_for_columns, get_sql_for_time_bucket, get_sql_for_time_counts, \
+    get_sql_for_dimension_counts
+from dblogger.columnar import LogColumns, DIMENSIONS, parse_binary_copy, unique_ids
 
-from .model import SyncModel
+from dblogger.models.tracing import traced
+from .model import SyncModel, MAX_PARAMETERS, execute
 from .tag import LogTag
 from .function import LogFunction
 from .logger import LogLogger
 from .host import LogHost
 from .source import LogSource
+from .exception import LogException
+from .template import LogTemplate
 
 __all__ = ['LogEntry']
 
 # FIXME: Psycopg2 does not have type information yet
 
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_line(values: List[Any]) -> str:
+    """
+    Format one row in the text format of ``COPY``
+    """
+    fields: List[str] = []
+    for value in values:
+        if value is None:
+            fields.append('\\N')
+        elif isinstance(value, list):
+            fields.append('{' + ','.join(str(v) for v in value) + '}')
+        else:
+            fields.append(str(value).translate(_COPY_ESCAPES))
+    return '\t'.join(fields) + '\n'
+
 
 def deserialize_joined(entry: "LogEntry", result: Dict[str, Any]):
     function = LogFunction(rowdata={
@@ -40,6 +66,23 @@ def deserialize_joined(entry: "LogEntry", result: Dict[str, Any]):
     setattr(entry, '_function', function)
     setattr(entry, '_logger', logger)
     setattr(entry, '_hostname', hostname)
+    if result['exceptionID'] is not None:
+        exception = LogException(rowdata={
+            "id": result['exceptionID'],
+            "traceback": result['exception_traceback']
+        })
+        setattr(entry, '_exception', exception)
+    if result['templateID'] is not None:
+        template = LogTemplate(rowdata={
+            "id": result['templateID'],
+            "template": result['template_text']
+        })
+        setattr(entry, '_template', template)
+    if result['tagIDs'] is not None:
+        tag_list = result['tag_list']
+        if isinstance(tag_list, str):
+            tag_list = json.loads(tag_list)
+        setattr(entry, '_tags', [LogTag(rowdata=tag) for tag in tag_list])
 
 
 class LogEntry(BaseLogEntry, SyncModel):
@@ -50,8 +93,19 @@ class LogEntry(BaseLogEntry, SyncModel):
         db: Any,
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
     ) -> List["LogEntry"]:
+        """
+        Load entries in a time range or the latest ``limit`` entries
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` for a case-insensitive substring search, ``words`` for a
+                            full text search (web search syntax, e.g. ``timeout -redis``)
+        """
         if from_date is None and to_date is None and limit is None:
             raise ValueError('Define at least one of `from_date`, `to_date` or `limit`')
         where_clause = []
@@ -62,10 +116,16 @@ class LogEntry(BaseLogEntry, SyncModel):
         if to_date is not None:
             where_clause.append('"time" < %s')
             values.append(to_date.timestamp())
+        if extra is not None:
+            where_clause.append('le.extra @> %s::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search('%s', search_mode, '%s'))
+            values.extend([get_search_value(search, search_mode)] * 2)
 
         where_clause = ' AND '.join(where_clause)
         sql = get_sql_for_entry_with_date(where_clause, limit)
-        db.execute(sql, values)
+        execute(db, sql, values)
 
         entries = []
         for result in db.fetchall():
@@ -75,8 +135,235 @@ class LogEntry(BaseLogEntry, SyncModel):
         return entries
 
     @classmethod
-    def load_all_after_id(cls, db: Any, lowest_id: int) -> List["LogEntry"]:
-        db.execute(get_sql_for_entry_after_id("%s"), [lowest_id])
+    def iterate_with_date(
+        cls,
+        db: Any,
+        from_date: datetime,
+        to_date: datetime,
+        batch_size: int = 5000,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> Generator["LogEntry", None, None]:
+        """
+        Stream all entries with ``from_date <= time < to_date`` in batches.
+
+        Pass a named (server side) cursor as ``db`` to avoid loading the complete result
+        into memory. Tags are prefetched per batch on a second cursor of the same connection.
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause = ['"time" >= %s', '"time" < %s']
+        values: List[Any] = [from_date.timestamp(), to_date.timestamp()]
+        if extra is not None:
+            where_clause.append('le.extra @> %s::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search('%s', search_mode, '%s'))
+            values.extend([get_search_value(search, search_mode)] * 2)
+        sql = get_sql_for_entry_with_date(' AND '.join(where_clause))
+        execute(db, sql, values)
+
+        tag_cursor = db.connection.cursor()
+        while True:
+            results = db.fetchmany(batch_size)
+            if len(results) == 0:
+                break
+
+            entries = []
+            for result in results:
+                entry = cls(rowdata=result)
+                deserialize_joined(entry, result)
+                entries.append(entry)
+            cls.prefetch_tags(tag_cursor, entries)
+            yield from entries
+
+    @classmethod
+    def load_columns(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> LogColumns:
+        """
+        Load entries with ``from_date <= time < to_date`` as NumPy column arrays (needs
+        ``numpy``). The rows are transferred with binary ``COPY`` and parsed in one go,
+        no objects are created per row.
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause: List[str] = []
+        values: List[Any] = []
+        if from_date is not None:
+            where_clause.append('"time" >= %s')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('"time" < %s')
+            values.append(to_date.timestamp())
+        if extra is not None:
+            where_clause.append('le.extra @> %s::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search('%s', search_mode, '%s'))
+            values.extend([get_search_value(search, search_mode)] * 2)
+        sql = f'COPY ({get_sql_for_columns(" AND ".join(where_clause))}) TO STDOUT (FORMAT binary)'
+
+        buffer = io.BytesIO()
+        with traced(sql, len(values)) as trace:
+            if hasattr(db, 'copy_expert'):
+                # psycopg2, ``COPY`` does not take parameters
+                db.copy_expert(db.mogrify(sql, values).decode('utf-8'), buffer)
+            else:
+                with db.copy(sql, values) as copy:
+                    for block in copy:
+                        buffer.write(block)
+            arrays = parse_binary_copy(buffer.getvalue())
+            trace.rows = len(arrays['id'])
+
+        names: Dict[str, Dict[int, str]] = {}
+        for name, column, table in DIMENSIONS:
+            ids = unique_ids(arrays, column)
+            names[name] = {}
+            if len(ids) == 0:
+                continue
+            execute(db, f'SELECT id, name FROM {table} WHERE id = ANY(%s);', [ids])
+            for row in db.fetchall():
+                names[name][row['id']] = row['name']
+
+        return LogColumns(arrays, names)
+
+    @classmethod
+    def prefetch_tags(cls, db: Any, entries: List["LogEntry"]):
+        """
+        Load the tags of all entries that have no cached tags with one query
+        """
+        missing: Dict[int, "LogEntry"] = {}
+        for entry in entries:
+            if getattr(entry, '_tags', None) is None:
+                setattr(entry, '_tags', [])
+                missing[entry.pk] = entry
+        if len(missing) == 0:
+            return
+
+        sql = f"""
+            SELECT lt."logID", t.* FROM logger_log_tag lt
+            JOIN logger_tag t ON t.id = lt."tagID"
+            WHERE lt."logID" = ANY(%s);
+        """
+        execute(db, sql, [list(missing.keys())])
+        for result in db.fetchall():
+            getattr(missing[result['logID']], '_tags').append(LogTag(rowdata=result))
+
+    @classmethod
+    def count_by_template(
+        cls,
+        db: Any,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[LogTemplate, int]]:
+        """
+        Count entries stored in template mode grouped by their message template,
+        most frequent templates first
+        """
+        where_clause = []
+        values = []
+        if from_date is not None:
+            where_clause.append('"time" > %s')
+            values.append(from_date.timestamp())
+        if to_date is not None:
+            where_clause.append('"time" < %s')
+            values.append(to_date.timestamp())
+
+        execute(db, get_sql_for_template_counts(' AND '.join(where_clause), limit), values)
+        return [(LogTemplate(rowdata=result), result['count']) for result in db.fetchall()]
+
+    @classmethod
+    def count_by_time(
+        cls,
+        db: Any,
+        from_date: datetime,
+        to_date: datetime,
+        bucket: int = 60,
+        level: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Count entries per time bucket and level, like ``LogRollup.load_stats`` but for any
+        bucket width and without the rollup table
+
+        :param bucket: Width of a bucket in seconds
+        :param level: Only count entries with this level or higher
+        :return: One dict with ``time`` (start of the bucket), ``level`` and ``count`` per bucket and level
+        """
+        where_clause = ['le.level >= %s', 'le."time" >= %s', 'le."time" < %s']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+
+        execute(db, get_sql_for_time_counts(' AND '.join(where_clause), get_sql_for_time_bucket(bucket)), values)
+        results = db.fetchall()
+        return [
+            dict(time=datetime.utcfromtimestamp(result['time']), level=result['level'], count=result['count'])
+            for result in results
+        ]
+
+    @classmethod
+    def count_by(
+        cls,
+        db: Any,
+        dimension: str,
+        from_date: datetime,
+        to_date: datetime,
+        level: int = 0,
+        limit: int = 10
+    ) -> List[Tuple[str, int]]:
+        """
+        Count entries grouped by ``functions``, ``loggers``, ``tags`` or ``messages``,
+        most frequent first
+
+        :param level: Only count entries with this level or higher
+        :return: Tuples of name and count, functions are named ``name:line``
+        """
+        where_clause = ['le.level >= %s', 'le."time" >= %s', 'le."time" < %s']
+        values = [level, from_date.timestamp(), to_date.timestamp()]
+        if dimension == 'tags':
+            # the conditions are used for the tag table and the tag array
+            values = values * 2
+
+        execute(db, get_sql_for_dimension_counts(dimension, ' AND '.join(where_clause), limit), values)
+        results = db.fetchall()
+        return [(result['name'], result['count']) for result in results]
+
+    @classmethod
+    def load_all_after_id(
+        cls,
+        db: Any,
+        lowest_id: int,
+        extra: Optional[Dict[str, Any]] = None,
+        search: Optional[str] = None,
+        search_mode: str = 'substring'
+    ) -> List["LogEntry"]:
+        """
+        Load all entries newer than ``lowest_id``
+
+        :param extra: Only load entries whose extra fields contain all of these key-value pairs
+        :param search: Only load entries whose message matches this search term
+        :param search_mode: ``substring`` or ``words``, see ``load_all_with_date``
+        """
+        where_clause = []
+        values: List[Any] = [lowest_id]
+        if extra is not None:
+            where_clause.append('le.extra @> %s::jsonb')
+            values.append(json.dumps(extra))
+        if search is not None:
+            where_clause.append(get_sql_for_search('%s', search_mode, '%s'))
+            values.extend([get_search_value(search, search_mode)] * 2)
+        execute(db, get_sql_for_entry_after_id("%s", ' AND '.join(where_clause)), values)
 
         entries = []
         for result in db.fetchall():
@@ -86,11 +373,16 @@ class LogEntry(BaseLogEntry, SyncModel):
         return entries
 
     def add_tag(self, db: Any, tag: LogTag):
+        if self.tag_ids is not None:
+            self.add_tags(db, [tag])
+            return
+
         cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
         if cached_tags is not None:
             cached_tags.append(tag)
 
-        db.execute(
+        execute(
+            db,
             'INSERT INTO logger_log_tag ("logID", "tagID") VALUES (%s, %s);',
             [self.pk, tag.pk]
         )
@@ -103,6 +395,12 @@ class LogEntry(BaseLogEntry, SyncModel):
 
         if len(tags) == 0:
             return
+
+        if self.tag_ids is not None:
+            self.tag_ids = sorted(set(self.tag_ids) | set(tag.pk for tag in tags))
+            execute(db, f'UPDATE {self.table} SET "tagIDs" = %s WHERE id = %s;', [self.tag_ids, self.pk])
+            return
+
         values: List[int] = []
         placeholders: List[str] = []
         for tag in tags:
@@ -111,13 +409,113 @@ class LogEntry(BaseLogEntry, SyncModel):
             values.append(tag.pk)
 
         sql = f'INSERT INTO logger_log_tag ("logID", "tagID") VALUES {", ".join(placeholders)};'
-        db.execute(sql, values)
+        execute(db, sql, values)
+
+    @classmethod
+    def add_tags_many(cls, db: Any, entries: List[Tuple["LogEntry", List[LogTag]]]):
+        """
+        Tag multiple entries with one multi-row insert per chunk
+        """
+        values: List[int] = []
+        for entry, tags in entries:
+            cached_tags: Optional[List[LogTag]] = getattr(entry, '_tags', None)
+            if cached_tags is not None:
+                cached_tags.extend(tags)
+            for tag in tags:
+                values.append(entry.pk)
+                values.append(tag.pk)
+
+        chunk_size = MAX_PARAMETERS - (MAX_PARAMETERS % 2)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            placeholders = ['(%s, %s)' for _ in range(0, len(chunk), 2)]
+            sql = f'INSERT INTO logger_log_tag ("logID", "tagID") VALUES {", ".join(placeholders)};'
+            execute(db, sql, chunk)
+
+    @classmethod
+    def copy_many(cls, db: Any, items: List[Dict[str, Any]], tag_ids: Optional[List[List[int]]]=None) -> List[int]:
+        """
+        Bulk load entries with ``COPY``, the ids are allocated from the sequence up front
+        so the tags can be copied into ``logger_log_tag`` right away
+
+        :param items: Entry data like for ``create``
+        :param tag_ids: Optional list of tag ids for every item
+        :return: ids of the new entries in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        execute(
+            db,
+            f"SELECT nextval(pg_get_serial_sequence('{cls.table}', 'id')) FROM generate_series(1, %s);",
+            [len(items)]
+        )
+        ids = [row[0] for row in db.fetchall()]
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(dict.fromkeys(key for ser in sers for key in ser.keys()))
+        buffer = io.StringIO()
+        for pk, ser in zip(ids, sers):
+            buffer.write(copy_line([pk] + [ser.get(key, None) for key in keys]))
+        buffer.seek(0)
+        columns = ', '.join(['id'] + [f'"{key}"' for key in keys])
+        sql = f'COPY {cls.table} ({columns}) FROM STDIN'
+        with traced(sql) as trace:
+            db.copy_expert(sql, buffer)
+            trace.rows = len(ids)
+
+        if tag_ids is not None:
+            buffer = io.StringIO()
+            for pk, tags in zip(ids, tag_ids):
+                for tag_id in tags:
+                    buffer.write(f'{pk}\t{tag_id}\n')
+            buffer.seek(0)
+            sql = 'COPY logger_log_tag ("logID", "tagID") FROM STDIN'
+            with traced(sql) as trace:
+                db.copy_expert(sql, buffer)
+                trace.rows = sum(len(tags) for tags in tag_ids)
+
+        return ids
+
+    @classmethod
+    def create_staged(cls, db: Any, tags: List[LogTag], **kwargs) -> int:
+        """
+        Insert an entry and its tags into the unlogged staging tables with one statement,
+        the entry is moved to ``logger_log`` by ``merge_staging``
+
+        :return: id of the entry
+        """
+        ser = cls.serialize_data(kwargs)
+        params = ['%s' for _ in ser.keys()]
+        execute(
+            db,
+            get_sql_for_staged_entry(list(ser.keys()), params, '%s'),
+            list(ser.values()) + [[tag.pk for tag in tags]]
+        )
+        return db.fetchone()['id']
+
+    @classmethod
+    def merge_staging(cls, db: Any) -> int:
+        """
+        Move all entries and tags from the staging tables to ``logger_log``
+
+        :return: Number of moved entries
+        """
+        execute(db, get_sql_for_merge_staging())
+        return db.fetchone()['count']
 
     def remove_tag(self, db: Any, tag: LogTag):
         cached_tags: Optional[List[LogTag]] = getattr(self, '_tags', None)
         if cached_tags is not None:
             cached_tags.remove(tag)
-        db.execute(
+
+        if self.tag_ids is not None:
+            self.tag_ids = [tag_id for tag_id in self.tag_ids if tag_id != tag.pk]
+            execute(db, f'UPDATE {self.table} SET "tagIDs" = %s WHERE id = %s;', [self.tag_ids, self.pk])
+            return
+
+        execute(
+            db,
             'DELETE FROM logger_log_tag WHERE "logID" = %s AND "tagID" = %s;',
             [self.pk, tag.pk]
         )
@@ -127,12 +525,15 @@ class LogEntry(BaseLogEntry, SyncModel):
 
         if cached_tags is None:
             cached_tags = []
-            sql = f"""
-                SELECT t.* FROM logger_log_tag lt
-                JOIN logger_tag t ON t.id = lt."tagID"
-                WHERE "logID" = %s;
-            """
-            db.execute(sql, [self.pk])
+            if self.tag_ids is not None:
+                execute(db, f'SELECT * FROM {LogTag.table} WHERE id = ANY(%s::integer[]);', [self.tag_ids])
+            else:
+                sql = f"""
+                    SELECT t.* FROM logger_log_tag lt
+                    JOIN logger_tag t ON t.id = lt."tagID"
+                    WHERE "logID" = %s;
+                """
+                execute(db, sql, [self.pk])
             result = db.fetchone()
             while result is not None:
                 cached_tags.append(LogTag(rowdata=result))
@@ -142,16 +543,40 @@ class LogEntry(BaseLogEntry, SyncModel):
         return cached_tags
 
     def function(self, db: Any) -> LogFunction:
-        result = getattr(self, '_function', LogFunction.load(db, pk=self.function_id))
-        setattr(self, '_function', result)
+        result = getattr(self, '_function', None)
+        if result is None:
+            result = LogFunction.load(db, pk=self.function_id)
+            setattr(self, '_function', result)
         return result
 
     def logger(self, db: Any) -> LogLogger:
-        result = getattr(self, '_logger', LogLogger.load(db, pk=self.logger_id))
-        setattr(self, '_logger', result)
+        result = getattr(self, '_logger', None)
+        if result is None:
+            result = LogLogger.load(db, pk=self.logger_id)
+            setattr(self, '_logger', result)
         return result
 
     def hostname(self, db: Any) -> LogHost:
-        result = getattr(self, '_hostname', LogHost.load(db, pk=self.hostname_id))
-        setattr(self, '_hostname', result)
+        result = getattr(self, '_hostname', None)
+        if result is None:
+            result = LogHost.load(db, pk=self.hostname_id)
+            setattr(self, '_hostname', result)
+        return result
+
+    def exception(self, db: Any) -> Optional[LogException]:
+        if self.exception_id is None:
+            return None
+        result = getattr(self, '_exception', None)
+        if result is None:
+            result = LogException.load(db, pk=self.exception_id)
+            setattr(self, '_exception', result)
+        return result
+
+    def template(self, db: Any) -> Optional[LogTemplate]:
+        if self.template_id is None:
+            return None
+        result = getattr(self, '_template', None)
+        if result is None:
+            result = LogTemplate.load(db, pk=self.template_id)
+            setattr(self, '_template', result)
         return result
@@ -0,0 +1,6 @@
+from dblogger.models.exception import BaseLogException
+from .model import SyncModel
+
+
+class LogException(BaseLogException, SyncModel):
+    pass
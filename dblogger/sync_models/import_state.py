@@ -0,0 +1,22 @@
+from typing import Any
+
+from dblogger.models.import_state import BaseLogImport
+from .model import SyncModel, execute
+
+
+class LogImport(BaseLogImport, SyncModel):
+
+    @classmethod
+    def save_progress(cls, db: Any, path: str, offset: int, entries: int):
+        """
+        Record how far a file has been imported, run this in the transaction that
+        loaded the entries so the progress always matches the data
+        """
+        execute(db, f'''
+            INSERT INTO {cls.table} (path, "offset", entries) VALUES (%s, %s, %s)
+            ON CONFLICT (path) DO UPDATE SET "offset" = EXCLUDED."offset", entries = {cls.table}.entries + EXCLUDED.entries
+        ''', [path, offset, entries])
+
+    @classmethod
+    def reset(cls, db: Any, path: str):
+        execute(db, f'DELETE FROM {cls.table} WHERE path = %s;', [path])
@@ -1,11 +1,24 @@
 from typing import List, Dict, Any, Tuple, Optional, ClassVar
 
 from dblogger.models.model import BaseModel
+from dblogger.models.tracing import traced
 
 __all__ = ['SyncModel']
 
 # FIXME: psycopg2 does not have any type information yet
 
+# PostgreSQL allows at most 32767 bind parameters per statement
+MAX_PARAMETERS = 32767
+
+
+def execute(db: Any, sql: str, values: Optional[Any]=None):
+    """
+    Execute a statement on a cursor, timed by the installed query tracer
+    """
+    with traced(sql, len(values) if values else 0) as trace:
+        db.execute(sql, values)
+        trace.rows = db.rowcount
+
 
 class SyncModel(BaseModel):
 
@@ -33,7 +46,7 @@ class SyncModel(BaseModel):
             ser['id'] = pk
         where_clause, values = SyncModel.make_where_statement(ser)
 
-        db.execute(f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
+        execute(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
         data = db.fetchone()
         if data is None:
             return None
@@ -44,7 +57,7 @@ class SyncModel(BaseModel):
         ser = cls.serialize_data(kwargs)
         where_clause, values = SyncModel.make_where_statement(ser)
 
-        db.execute(f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
+        execute(db, f'SELECT * FROM {cls.table} WHERE {where_clause};', values)
         return [cls(rowdata=data) for data in db.fetchall()]
 
     @classmethod
@@ -64,10 +77,89 @@ class SyncModel(BaseModel):
             sql += ' ON CONFLICT DO NOTHING'
 
         sql += ' RETURNING *'
-        db.execute(sql, list(values))
+        execute(db, sql, list(values))
         data = db.fetchone()
         return cls(rowdata=data)
 
+    @classmethod
+    def create_many(cls, db: Any, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Insert multiple rows with one multi-row ``INSERT`` per chunk, keys that
+        are missing from some of the items are inserted as ``NULL``.
+
+        :return: List of created models in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(dict.fromkeys(key for ser in sers for key in ser.keys()))
+        value_list = [f'"{v}"' for v in keys]
+        row_params = '(' + ', '.join(['%s' for _ in keys]) + ')'
+        chunk_size = max(1, MAX_PARAMETERS // max(1, len(keys)))
+
+        result: List[Any] = []
+        for start in range(0, len(sers), chunk_size):
+            chunk = sers[start:start + chunk_size]
+            values: List[Any] = []
+            for ser in chunk:
+                values.extend(ser.get(key, None) for key in keys)
+
+            sql = f'''
+                INSERT INTO {cls.table} ({', '.join(value_list)})
+                VALUES {', '.join([row_params for _ in chunk])}
+                RETURNING *
+            '''
+            execute(db, sql, values)
+            result.extend(cls(rowdata=data) for data in db.fetchall())
+        return result
+
+    @classmethod
+    def get_or_create_many(
+        cls,
+        db: Any,
+        items: List[Dict[str, Any]],
+        defaults: Optional[List[Dict[str, Any]]]=None
+    ) -> List[Any]:
+        """
+        Batched ``get_or_create``, looks up all distinct items with one query per chunk
+        and creates the missing ones with ``create_many``. All items have to use the same keys.
+
+        :param items: Lookup data of every item
+        :param defaults: Optional additional data for every item that is only used when creating
+        :return: List of models in the same order as ``items``
+        """
+        if len(items) == 0:
+            return []
+
+        sers = [cls.serialize_data(item) for item in items]
+        keys = list(sers[0].keys())
+        row_keys = [tuple(ser[key] for key in keys) for ser in sers]
+        unique = list(dict.fromkeys(row_keys))
+        row_clause = '(' + ' AND '.join([f'"{key}" = %s' for key in keys]) + ')'
+        chunk_size = min(1000, max(1, MAX_PARAMETERS // max(1, len(keys))))
+
+        found: Dict[Tuple[Any, ...], Any] = {}
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            values: List[Any] = []
+            for row_key in chunk:
+                values.extend(row_key)
+            execute(db, f'SELECT * FROM {cls.table} WHERE {" OR ".join([row_clause for _ in chunk])};', values)
+            for data in db.fetchall():
+                found[tuple(data[key] for key in keys)] = cls(rowdata=data)
+
+        missing: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for idx, (row_key, item) in enumerate(zip(row_keys, items)):
+            if row_key not in found and row_key not in missing:
+                if defaults is not None:
+                    item = dict(item, **defaults[idx])
+                missing[row_key] = item
+        created = cls.create_many(db, list(missing.values()))
+        found.update(zip(missing.keys(), created))
+
+        return [found[row_key] for row_key in row_keys]
+
     @classmethod
     def get_or_create(cls, db: Any, **kwargs) -> Any:
         item = cls.load(db, **kwargs)
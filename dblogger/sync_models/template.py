@@ -0,0 +1,6 @@
+from dblogger.models.template import BaseLogTemplate
+from .model import SyncModel
+
+
+class LogTemplate(BaseLogTemplate, SyncModel):
+    pass
@@ -1,14 +1,18 @@
 from typing import List
 from logging import LoggerAdapter, Logger
 
+from .tagscope import TagSet, intern_tags
+
 __all__ = ['TaggedLogger']
 
 
 class TaggedLogger(LoggerAdapter):
     tags: List[str]
+    tag_set: TagSet
 
     def __init__(self, logger: Logger, *args):
         self.tags = [str(a) for a in args]
+        self.tag_set = intern_tags(self.tags)
         super().__init__(logger, None)
 
     def process(self, msg, kwargs):
@@ -16,11 +20,11 @@ class TaggedLogger(LoggerAdapter):
         Process the logging message and keyword arguments passed in to
         a logging call to insert contextual information.
         """
-        if 'extra' not in kwargs:
-            kwargs['extra'] = {}
-        if 'tags' not in kwargs['extra']:
-            kwargs['extra']['tags'] = set()
-        if isinstance(kwargs['extra']['tags'], list):
-             kwargs['extra']['tags'] = set(kwargs['extra']['tags'])
-        kwargs['extra']['tags'].update(self.tags)
+        extra = kwargs.get('extra', None)
+        if extra is None:
+            kwargs['extra'] = {'tags': self.tag_set}
+        elif not extra.get('tags', None):
+            extra['tags'] = self.tag_set
+        else:
+            extra['tags'] = intern_tags(self.tag_set.union(intern_tags(extra['tags'])))
         return msg, kwargs
@@ -0,0 +1,126 @@
+from typing import FrozenSet, Iterable, Optional, Callable, Any, Tuple
+import functools
+import weakref
+
+from contextvars import ContextVar, Token
+from logging import LogRecord
+
+__all__ = ['TagSet', 'EMPTY_TAGS', 'intern_tags', 'tag_scope', 'current_tags', 'attach_scope_tags']
+
+
+class TagSet(frozenset):
+    """
+    Immutable set of tag names, equal tag sets returned by ``intern_tags`` are the same
+    object so the handlers can resolve the DB ids of a tag combination once and look them
+    up by identity afterwards
+    """
+
+    def __repr__(self) -> str:
+        return f'TagSet({sorted(self)!r})'
+
+
+EMPTY_TAGS = TagSet()
+
+# interned tag sets, keyed by the tag set and by the raw frozenset that was interned,
+# a tag set is dropped once no record, scope or handler cache references it anymore
+_interned: 'weakref.WeakValueDictionary[FrozenSet[Any], TagSet]' = weakref.WeakValueDictionary()
+_interned[frozenset()] = EMPTY_TAGS
+
+# tags of the current scope, ``contextvars`` keep them per thread and per asyncio task
+_scope: ContextVar[TagSet] = ContextVar('dblogger_tags', default=EMPTY_TAGS)
+
+# tokens of the entered ``tag_scope`` blocks of the current context, innermost last
+_tokens: ContextVar[Tuple[Token, ...]] = ContextVar('dblogger_tag_tokens', default=())
+
+
+def intern_tags(tags: Iterable[Any]) -> TagSet:
+    """
+    Return the interned ``TagSet`` for a collection of tags, tags are converted to strings
+    and empty tags are removed
+    """
+    if isinstance(tags, TagSet):
+        return tags
+
+    key = tags if isinstance(tags, frozenset) else frozenset(tags)
+    result = _interned.get(key, None)
+    if result is None:
+        normalized = TagSet(str(tag) for tag in key if tag is not None and tag != '')
+        # keyed by a plain copy, a ``TagSet`` key would keep its own weak value alive
+        result = _interned.setdefault(frozenset(normalized), normalized)
+        _interned[key] = result
+    return result
+
+
+def current_tags() -> TagSet:
+    """
+    Tags of the current scope
+    """
+    return _scope.get()
+
+
+def attach_scope_tags(record: LogRecord):
+    """
+    Merge the tags of the current scope into the ``tags`` attribute of a record, called by
+    the handlers in the context of the logging call. Afterwards ``record.tags`` is always
+    an interned ``TagSet``.
+    """
+    scope = _scope.get()
+    tags = getattr(record, 'tags', None)
+    if not tags:
+        record.tags = scope
+    elif len(scope) == 0:
+        record.tags = intern_tags(tags)
+    else:
+        record.tags = intern_tags(scope.union(intern_tags(tags)))
+
+
+class tag_scope:
+    """
+    Add tags to every record logged in a block, a function or a coroutine (including the
+    tasks it starts), scopes can be nested:
+
+    .. code-block:: python
+
+        with tag_scope('request', request_id):
+            logger.info('tagged with "request" and the request id')
+
+        @tag_scope('worker')
+        async def work():
+            logger.info('tagged with "worker"')
+    """
+
+    tags: TagSet
+
+    def __init__(self, *tags: Any):
+        self.tags = intern_tags(tags)
+
+    def __enter__(self) -> TagSet:
+        scope = _scope.get()
+        tags = self.tags if len(scope) == 0 else intern_tags(scope.union(self.tags))
+        # the token stack lives in the context too, so one scope object may be
+        # entered by several threads or tasks at the same time
+        _tokens.set(_tokens.get() + (_scope.set(tags),))
+        return tags
+
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
+        tokens = _tokens.get()
+        _tokens.set(tokens[:-1])
+        _scope.reset(tokens[-1])
+        return None
+
+    def __call__(self, func: Callable) -> Callable:
+        # imported here to keep ``import dblogger`` cheap
+        from asyncio import iscoroutinefunction
+
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tag_scope(*self.tags):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tag_scope(*self.tags):
+                return func(*args, **kwargs)
+        return wrapper
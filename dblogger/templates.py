@@ -0,0 +1,71 @@
+from typing import Optional, Tuple, Any
+import hashlib
+import math
+
+from logging import LogRecord
+
+__all__ = ['split_message', 'render_message', 'template_hash']
+
+_NATIVE = (str, int, float, bool, type(None))
+
+
+def _is_native(value: Any) -> bool:
+    # exact type check, subclasses like ``IntEnum`` format differently than their JSON value
+    if type(value) not in _NATIVE:
+        return False
+    if type(value) is float and not math.isfinite(value):
+        return False
+    return True
+
+
+def split_message(record: LogRecord) -> Optional[Tuple[str, Any]]:
+    """
+    Split a record into its message template and arguments.
+
+    Only records whose arguments survive a JSON round trip unchanged are split,
+    everything else has to be stored as a formatted message.
+
+    :return: Tuple of template and arguments (``None``, a list or a dict) or ``None``
+             if the record can not be stored as a template
+    """
+    if not isinstance(record.msg, str):
+        return None
+
+    args = record.args
+    if not args:
+        return record.msg, None
+
+    if isinstance(args, tuple):
+        for arg in args:
+            if not _is_native(arg):
+                return None
+        return record.msg, list(args)
+
+    if isinstance(args, dict):
+        for key, value in args.items():
+            if type(key) is not str or not _is_native(value):
+                return None
+        return record.msg, args
+
+    return None
+
+
+def render_message(template: str, args: Any) -> str:
+    """
+    Reconstruct the formatted message from a template and its arguments
+    """
+    if args is None:
+        return template
+    if isinstance(args, list):
+        args = tuple(args)
+    try:
+        return template % args
+    except (TypeError, ValueError, KeyError):
+        return f'{template} {args!r}'
+
+
+def template_hash(template: str) -> str:
+    """
+    Hash of a message template, used as the unique key in the template table
+    """
+    return hashlib.sha1(template.encode('utf-8')).hexdigest()
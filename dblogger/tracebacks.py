@@ -0,0 +1,105 @@
+from typing import Optional, List
+import hashlib
+import re
+import traceback
+
+from logging import LogRecord
+
+__all__ = ['normalize_traceback', 'normalize_traceback_text', 'format_traceback', 'traceback_hash']
+
+_ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+_FRAME_LINE = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+), in (?P<function>.+)$')
+_EXCEPTION_LINE = re.compile(r'^(?P<type>[A-Za-z_][\w.]*)(:|$)')
+
+
+def normalize_traceback(record: LogRecord) -> Optional[str]:
+    """
+    Build the normalized form of the exception and stack info of a record.
+
+    The normalized form only contains the exception types and the code locations
+    of all frames (including chained exceptions), so the same crash always yields
+    the same value regardless of the exception message or memory addresses.
+    Walking the frames is cheap as no source lines have to be loaded.
+
+    :return: Normalized traceback or ``None`` if the record has none
+    """
+    parts: List[str] = []
+
+    if record.exc_info and record.exc_info[0] is not None:
+        exc_type, exc, tb = record.exc_info
+        if exc is None:
+            parts.append(f'{exc_type.__module__}.{exc_type.__qualname__}')
+            while tb is not None:
+                code = tb.tb_frame.f_code
+                parts.append(f'{code.co_filename}:{tb.tb_lineno} in {code.co_name}')
+                tb = tb.tb_next
+
+        seen = set()
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            parts.append(f'{type(exc).__module__}.{type(exc).__qualname__}')
+            tb = exc.__traceback__
+            while tb is not None:
+                code = tb.tb_frame.f_code
+                parts.append(f'{code.co_filename}:{tb.tb_lineno} in {code.co_name}')
+                tb = tb.tb_next
+            if exc.__cause__ is not None:
+                exc = exc.__cause__
+            elif not exc.__suppress_context__:
+                exc = exc.__context__
+            else:
+                exc = None
+
+    if record.stack_info:
+        parts.append(_ADDRESS.sub('0x?', record.stack_info))
+
+    if len(parts) == 0:
+        return None
+    return '\n'.join(parts)
+
+
+def normalize_traceback_text(text: str) -> str:
+    """
+    Normalize a traceback that is only available as text (e.g. read back from a log
+    file), like ``normalize_traceback`` only the exception types and frame locations
+    are kept
+    """
+    parts: List[str] = []
+    for line in text.splitlines():
+        match = _FRAME_LINE.match(line)
+        if match is not None:
+            parts.append(f'{match.group("file")}:{match.group("line")} in {match.group("function")}')
+            continue
+        if line.startswith((' ', 'Traceback ', 'Stack ')):
+            continue
+        match = _EXCEPTION_LINE.match(line)
+        if match is not None:
+            parts.append(match.group('type'))
+
+    if len(parts) == 0:
+        return _ADDRESS.sub('0x?', text)
+    return '\n'.join(parts)
+
+
+def format_traceback(record: LogRecord) -> str:
+    """
+    Format the exception and stack info of a record like ``logging.Formatter`` does
+    """
+    parts: List[str] = []
+
+    if record.exc_text:
+        parts.append(record.exc_text)
+    elif record.exc_info and record.exc_info[0] is not None:
+        parts.append(''.join(traceback.format_exception(*record.exc_info)).rstrip('\n'))
+
+    if record.stack_info:
+        parts.append(record.stack_info)
+
+    return '\n'.join(parts)
+
+
+def traceback_hash(normalized: str) -> str:
+    """
+    Hash of a normalized traceback, used as the unique key in the exception table
+    """
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
@@ -30,9 +30,13 @@ setup(
             'Operating System :: OS Independent'
         ],
         keywords='postgresql psycopg2 asyncpg logger db',
-        packages=['dblogger', 'dblogger.models', 'dblogger.async_models', 'dblogger.sync_models'],
+        packages=['dblogger', 'dblogger.models', 'dblogger.async_models', 'dblogger.sync_models', 'dblogger.psycopg_models', 'dblogger.sqlite_models'],
         scripts=[
             'bin/dblogger_create_schema.py',
+            'bin/dblogger_collector',
+            'bin/dblogger_export',
+            'bin/dblogger_import',
+            'bin/dblogger_querycache',
             'bin/logtail'
         ],
         install_requires=[
@@ -0,0 +1,99 @@
+import os
+import logging
+import itertools
+import importlib.util
+import importlib.machinery
+
+import pytest
+
+from dblogger.sqlite_models import connect, create_schema
+
+_logger_ids = itertools.count()
+
+
+def clear_handler_caches(handler_class: type):
+    # the row caches are class attributes shared by all handlers, every test uses a new database
+    for cls in handler_class.__mro__:
+        for name, value in list(vars(cls).items()):
+            if name.endswith('_cache') and hasattr(value, 'clear'):
+                value.clear()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'log.sqlite3')
+
+
+@pytest.fixture
+def db(db_path):
+    connection = connect(db_path)
+    create_schema(connection)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def make_handler(db_path):
+    """
+    Create SQLite handlers on the test database, closed at the end of the test
+    """
+    from dblogger.sqlite_handler import DBLogHandler
+
+    clear_handler_caches(DBLogHandler)
+    handlers = []
+
+    def make(name: str='test', **kwargs):
+        handler = DBLogHandler(name, db_name=db_path, **kwargs)
+        handlers.append(handler)
+        return handler
+
+    yield make
+    for handler in handlers:
+        handler.close()
+    clear_handler_caches(DBLogHandler)
+
+
+@pytest.fixture
+def make_logger():
+    """
+    Create a logger that only logs to the given handler
+    """
+    loggers = []
+
+    def make(handler: logging.Handler, level: int=logging.DEBUG) -> logging.Logger:
+        logger = logging.getLogger(f'dblogger.tests.{next(_logger_ids)}')
+        logger.propagate = False
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        loggers.append((logger, handler))
+        return logger
+
+    yield make
+    for logger, handler in loggers:
+        logger.removeHandler(handler)
+
+
+@pytest.fixture
+def sqlite_run_mode():
+    """
+    Force the SQLite run mode for code that picks the driver by ``get_run_mode``
+    """
+    import dblogger
+
+    previous = dblogger._run_mode
+    dblogger.set_run_mode('sqlite')
+    yield
+    dblogger.set_run_mode(previous)
+
+
+@pytest.fixture
+def logtail(sqlite_run_mode):
+    """
+    The ``logtail`` script loaded as a module in the SQLite run mode
+    """
+    pytest.importorskip('termcolor')
+    path = os.path.join(os.path.dirname(__file__), '..', 'bin', 'logtail')
+    loader = importlib.machinery.SourceFileLoader('logtail', path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader('logtail', loader))
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,155 @@
+import time
+import asyncio
+import logging
+
+import pytest
+
+pytest.importorskip('asyncpg')
+
+from dblogger.async_handler import DBLogHandler
+from dblogger.durability import Durability
+
+
+class FakeTransaction:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.records = []
+        self.state = 'new'
+
+    async def start(self):
+        self.state = 'started'
+        self.connection.current = self
+
+    async def commit(self):
+        if self.connection.failing_commits > 0:
+            self.connection.failing_commits -= 1
+            raise ConnectionError('commit failed')
+        self.state = 'committed'
+
+    async def rollback(self):
+        self.state = 'rolled back'
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.transactions = []
+        self.current = None
+        self.failing_commits = 0
+
+    def transaction(self):
+        transaction = FakeTransaction(self)
+        self.transactions.append(transaction)
+        return transaction
+
+    async def execute(self, sql):
+        pass
+
+    def is_closed(self):
+        return False
+
+
+def make_record(message: str, level: int=logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord('test', level, __file__, 1, message, (), None)
+
+
+def committed(db: FakeConnection):
+    return [transaction.records for transaction in db.transactions if transaction.state == 'committed']
+
+
+@pytest.fixture
+def run_handler(monkeypatch):
+    def run(test, failing=(), group_commit=0.2):
+        async def main():
+            db = FakeConnection()
+            handler = DBLogHandler('test', db=db, durability=Durability(level=logging.ERROR, group_commit=group_commit))
+            handler.queue = type(handler.queue)()
+
+            async def async_emit(record):
+                if record.msg in failing:
+                    return False
+                db.current.records.append(record.msg)
+                return True
+
+            monkeypatch.setattr(handler, 'async_emit', async_emit)
+            # the test drives ``emit_group`` itself, the emitter must not pick up records
+            handler.emitter.cancel()
+            try:
+                await handler.emitter
+            except asyncio.CancelledError:
+                pass
+            return await test(handler, db)
+        return asyncio.run(main())
+    return run
+
+
+def test_group_waits_for_the_window(run_handler):
+    async def test(handler, db):
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.05, lambda: (handler.put(make_record('second')), handler.wake()))
+        started = time.monotonic()
+        next_record = await handler.emit_group(make_record('first'))
+        return db, next_record, time.monotonic() - started
+
+    db, next_record, elapsed = run_handler(test)
+    assert committed(db) == [['first', 'second']]
+    assert next_record is None
+    assert elapsed >= 0.15
+
+
+def test_error_commits_the_group(run_handler):
+    async def test(handler, db):
+        handler.put(make_record('failed', logging.ERROR))
+        handler.put(make_record('later'))
+        next_record = await handler.emit_group(make_record('first'))
+        return db, next_record
+
+    db, next_record = run_handler(test)
+    assert committed(db) == [['first', 'failed']]
+    assert next_record.msg == 'later'
+
+
+def test_failed_record_only_skips_itself(run_handler):
+    async def test(handler, db):
+        for message in ('second', 'bad', 'after'):
+            handler.put(make_record(message))
+        next_record = await handler.emit_group(make_record('first'))
+        return handler, db, next_record
+
+    handler, db, next_record = run_handler(test, failing=('bad',))
+    assert db.transactions[0].state == 'rolled back'
+    assert committed(db) == [['first'], ['second']]
+    assert next_record.msg == 'after'
+    assert handler.durability.lost == 0
+
+
+def test_failed_commit_rewrites_the_group(run_handler):
+    async def test(handler, db):
+        db.failing_commits = 1
+        handler.put(make_record('error', logging.ERROR))
+        handler.put(make_record('later'))
+        next_record = await handler.emit_group(make_record('first'))
+        return handler, db, next_record
+
+    handler, db, next_record = run_handler(test)
+    assert db.transactions[0].state == 'rolled back'
+    # the error record that ended the group is written again as well
+    assert committed(db) == [['first'], ['error']]
+    assert next_record.msg == 'later'
+    assert handler.durability.lost == 0
+
+
+def test_drain_commits_the_open_group(run_handler):
+    async def test(handler, db):
+        group = asyncio.ensure_future(handler.emit_group(make_record('first')))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        handler.draining = True
+        handler.group_waiter.set_result(True)
+        await group
+        return db, time.monotonic() - started
+
+    db, elapsed = run_handler(test, group_commit=10)
+    assert committed(db) == [['first']]
+    assert elapsed < 1
@@ -0,0 +1,55 @@
+from dblogger.models.tracing import QueryTracer, set_tracer
+from dblogger.sqlite_models import LogEntry
+
+
+def log_twice(logger, message: str):
+    logger.info(message)
+
+
+def test_callsite_is_resolved_once(make_handler, make_logger, db):
+    handler = make_handler()
+    logger = make_logger(handler)
+    log_twice(logger, 'first')
+
+    tracer = QueryTracer()
+    previous = set_tracer(tracer)
+    try:
+        log_twice(logger, 'second')
+    finally:
+        set_tracer(previous)
+
+    # only the entry itself is written, no dimension lookups
+    assert [stats.shape.split()[0:3] for stats in tracer.statements.values()] == [['INSERT', 'INTO', 'logger_log']]
+    assert len(handler.callsite_cache) == 1
+
+
+def test_callsites_by_code_location(make_handler, make_logger, db):
+    handler = make_handler()
+    logger = make_logger(handler)
+    log_twice(logger, 'first')
+    log_twice(logger, 'second')
+    logger.info('other line')
+    handler.close()
+
+    entries = {entry.message: entry for entry in LogEntry.load_all_with_date(db.cursor(), limit=10)}
+    assert entries['first'].function_id == entries['second'].function_id
+    assert entries['first'].function_id != entries['other line'].function_id
+    assert entries['first'].logger_id == entries['other line'].logger_id
+    function = entries['first'].function(db.cursor())
+    assert function.name == f'{logger.name}.log_twice'
+    assert function.source(db.cursor()).path == __file__
+
+
+def test_callsite_cache_is_per_handler_name(make_handler, make_logger, db):
+    first = make_handler('first')
+    second = make_handler('second')
+    logger = make_logger(first)
+    logger.addHandler(second)
+    log_twice(logger, 'both')
+    logger.removeHandler(second)
+    first.close()
+    second.close()
+
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=10)
+    assert sorted(entry.logger(db.cursor()).name for entry in entries) == ['first', 'second']
+    assert len(set(entry.function_id for entry in entries)) == 1
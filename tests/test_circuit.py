@@ -0,0 +1,138 @@
+import logging
+
+import pytest
+
+from dblogger import circuit
+from dblogger.circuit import CircuitBreaker
+from dblogger.sync_handler import DBLogHandler as SyncDBLogHandler
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCursor:
+
+    def execute(self, sql, values=None):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, closed: bool=False):
+        self.closed = closed
+
+    def cursor(self):
+        return FakeCursor()
+
+    def close(self):
+        self.closed = True
+
+
+class FlakyHandler(SyncDBLogHandler):
+    """
+    Sync handler whose connection attempts fail until ``available`` is set
+    """
+
+    available = False
+    connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if not self.available:
+            raise ConnectionError('DB is down')
+        return FakeConnection()
+
+    def write_entry(self, cursor, record):
+        self.written.append(record.msg)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.msg)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit.time, 'monotonic', clock)
+    monkeypatch.setattr(circuit.random, 'random', lambda: 1.0)
+    return clock
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord('test', logging.INFO, __file__, 1, msg, (), None)
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=2, base_delay=1.0)
+    breaker.failure()
+    assert breaker.state == 'closed'
+    breaker.failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.remaining == 1.0
+
+    clock.now += 1.0
+    assert breaker.allow()
+    assert breaker.state == 'half-open'
+    assert breaker.remaining == 0.0
+
+
+def test_failed_probe_doubles_the_delay(clock):
+    breaker = CircuitBreaker(base_delay=1.0, max_delay=3.0)
+    delays = []
+    for _ in range(4):
+        breaker.allow()
+        breaker.failure()
+        delays.append(breaker.remaining)
+        clock.now += breaker.remaining
+    assert delays == [1.0, 2.0, 3.0, 3.0]
+
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.opened == 0
+
+
+def test_rejected_records(clock):
+    breaker = CircuitBreaker()
+    breaker.reject(make_record('dropped'))
+    assert breaker.dropped == 1
+
+    fallback = ListHandler()
+    breaker = CircuitBreaker(fallback=fallback)
+    breaker.reject(make_record('diverted'))
+    assert breaker.diverted == 1
+    assert fallback.records == ['diverted']
+
+
+def test_handler_diverts_records_while_the_db_is_down(clock):
+    fallback = ListHandler()
+    handler = FlakyHandler('test', db=FakeConnection(closed=True), circuit_breaker=CircuitBreaker(fallback=fallback))
+    handler.db_config = 'postgresql://localhost/logs'
+    handler.written = []
+
+    handler.write(make_record('first'))
+    handler.write(make_record('second'))
+    # no connection attempt while the circuit is open
+    assert handler.connects == 1
+    assert fallback.records == ['first', 'second']
+    assert handler.circuit_breaker.state == 'open'
+
+    handler.available = True
+    clock.now += handler.circuit_breaker.base_delay
+    handler.write(make_record('third'))
+    assert handler.connects == 2
+    assert handler.circuit_breaker.state == 'closed'
+    assert handler.written == ['third']
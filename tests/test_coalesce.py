@@ -0,0 +1,83 @@
+import time
+import logging
+
+from dblogger.coalesce import Coalescer
+from dblogger.sqlite_models import LogEntry, connect
+
+
+def make_record(created: float, msg: str='message', level: int=logging.INFO, tags=None) -> logging.LogRecord:
+    record = logging.LogRecord('test', level, __file__, 1, msg, (), None)
+    record.created = created
+    if tags is not None:
+        record.tags = tags
+    return record
+
+
+def test_identical_records_are_folded():
+    coalescer = Coalescer(window=10)
+    first = make_record(100.0)
+
+    assert coalescer.add(first) == []
+    assert coalescer.add(make_record(101.0)) == []
+    assert coalescer.add(make_record(102.0)) == []
+    assert first.repeat_count == 3
+    assert first.last_created == 102.0
+    assert coalescer.coalesced == 2
+    assert coalescer.next_expiry() == 110.0
+
+
+def test_different_records_are_kept_apart():
+    coalescer = Coalescer(window=10)
+    records = [
+        make_record(100.0),
+        make_record(100.0, msg='other'),
+        make_record(100.0, level=logging.WARNING),
+        make_record(100.0, tags=['a']),
+    ]
+    for record in records:
+        coalescer.add(record)
+    # tags are compared as sets
+    coalescer.add(make_record(100.0, tags=('a', )))
+
+    assert [record.repeat_count for record in records] == [1, 1, 1, 2]
+
+
+def test_window_expiry():
+    coalescer = Coalescer(window=10)
+    first = make_record(100.0)
+    coalescer.add(first)
+
+    assert coalescer.expired(109.0) == []
+    ready = coalescer.add(make_record(110.0))
+    assert ready == [first]
+    assert first.repeat_count == 1
+    assert coalescer.next_expiry() == 120.0
+    assert len(coalescer.flush()) == 1
+    assert coalescer.next_expiry() is None
+
+
+def test_max_size_closes_oldest_window():
+    coalescer = Coalescer(window=10, max_size=2)
+    first = make_record(100.0, msg='first')
+    coalescer.add(first)
+    coalescer.add(make_record(100.0, msg='second'))
+
+    assert coalescer.add(make_record(100.0, msg='third')) == [first]
+
+
+def test_handler_flushes_window_without_further_records(make_handler, make_logger, db_path):
+    handler = make_handler(coalescer=Coalescer(window=0.1))
+    logger = make_logger(handler)
+    for _ in range(3):
+        logger.info('burst')
+
+    deadline = time.time() + 5
+    entries = []
+    while len(entries) == 0 and time.time() < deadline:
+        time.sleep(0.05)
+        connection = connect(db_path)
+        entries = LogEntry.load_all_with_date(connection.cursor(), limit=10)
+        connection.close()
+
+    assert [(entry.message, entry.repeat_count) for entry in entries] == [('burst', 3)]
+    assert entries[0].last_time >= entries[0].time
@@ -0,0 +1,205 @@
+import os
+import stat
+import socket
+import asyncio
+import logging
+
+import pytest
+
+from dblogger.collector import Collector, CollectorHandler, encode_record, decode_record, DEFAULT_SOCKET_MODE
+from dblogger.sqlite_models import LogEntry
+
+
+class FakeConnection:
+    closed = False
+
+
+class FakeWriter:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_record(message: str='hello', **extra) -> logging.LogRecord:
+    record = logging.LogRecord('dblogger.tests', logging.WARNING, __file__, 42, message, (), None, 'test')
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_encode_decode():
+    record = make_record(tags=['a', 'b'], request_id='r1')
+    frame = encode_record('service', record, ['request_id'])
+    item = decode_record(frame[4:])
+
+    assert item['logger_name'] == 'service'
+    assert item['message'] == 'hello'
+    assert item['levelno'] == logging.WARNING
+    assert item['lineno'] == 42
+    assert sorted(item['tags']) == ['a', 'b']
+    assert item['extra'] == {'request_id': 'r1'}
+    assert item['normalized_traceback'] is None
+
+
+def test_decode_malformed_extra(caplog):
+    frame = encode_record('service', make_record(request_id='r1'), ['request_id'])
+    # same length, so the frame itself stays intact
+    item = decode_record(frame[4:].replace(b'"r1"}', b'"r1",'))
+
+    assert item['message'] == 'hello'
+    assert item['extra'] is None
+    assert 'Dropping malformed extra fields' in caplog.text
+
+
+def test_oversized_frame_closes_connection():
+    collector = Collector('', run_mode='sync', max_frame_size=1024)
+
+    async def run():
+        collector.flush_requested = asyncio.Event()
+        reader = asyncio.StreamReader()
+        small = encode_record('service', make_record('small'))
+        large = encode_record('service', make_record('x' * 2048))
+        reader.feed_data(small + large + small)
+        reader.feed_eof()
+        writer = FakeWriter()
+        await collector.handle_client(reader, writer)
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.closed
+    assert [item['message'] for item in collector.pending] == ['small']
+
+
+def test_handler_does_not_send_oversized_records():
+    handler = CollectorHandler('service', max_frame_size=1024)
+    server, client = socket.socketpair()
+    handler.sock = client
+    handler.pid = os.getpid()
+    errors = []
+    handler.handleError = errors.append
+
+    handler.emit(make_record('x' * 2048))
+    handler.emit(make_record('small'))
+    handler.close()
+
+    assert len(errors) == 1
+    data = server.recv(65536)
+    server.close()
+    assert decode_record(data[4:])['message'] == 'small'
+
+
+def test_reconnect_with_backoff(monkeypatch):
+    collector = Collector('', run_mode='sync')
+    collector.pending = [decode_record(encode_record('service', make_record())[4:])]
+    attempts = []
+
+    async def failing_connect():
+        attempts.append(collector.reconnect_delay)
+        raise ConnectionError('DB down')
+
+    async def working_connect():
+        attempts.append(collector.reconnect_delay)
+        collector.db = FakeConnection()
+
+    written = []
+    monkeypatch.setattr(collector, 'connect', failing_connect)
+    monkeypatch.setattr(collector, 'write_sync', written.append)
+
+    asyncio.run(collector.flush())
+    asyncio.run(collector.flush())
+    # second flush is within the backoff delay
+    assert len(attempts) == 1
+    assert len(collector.pending) == 1
+    assert collector.reconnect_delay == 1.0
+
+    collector.reconnect_at = 0.0
+    asyncio.run(collector.flush())
+    assert len(attempts) == 2
+    assert collector.reconnect_delay == 2.0
+
+    collector.reconnect_at = 0.0
+    monkeypatch.setattr(collector, 'connect', working_connect)
+    asyncio.run(collector.flush())
+    assert len(written) == 1
+    assert collector.pending == []
+    assert collector.reconnect_delay == 0.5
+
+
+def test_keep_records_when_connection_is_lost(monkeypatch):
+    collector = Collector('', run_mode='sync', max_pending=3)
+    collector.db = FakeConnection()
+
+    def lose_connection(batch):
+        collector.db.closed = True
+        raise ConnectionError('connection lost')
+
+    monkeypatch.setattr(collector, 'write_sync', lose_connection)
+    collector.pending = [{'message': str(i)} for i in range(5)]
+    asyncio.run(collector.flush())
+
+    assert [item['message'] for item in collector.pending] == ['2', '3', '4']
+
+
+def test_socket_mode(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / 'collector.sock')
+    collector = Collector('', socket_path=socket_path, run_mode='sync')
+
+    async def connect():
+        collector.db = FakeConnection()
+
+    monkeypatch.setattr(collector, 'connect', connect)
+
+    async def run():
+        task = asyncio.ensure_future(collector.run())
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            await asyncio.sleep(0.01)
+        mode = stat.S_IMODE(os.stat(socket_path).st_mode)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return mode
+
+    assert asyncio.run(run()) == DEFAULT_SOCKET_MODE
+    assert not os.path.exists(socket_path)
+
+
+def test_start_while_db_is_down(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / 'collector.sock')
+    collector = Collector('', socket_path=socket_path, run_mode='sync')
+
+    async def failing_connect():
+        raise ConnectionError('DB down')
+
+    monkeypatch.setattr(collector, 'connect', failing_connect)
+
+    async def run():
+        task = asyncio.ensure_future(collector.run())
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            await asyncio.sleep(0.01)
+        bound = os.path.exists(socket_path)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return bound
+
+    assert asyncio.run(run())
+    assert collector.db is None
+    assert collector.reconnect_at > 0.0
+
+
+def test_write_sqlite(db):
+    collector = Collector('', run_mode='sqlite')
+    collector.db = db
+    records = [make_record('first', tags=['a']), make_record('second', request_id='r1')]
+    batch = [decode_record(encode_record('service', record, ['request_id'])[4:]) for record in records]
+    collector.write_sync(batch)
+
+    entries = {entry.message: entry for entry in LogEntry.load_all_with_date(db.cursor(), limit=10)}
+    assert sorted(entries) == ['first', 'second']
+    assert entries['second'].extra == {'request_id': 'r1'}
+    assert entries['first'].logger(db.cursor()).name == 'service'
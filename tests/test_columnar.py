@@ -0,0 +1,104 @@
+import struct
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from dblogger.coalesce import Coalescer
+from dblogger.columnar import Categorical, parse_binary_copy, arrays_from_rows
+from dblogger.models.entry import COLUMNAR_FIELDS
+from dblogger.sqlite_models import LogEntry
+
+ROWS = [
+    (1, 1700000000.5, logging.INFO, 10, 1, 1, 1, 0, 0, 1),
+    (2, 1700000001.25, logging.ERROR, 10, 2, 1, 1, 3, 0, 4),
+]
+FORMATS = {'int4': '>i', 'int8': '>q', 'float8': '>d'}
+
+
+def binary_copy(rows) -> bytes:
+    data = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+    for row in rows:
+        data += struct.pack('>h', len(COLUMNAR_FIELDS))
+        for value, (_, _, pg_type) in zip(row, COLUMNAR_FIELDS):
+            packed = struct.pack(FORMATS[pg_type], value)
+            data += struct.pack('>i', len(packed)) + packed
+    return data + struct.pack('>h', -1)
+
+
+def test_parse_binary_copy():
+    arrays = parse_binary_copy(binary_copy(ROWS))
+
+    assert arrays['id'].dtype == np.int64
+    assert arrays['id'].tolist() == [1, 2]
+    assert arrays['time'].tolist() == [1700000000.5, 1700000001.25]
+    assert arrays['repeat_count'].tolist() == [1, 4]
+    assert arrays['level'].dtype == np.int32
+
+
+def test_parse_binary_copy_rejects_text():
+    with pytest.raises(ValueError):
+        parse_binary_copy(b'1\t2\n')
+
+
+def test_arrays_from_rows_match_binary_copy():
+    expected = parse_binary_copy(binary_copy(ROWS))
+    arrays = arrays_from_rows(ROWS)
+    for name, _, _ in COLUMNAR_FIELDS:
+        assert arrays[name].dtype == expected[name].dtype
+        assert arrays[name].tolist() == expected[name].tolist()
+
+    empty = arrays_from_rows([])
+    assert len(empty['id']) == 0
+
+
+def test_categorical():
+    column = Categorical(np.array([5, 3, 5, 0]), {3: 'three', 5: 'five'})
+
+    assert len(column) == 4
+    assert column.categories == [None, 'three', 'five']
+    assert column.decode().tolist() == ['five', 'three', 'five', None]
+    assert column.counts() == {None: 1, 'three': 1, 'five': 2}
+    assert column.counts(np.array([1, 2, 3, 4])) == {None: 4, 'three': 2, 'five': 4}
+
+    # functions on different lines have different ids but the same name
+    column = Categorical(np.array([1, 2, 2]), {1: 'func', 2: 'func'})
+    assert column.counts() == {'func': 3}
+
+
+def test_load_columns(make_handler, make_logger, db):
+    handler = make_handler(extra_fields=['request_id'])
+    logger = make_logger(handler)
+    for idx in range(4):
+        logger.info('message %d', idx, extra={'request_id': idx % 2})
+    logger.error('failed')
+    handler.close()
+
+    now = datetime.now(timezone.utc)
+    columns = LogEntry.load_columns(db.cursor(), now - timedelta(minutes=5), now + timedelta(minutes=5))
+    assert len(columns) == 5
+    assert columns.id.tolist() == sorted(columns.id.tolist())
+    assert columns.count_by('level') == {logging.INFO: 4, logging.ERROR: 1}
+    assert columns.function.counts() == {f'{logger.name}.test_load_columns': 5}
+    assert abs(columns.datetime64()[0] - np.datetime64(now.replace(tzinfo=None))) < np.timedelta64(5, 'm')
+
+    columns = LogEntry.load_columns(db.cursor(), extra={'request_id': 1}, search='message')
+    assert len(columns) == 2
+    assert len(LogEntry.load_columns(db.cursor(), to_date=now - timedelta(minutes=5))) == 0
+
+
+def test_count_by_repeat_count(make_handler, make_logger, db):
+    handler = make_handler(coalescer=Coalescer(window=60))
+    logger = make_logger(handler)
+    for _ in range(5):
+        logger.warning('same')
+    logger.info('other')
+    handler.close()
+
+    columns = LogEntry.load_columns(db.cursor())
+    assert len(columns) == 2
+    assert columns.count_by('level') == {logging.INFO: 1, logging.WARNING: 5}
+    assert columns.function.counts() == {f'{logger.name}.test_count_by_repeat_count': 2}
+    assert columns.count_by('function') == {f'{logger.name}.test_count_by_repeat_count': 6}
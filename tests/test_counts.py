@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from logging import INFO, WARNING
+
+import pytest
+
+from dblogger.coalesce import Coalescer
+from dblogger.models.entry import get_sql_for_dimension_counts, get_sql_for_time_counts, get_sql_for_time_bucket
+from dblogger.sqlite_models import LogEntry
+
+
+def window():
+    now = datetime.now(timezone.utc)
+    return now - timedelta(minutes=5), now + timedelta(minutes=5)
+
+
+@pytest.fixture
+def coalesced_db(make_handler, make_logger, db):
+    """
+    Five identical warnings folded into one entry, two distinct info records
+    """
+    handler = make_handler(coalescer=Coalescer(window=60), tag_storage='array')
+    logger = make_logger(handler)
+    for _ in range(5):
+        logger.warning('same', extra={'tags': ['burst']})
+    handler.close()
+
+    handler = make_handler('other')
+    logger = make_logger(handler)
+    logger.info('first', extra={'tags': ['burst', 'single']})
+    logger.info('second')
+    handler.close()
+    return db
+
+
+def test_coalesced_entry_is_stored_once(coalesced_db):
+    entries = LogEntry.load_all_with_date(coalesced_db.cursor(), limit=10)
+    assert sorted(entry.repeat_count for entry in entries) == [1, 1, 5]
+
+
+def test_count_by_time_sums_repeat_counts(coalesced_db):
+    from_date, to_date = window()
+    rows = LogEntry.count_by_time(coalesced_db.cursor(), from_date, to_date, bucket=3600)
+    counts = {}
+    for row in rows:
+        counts[row['level']] = counts.get(row['level'], 0) + row['count']
+    assert counts == {INFO: 2, WARNING: 5}
+
+    rows = LogEntry.count_by_time(coalesced_db.cursor(), from_date, to_date, bucket=3600, level=WARNING)
+    assert sum(row['count'] for row in rows) == 5
+
+
+def test_count_by_time_buckets(coalesced_db):
+    from_date, to_date = window()
+    for row in LogEntry.count_by_time(coalesced_db.cursor(), from_date, to_date, bucket=60):
+        assert row['time'].second == 0
+        assert row['time'].microsecond == 0
+
+
+@pytest.mark.parametrize('dimension, expected', [
+    ('messages', [('same', 5), ('first', 1), ('second', 1)]),
+    ('loggers', [('test', 5), ('other', 2)]),
+    ('tags', [('burst', 6), ('single', 1)]),
+])
+def test_count_by_sums_repeat_counts(coalesced_db, dimension, expected):
+    from_date, to_date = window()
+    result = LogEntry.count_by(coalesced_db.cursor(), dimension, from_date, to_date)
+    assert result[0] == expected[0]
+    assert sorted(result) == sorted(expected)
+
+
+def test_count_by_functions_and_limit(coalesced_db):
+    from_date, to_date = window()
+    result = LogEntry.count_by(coalesced_db.cursor(), 'functions', from_date, to_date, limit=1)
+    assert len(result) == 1
+    assert result[0][1] == 5
+    name, line = result[0][0].rsplit(':', 1)
+    assert name.endswith('.coalesced_db')
+    assert line.isdigit()
+
+
+def test_count_by_outside_window(coalesced_db):
+    from_date, to_date = window()
+    assert LogEntry.count_by(coalesced_db.cursor(), 'messages', to_date, to_date + timedelta(hours=1)) == []
+
+
+def test_count_by_rejects_unknown_dimension():
+    with pytest.raises(ValueError):
+        get_sql_for_dimension_counts('hosts', '', 10)
+
+
+def test_postgres_counts_sum_repeat_counts():
+    assert 'sum(le."repeatCount")' in get_sql_for_time_counts('', get_sql_for_time_bucket(60))
+    for dimension in ('functions', 'loggers', 'messages'):
+        assert 'sum(le."repeatCount")' in get_sql_for_dimension_counts(dimension, '', 10)
+    assert 'sum(tags."repeatCount")' in get_sql_for_dimension_counts('tags', '', 10)
+
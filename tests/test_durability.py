@@ -0,0 +1,66 @@
+import time
+import logging
+
+import pytest
+
+from dblogger.durability import Durability
+from dblogger.sqlite_models import LogEntry, connect
+
+
+def count_entries(db_path) -> int:
+    connection = connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'SELECT count(*) AS count FROM {LogEntry.table}')
+        return cursor.fetchone()['count']
+    finally:
+        connection.close()
+
+
+def test_relaxed_levels():
+    assert Durability().relaxed(logging.CRITICAL)
+    durability = Durability(level=logging.ERROR)
+    assert durability.relaxed(logging.WARNING)
+    assert not durability.relaxed(logging.ERROR)
+
+
+def test_group_is_committed_after_the_window(make_handler, make_logger, db_path):
+    handler = make_handler(durability=Durability(level=logging.ERROR, group_commit=0.1))
+    logger = make_logger(handler)
+    for idx in range(3):
+        logger.info('relaxed %d', idx)
+    assert count_entries(db_path) == 0
+
+    deadline = time.time() + 5
+    while count_entries(db_path) < 3 and time.time() < deadline:
+        time.sleep(0.02)
+    assert count_entries(db_path) == 3
+    assert handler.uncommitted == 0
+
+
+def test_every_record_is_committed_without_group_commit(make_handler, make_logger, db_path):
+    handler = make_handler(durability=Durability(group_commit=0))
+    logger = make_logger(handler)
+    logger.info('committed')
+    assert count_entries(db_path) == 1
+
+
+def test_rollback_counts_lost_records(make_handler, make_logger, db_path):
+    durability = Durability(level=logging.ERROR, group_commit=60)
+    handler = make_handler(durability=durability)
+    logger = make_logger(handler)
+    logger.info('first')
+    logger.info('second')
+
+    handler.handleError = lambda record: None
+    handler.db.execute('DROP TABLE logger_log_tag')
+    logger.info('fails', extra={'tags': ['x']})
+
+    assert durability.lost == 2
+    assert handler.uncommitted == 0
+    assert count_entries(db_path) == 0
+
+
+def test_sqlite_rejects_staging(make_handler):
+    with pytest.raises(ValueError):
+        make_handler(durability=Durability(staging=True))
@@ -0,0 +1,126 @@
+import os
+import json
+import logging
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dblogger.export import export, split_range, entry_to_row, COLUMNS
+from dblogger.importer import Importer
+from dblogger.sqlite_models import LogEntry
+
+
+@pytest.fixture
+def logged(make_handler, make_logger):
+    handler = make_handler()
+    logger = make_logger(handler)
+    for idx in range(20):
+        logger.info('message %d', idx, extra={'tags': ['export']})
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logger.exception('failed')
+    handler.close()
+    return logger.name
+
+
+def time_range():
+    now = datetime.now(timezone.utc)
+    return now - timedelta(minutes=5), now + timedelta(minutes=5)
+
+
+def test_split_range():
+    start = datetime(2019, 5, 13, 10, 0)
+    ranges = split_range(start, start + timedelta(hours=2), 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == start
+    assert ranges[-1][1] == start + timedelta(hours=2)
+    assert all(prev[1] == cur[0] for prev, cur in zip(ranges, ranges[1:]))
+
+
+def test_entry_to_row(logged, db):
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=1)
+    row = entry_to_row(entries[0])
+    assert list(row.keys()) == COLUMNS
+    assert row['logger'] == 'test'
+    assert row['function'] == f'{logged}.logged'
+    assert row['level_name'] == 'ERROR'
+    assert 'ValueError' in row['traceback']
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_export_sqlite(logged, db_path, tmp_path, sqlite_run_mode, fmt):
+    output = str(tmp_path / f'export.{fmt}')
+    from_date, to_date = time_range()
+    progress = []
+
+    total = export(db_path, from_date, to_date, output, fmt=fmt, workers=2, parts=4, progress=lambda *p: progress.append(p))
+
+    assert total == 21
+    assert [p[0] for p in progress] == [1, 2, 3, 4]
+    assert [name for name in os.listdir(str(tmp_path)) if '.part-' in name] == []
+    with open(output, 'r') as fp:
+        lines = fp.read().splitlines()
+    if fmt == 'ndjson':
+        rows = [json.loads(line) for line in lines]
+        assert sorted(row['message'] for row in rows if row['level'] == logging.INFO) == \
+            sorted(f'message {idx}' for idx in range(20))
+        assert all(row['tags'] == ['export'] for row in rows if row['level'] == logging.INFO)
+    else:
+        assert lines[0] == ','.join(COLUMNS)
+        assert lines.count(lines[0]) == 1
+
+
+def test_export_removes_parts_on_error(db_path, tmp_path, sqlite_run_mode):
+    # no schema in the database, every part fails
+    output = str(tmp_path / 'export.ndjson')
+    open(db_path, 'w').close()
+    from_date, to_date = time_range()
+
+    with pytest.raises(Exception):
+        export(db_path, from_date, to_date, output, workers=2, parts=4)
+
+    assert [name for name in os.listdir(str(tmp_path)) if '.part-' in name] == []
+
+
+def test_export_import_round_trip(logged, db_path, tmp_path, sqlite_run_mode):
+    output = str(tmp_path / 'export.ndjson')
+    target = str(tmp_path / 'target.sqlite3')
+    from_date, to_date = time_range()
+    export(db_path, from_date, to_date, output, workers=2, parts=2)
+
+    from dblogger.sqlite_models import connect, create_schema
+    connection = connect(target)
+    create_schema(connection)
+
+    importer = Importer(target, fmt='ndjson', workers=2, batch_size=5, chunk_size=512)
+    assert importer.import_files([output]) == 21
+
+    entries = LogEntry.load_all_with_date(connection.cursor(), limit=100)
+    connection.close()
+    assert len(entries) == 21
+    assert sorted(entry.message for entry in entries if entry.level == logging.INFO) == \
+        sorted(f'message {idx}' for idx in range(20))
+
+
+def test_export_gzip_parts_are_concatenated(logged, db_path, tmp_path, sqlite_run_mode):
+    import gzip
+
+    output = str(tmp_path / 'export.ndjson.gz')
+    from_date, to_date = time_range()
+
+    assert export(db_path, from_date, to_date, output, compression='gzip', workers=2, parts=3) == 21
+
+    with gzip.open(output, 'rt') as fp:
+        rows = [json.loads(line) for line in fp]
+    assert len(rows) == 21
+    # parts are concatenated in time order
+    assert [row['time'] for row in rows] == sorted(row['time'] for row in rows)
+
+
+@pytest.mark.parametrize('options', [{'fmt': 'xml'}, {'compression': 'bzip2'}])
+def test_export_rejects_unknown_options(db_path, tmp_path, options):
+    from_date, to_date = time_range()
+    with pytest.raises(ValueError):
+        export(db_path, from_date, to_date, str(tmp_path / 'export'), **options)
@@ -0,0 +1,39 @@
+from dblogger.models.entry import BaseLogEntry
+from dblogger.sqlite_models import LogEntry
+
+
+def load_messages(db, **kwargs):
+    return sorted(entry.message for entry in LogEntry.load_all_with_date(db.cursor(), limit=10, **kwargs))
+
+
+def test_serialize_extra():
+    assert BaseLogEntry.serialize_data({'extra': {'a': 1, 'b': [1, 2]}})['extra'] == '{"a":1,"b":[1,2]}'
+    assert 'extra' not in BaseLogEntry.serialize_data({'extra': None})
+
+
+def test_only_configured_fields_are_stored(make_handler, make_logger, db):
+    handler = make_handler(extra_fields=['request_id', 'user'])
+    logger = make_logger(handler)
+    logger.info('with extra', extra={'request_id': 'r1', 'user': {'id': 5}, 'ignored': True})
+    logger.info('without extra')
+    handler.close()
+
+    entries = {entry.message: entry for entry in LogEntry.load_all_with_date(db.cursor(), limit=10)}
+    assert entries['with extra'].extra == {'request_id': 'r1', 'user': {'id': 5}}
+    assert entries['without extra'].extra is None
+
+
+def test_filter_by_extra(make_handler, make_logger, db):
+    handler = make_handler(extra_fields=['request_id', 'attempt', 'user'])
+    logger = make_logger(handler)
+    logger.info('first', extra={'request_id': 'r1', 'attempt': 1})
+    logger.info('second', extra={'request_id': 'r1', 'attempt': 2})
+    logger.info('other', extra={'request_id': 'r2', 'user': {'id': 5}})
+    logger.info('quoted', extra={'request_id': 'r"3'})
+    handler.close()
+
+    assert load_messages(db, extra={'request_id': 'r1'}) == ['first', 'second']
+    assert load_messages(db, extra={'request_id': 'r1', 'attempt': 2}) == ['second']
+    assert load_messages(db, extra={'attempt': '2'}) == []
+    assert load_messages(db, extra={'user': {'id': 5}}) == ['other']
+    assert load_messages(db, extra={'request_id': 'r"3'}) == ['quoted']
@@ -0,0 +1,118 @@
+import logging
+
+import pytest
+
+from dblogger.durability import Durability
+from dblogger.rollup import RollupCounter
+from dblogger.sqlite_handler import DBLogHandler
+from dblogger.sqlite_models import LogEntry, LogRollup, connect
+from dblogger.sync_handler import DBLogHandler as SyncDBLogHandler
+
+
+def load_entries(db):
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=1000)
+    LogEntry.prefetch_tags(db.cursor(), entries)
+    return {entry.message: entry for entry in entries}
+
+
+def count_entries(db_path) -> int:
+    connection = connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'SELECT count(*) AS count FROM {LogEntry.table}')
+        return cursor.fetchone()['count']
+    finally:
+        connection.close()
+
+
+def test_handlers_share_the_write_path():
+    assert issubclass(DBLogHandler, SyncDBLogHandler)
+    assert DBLogHandler.write_entry is SyncDBLogHandler.write_entry
+
+
+def test_psycopg_handler_only_replaces_the_insert():
+    pytest.importorskip('psycopg')
+    from dblogger.psycopg_handler import DBLogHandler as PsycopgDBLogHandler
+
+    assert issubclass(PsycopgDBLogHandler, SyncDBLogHandler)
+    assert PsycopgDBLogHandler.write_entry is SyncDBLogHandler.write_entry
+    assert PsycopgDBLogHandler.insert is not SyncDBLogHandler.insert
+
+
+def test_write_entry(make_handler, make_logger, db):
+    handler = make_handler(extra_fields=['request_id'])
+    logger = make_logger(handler)
+    logger.info('hello %s', 'world', extra={'request_id': 'r1', 'tags': ['a', 'b']})
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logger.exception('failed')
+    handler.close()
+
+    entries = load_entries(db)
+    hello = entries['hello world']
+    assert hello.level == logging.INFO
+    assert hello.extra == {'request_id': 'r1'}
+    assert sorted(tag.name for tag in hello.tags(db.cursor())) == ['a', 'b']
+    assert entries['failed'].level == logging.ERROR
+    assert entries['failed'].exception_id is not None
+
+
+def test_array_tag_storage(make_handler, make_logger, db):
+    handler = make_handler(tag_storage='array')
+    logger = make_logger(handler)
+    logger.info('tagged', extra={'tags': ['b', 'a']})
+    logger.info('again', extra={'tags': ['a', 'b']})
+    handler.close()
+
+    entries = load_entries(db)
+    assert entries['tagged'].tag_ids == entries['again'].tag_ids
+    assert len(entries['tagged'].tag_ids) == 2
+
+
+def test_group_commit(make_handler, make_logger, db_path):
+    handler = make_handler(durability=Durability(level=logging.ERROR, group_commit=60))
+    logger = make_logger(handler)
+
+    logger.info('pending')
+    assert count_entries(db_path) == 0
+    assert handler.uncommitted == 1
+
+    # errors commit the open group
+    logger.error('committed')
+    assert count_entries(db_path) == 2
+    assert handler.uncommitted == 0
+
+
+def test_rollup_is_flushed_on_close(make_handler, make_logger, db):
+    handler = make_handler(rollup=RollupCounter(flush_interval=3600))
+    logger = make_logger(handler)
+    for _ in range(3):
+        logger.warning('counted')
+    logger.error('counted too')
+    handler.close()
+
+    stats = LogRollup.load_stats(db.cursor(), group_by=['level'])
+    assert {row['level']: row['count'] for row in stats} == {logging.WARNING: 3, logging.ERROR: 1}
+
+
+def test_failed_write_clears_caches(make_handler, make_logger, db):
+    handler = make_handler()
+    logger = make_logger(handler)
+    logger.info('first')
+    assert len(handler.callsite_cache) > 0
+
+    errors = []
+    handler.handleError = errors.append
+    handler.db.execute('DROP TABLE logger_log_tag')
+    logger.info('fails', extra={'tags': ['x']})
+
+    assert len(errors) == 1
+    assert len(handler.callsite_cache) == 0
+
+
+def test_closed_handler(make_handler):
+    handler = make_handler()
+    handler.close()
+    with pytest.raises(RuntimeWarning):
+        handler.write(logging.LogRecord('test', logging.INFO, __file__, 1, 'closed', (), None))
@@ -0,0 +1,205 @@
+import logging
+
+from datetime import datetime
+
+import pytest
+
+from dblogger.export import entry_to_row
+from dblogger.importer import Importer, compile_format, parse_chunk, split_file
+from dblogger.sqlite_models import LogEntry, LogLogger, LogFunction, LogImport
+
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(name)s %(funcName)s:%(lineno)d %(message)s'
+
+
+def text_line(idx: int, level: str='INFO', message: str=None) -> str:
+    asctime = datetime(2019, 5, 13, 10, 0, idx % 60).strftime('%Y-%m-%d %H:%M:%S') + ',123'
+    return f'{asctime} {level:<8} app.module{idx % 3} handle:{idx % 5} {message or f"message {idx}"}\n'
+
+
+def write_log(path, count: int) -> str:
+    """
+    Every fifth record has a continuation line, every seventh a traceback
+    """
+    lines = []
+    for idx in range(count):
+        if idx % 7 == 0:
+            lines.append(text_line(idx, 'ERROR', f'failed {idx}'))
+            lines.append('Traceback (most recent call last):\n')
+            lines.append(f'  File "/app/module.py", line {idx}, in handle\n')
+            lines.append('ValueError: broken\n')
+        else:
+            lines.append(text_line(idx))
+            if idx % 5 == 0:
+                lines.append(f'  continued {idx}\n')
+    with open(path, 'w') as fp:
+        fp.write(''.join(lines))
+    return ''.join(lines)
+
+
+def expected_messages(count: int):
+    messages = []
+    for idx in range(count):
+        if idx % 7 == 0:
+            messages.append(f'failed {idx}')
+        elif idx % 5 == 0:
+            messages.append(f'message {idx}\n  continued {idx}')
+        else:
+            messages.append(f'message {idx}')
+    return sorted(messages)
+
+
+def load_rows(db):
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=10000)
+    LogEntry.prefetch_tags(db.cursor(), entries)
+    return [entry_to_row(entry) for entry in entries]
+
+
+def make_importer(db_path, **kwargs) -> Importer:
+    options = dict(log_format=LOG_FORMAT, hostname='web-1', workers=2, batch_size=7, chunk_size=64, run_mode='sqlite')
+    options.update(kwargs)
+    return Importer(db_path, **options)
+
+
+def test_compile_format():
+    regex = compile_format(LOG_FORMAT)
+    match = regex.match(text_line(3, 'WARNING').rstrip('\n'))
+    assert match.group('levelname') == 'WARNING'
+    assert match.group('name') == 'app.module0'
+    assert match.group('funcName') == 'handle'
+    assert match.group('lineno') == '3'
+    assert match.group('message') == 'message 3'
+    assert regex.match('  continued') is None
+
+
+def test_split_file(tmp_path):
+    path = str(tmp_path / 'app.log')
+    content = write_log(path, 30)
+    chunks = list(split_file(path, 0, 64))
+
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(content)
+    assert all(prev[1] == cur[0] for prev, cur in zip(chunks, chunks[1:]))
+    # chunks end at line boundaries
+    assert all(content[end - 1] == '\n' for _, end in chunks)
+
+
+def test_parse_chunk_leading_lines(tmp_path):
+    path = str(tmp_path / 'app.log')
+    with open(path, 'w') as fp:
+        fp.write('  continued from the previous chunk\n' + text_line(1) + '  continued 1\n')
+
+    start, end, leading, records, skipped = parse_chunk((path, 0, 200, 'text', LOG_FORMAT, None, 'web-1'))
+    assert leading == ['  continued from the previous chunk']
+    assert len(records) == 1
+    offset, item = records[0]
+    assert offset == len('  continued from the previous chunk\n')
+    assert item['message'] == 'message 1\n  continued 1'
+    assert item['hostname'] == 'web-1'
+    assert skipped == 0
+
+
+def test_import_continuations_across_chunks(db, db_path, tmp_path):
+    path = str(tmp_path / 'app.log')
+    write_log(path, 40)
+
+    importer = make_importer(db_path)
+    assert importer.import_files([path]) == 40
+    assert importer.skipped == 0
+
+    rows = load_rows(db)
+    assert sorted(row['message'] for row in rows) == expected_messages(40)
+    errors = [row for row in rows if row['level'] == logging.ERROR]
+    assert len(errors) == 6
+    assert all(row['traceback'].endswith('ValueError: broken') for row in errors)
+    assert all(row['hostname'] == 'web-1' for row in rows)
+
+
+def test_import_resolves_dimensions_once(db, db_path, tmp_path):
+    path = str(tmp_path / 'app.log')
+    write_log(path, 40)
+    make_importer(db_path).import_files([path])
+
+    cursor = db.cursor()
+    cursor.execute(f'SELECT count(*) AS count FROM {LogLogger.table}')
+    assert cursor.fetchone()['count'] == 3
+    cursor.execute(f'SELECT count(*) AS count FROM {LogFunction.table}')
+    # (logger, line number) combinations
+    assert cursor.fetchone()['count'] == 15
+
+
+def test_import_resumes_from_saved_offset(db, db_path, tmp_path):
+    path = str(tmp_path / 'app.log')
+    content = write_log(path, 20)
+    make_importer(db_path).import_files([path])
+
+    state = LogImport.load(db.cursor(), path=path)
+    assert state.offset == len(content)
+    assert state.entries == 20
+
+    # only the appended records are imported on the next run
+    with open(path, 'a') as fp:
+        fp.write(text_line(20) + '  continued 20\n' + text_line(21))
+    assert make_importer(db_path).import_files([path]) == 2
+    assert len(load_rows(db)) == 22
+
+    # a saved offset in the middle of the file
+    LogImport.reset(db.cursor(), path)
+    LogImport.save_progress(db.cursor(), path, len(content), 0)
+    db.commit()
+    db.execute(f'DELETE FROM {LogEntry.table}')
+    db.commit()
+    assert make_importer(db_path).import_files([path]) == 2
+    assert sorted(row['message'] for row in load_rows(db)) == ['message 20\n  continued 20', 'message 21']
+
+
+def test_import_restart(db, db_path, tmp_path):
+    path = str(tmp_path / 'app.log')
+    write_log(path, 10)
+    make_importer(db_path).import_files([path])
+    assert make_importer(db_path).import_files([path]) == 0
+    assert make_importer(db_path).import_files([path], restart=True) == 10
+
+
+def test_interrupted_import_continues(db, db_path, tmp_path, monkeypatch):
+    path = str(tmp_path / 'app.log')
+    write_log(path, 40)
+
+    importer = make_importer(db_path)
+    load = Importer.load
+    calls = []
+
+    def failing_load(self, path, batch, offset):
+        calls.append(offset)
+        if len(calls) == 3:
+            raise RuntimeError('interrupted')
+        load(self, path, batch, offset)
+
+    monkeypatch.setattr(Importer, 'load', failing_load)
+    with pytest.raises(RuntimeError):
+        importer.import_files([path])
+    monkeypatch.setattr(Importer, 'load', load)
+
+    imported = len(load_rows(db))
+    assert 0 < imported < 40
+    assert make_importer(db_path).import_files([path]) == 40 - imported
+    # no record is lost or duplicated, even if a batch ended inside a multi-line record
+    assert sorted(row['message'] for row in load_rows(db)) == expected_messages(40)
+
+
+def test_import_ndjson(db, db_path, tmp_path):
+    path = str(tmp_path / 'app.ndjson')
+    with open(path, 'w') as fp:
+        fp.write('{"created": 1557741600.5, "levelname": "WARNING", "name": "app", "msg": "hello", "tags": ["a"]}\n')
+        fp.write('not json\n')
+        fp.write('{"time": "2019-05-13T10:00:00+00:00", "level": 40, "logger": "app", "message": "exported", '
+                 '"extra": {"user": 1}, "repeat_count": 3}\n')
+
+    importer = make_importer(db_path, fmt='ndjson')
+    assert importer.import_files([path]) == 2
+    assert importer.skipped == 1
+
+    rows = {row['message']: row for row in load_rows(db)}
+    assert rows['hello']['level'] == logging.WARNING
+    assert rows['hello']['tags'] == ['a']
+    assert rows['exported']['extra'] == {'user': 1}
+    assert rows['exported']['repeat_count'] == 3
@@ -0,0 +1,89 @@
+from typing import Tuple
+import logging
+
+import pytest
+
+from dblogger import lanes
+from dblogger.lanes import PriorityLanes
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_record(level: int, msg: str='message') -> logging.LogRecord:
+    return logging.LogRecord('test', level, __file__, 1, msg, (), None)
+
+
+def make_lanes(monkeypatch, **kwargs) -> Tuple[PriorityLanes, Clock]:
+    clock = Clock()
+    monkeypatch.setattr(lanes.time, 'monotonic', clock)
+    return PriorityLanes(**kwargs), clock
+
+
+def test_immediate_records_first(monkeypatch):
+    queue, _ = make_lanes(monkeypatch)
+    queue.put(make_record(logging.INFO, 'info'))
+    queue.put(make_record(logging.ERROR, 'error'))
+    queue.put(make_record(logging.DEBUG, 'debug'))
+
+    assert len(queue) == 3
+    assert [queue.get().msg for _ in range(3)] == ['error', 'info', 'debug']
+    assert queue.get() is None
+
+
+def test_ready(monkeypatch):
+    queue, clock = make_lanes(monkeypatch, batch_size=3, batch_delay=0.5)
+    assert not queue.ready()
+    assert queue.next_deadline() is None
+
+    queue.put(make_record(logging.INFO))
+    assert not queue.ready()
+    clock.now += 0.2
+    assert queue.next_deadline() == pytest.approx(0.3)
+    clock.now += 0.3
+    assert queue.ready()
+
+    queue.get()
+    for _ in range(3):
+        queue.put(make_record(logging.INFO))
+    assert queue.ready()
+
+    queue, _ = make_lanes(monkeypatch)
+    queue.put(make_record(logging.CRITICAL))
+    assert queue.ready()
+
+
+def test_only_batched_records_are_dropped(monkeypatch):
+    queue, _ = make_lanes(monkeypatch, max_batched=2)
+    for idx in range(4):
+        queue.put(make_record(logging.INFO, f'info {idx}'))
+        queue.put(make_record(logging.ERROR, f'error {idx}'))
+
+    assert len(queue.immediate) == 4
+    assert [record.msg for _, record in queue.batched] == ['info 2', 'info 3']
+    assert queue.batched_stats.dropped == 2
+
+
+def test_metrics(monkeypatch):
+    queue, clock = make_lanes(monkeypatch)
+    queue.put(make_record(logging.INFO))
+    queue.put(make_record(logging.INFO))
+    queue.put(make_record(logging.ERROR))
+    clock.now += 1.0
+    queue.get()
+    clock.now += 1.0
+    queue.get()
+
+    metrics = queue.metrics()
+    assert metrics['immediate'] == {
+        'depth': 0, 'max_depth': 1, 'written': 1, 'dropped': 0, 'latency_avg': 1.0, 'latency_max': 1.0
+    }
+    assert metrics['batched']['depth'] == 1
+    assert metrics['batched']['max_depth'] == 2
+    assert metrics['batched']['latency_max'] == 2.0
@@ -0,0 +1,108 @@
+import io
+import re
+import json
+import logging
+
+import pytest
+
+from dblogger.coalesce import Coalescer
+from dblogger.sqlite_models import LogEntry
+
+
+class TTY(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def entries(make_handler, make_logger, db):
+    handler = make_handler(coalescer=Coalescer(window=60))
+    logger = make_logger(handler)
+    logger.info('hello %s', 'world', extra={'tags': ['a', 'b']})
+    for _ in range(3):
+        logger.warning('repeated')
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logger.exception('failed')
+    handler.close()
+
+    cursor = db.cursor()
+    result = {}
+    for entry in LogEntry.load_all_with_date(cursor, limit=10):
+        result[entry.message] = (entry, entry.logger(cursor), entry.tags(cursor), entry.exception(cursor))
+    return result
+
+
+def test_render_lines(logtail, entries):
+    stream = io.StringIO()
+    renderer = logtail.Renderer(stream=stream)
+    renderer.add(*entries['hello world'])
+    assert stream.getvalue() == ''
+    renderer.flush()
+
+    line = stream.getvalue()
+    assert re.match(r'^\S+ \S+ INFO     \(test \) (\[a\]\[b\]|\[b\]\[a\]): hello world\n$', line)
+
+
+def test_render_repeats_and_tracebacks(logtail, entries):
+    stream = io.StringIO()
+    renderer = logtail.Renderer(fmt='{level_name}:{line}:{message}', stream=stream)
+    renderer.add(*entries['repeated'])
+    renderer.add(*entries['failed'])
+    renderer.flush()
+
+    lines = stream.getvalue().splitlines()
+    assert re.match(r'^WARNING:\d+:repeated \[repeated 3 times until .+\]$', lines[0])
+    assert re.match(r'^ERROR:\d+:failed$', lines[1])
+    assert lines[2] == 'Traceback (most recent call last):'
+    assert lines[-1] == 'ValueError: broken'
+
+
+def test_render_json(logtail, entries):
+    stream = io.StringIO()
+    renderer = logtail.Renderer(json_output=True, stream=stream)
+    renderer.header('ignored')
+    renderer.add(*entries['hello world'])
+    renderer.flush()
+
+    row = json.loads(stream.getvalue())
+    assert row['message'] == 'hello world'
+    assert row['logger'] == 'test'
+    assert sorted(row['tags']) == ['a', 'b']
+
+
+def test_colors_follow_the_stream(logtail, entries):
+    assert not logtail.Renderer(stream=io.StringIO()).color
+
+    renderer = logtail.Renderer(stream=TTY())
+    renderer.add(*entries['failed'])
+    prefix, level = renderer.level_style(logging.ERROR)
+    assert renderer.level_style(logging.ERROR) is renderer.level_style(logging.ERROR)
+    assert level == 'ERROR   '
+    assert renderer.buffer[0].startswith(prefix)
+    assert renderer.buffer[0].endswith(logtail.RESET + '\n')
+
+
+def test_full_page_is_written(logtail, entries, monkeypatch):
+    monkeypatch.setattr(logtail, 'PAGE_SIZE', 2)
+    stream = io.StringIO()
+    renderer = logtail.Renderer(stream=stream)
+    renderer.add(*entries['hello world'])
+    assert stream.getvalue() == ''
+    renderer.add(*entries['repeated'])
+    assert len(stream.getvalue().splitlines()) == 2
+    assert renderer.buffer == []
+
+
+def test_is_printable(logtail, entries):
+    entry, logger, tags, _ = entries['hello world']
+
+    assert logtail.is_printable(entry, logger, tags, None, 0, None, None, None)
+    assert not logtail.is_printable(entry, logger, tags, re.compile('hello'), 0, None, None, None)
+    assert not logtail.is_printable(entry, logger, tags, None, logging.WARNING, None, None, None)
+    assert not logtail.is_printable(entry, logger, tags, None, 0, ['other'], None, None)
+    assert logtail.is_printable(entry, logger, tags, None, 0, None, None, ['b', 'c'])
+    assert not logtail.is_printable(entry, logger, tags, None, 0, None, None, ['c'])
+    assert not logtail.is_printable(entry, logger, tags, None, 0, None, ['a'], None)
@@ -0,0 +1,72 @@
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dblogger.coalesce import Coalescer
+
+
+def output_lines(capsys):
+    # skip the header lines
+    return capsys.readouterr().out.splitlines()[2:]
+
+
+@pytest.mark.parametrize('value, seconds', [('30', 30), ('30s', 30), ('5m', 300), ('1h', 3600), ('2d', 172800)])
+def test_bucket_size(logtail, value, seconds):
+    assert logtail.bucket_size(value) == seconds
+
+
+@pytest.mark.parametrize('value', ['0m', '1w', 'm', '-1m'])
+def test_invalid_bucket_size(logtail, value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        logtail.bucket_size(value)
+
+
+def test_print_top_sums_databases(logtail, capsys):
+    now = datetime.now(timezone.utc)
+    rows = [('spam', 30), ('rare', 1), ('spam', 10), ('multi\nline  message', 20)]
+    logtail.print_top(rows, 'messages', 2, now, now)
+
+    lines = output_lines(capsys)
+    assert lines == [
+        '   40 ' + '#' * 20 + ' spam',
+        '   20 ' + '#' * 10 + ' ' * 10 + ' multi line message',
+    ]
+
+
+def test_print_stats(logtail, capsys):
+    now = datetime(2024, 1, 1, 12, 0)
+    rows = [
+        {'time': now, 'level': logging.INFO, 'count': 6},
+        {'time': now, 'level': logging.ERROR, 'count': 2},
+        {'time': now + timedelta(minutes=1), 'level': logging.INFO, 'count': 2},
+        {'time': now, 'level': logging.INFO, 'count': 2},
+    ]
+    logtail.print_stats(rows, now, now + timedelta(minutes=2))
+
+    lines = output_lines(capsys)
+    assert len(lines) == 2
+    assert lines[0].startswith('2024-01-01 12:00:00    10 ' + '#' * 40)
+    assert lines[0].endswith(' INFO=8 ERROR=2')
+    assert lines[1].startswith('2024-01-01 12:01:00     2 ' + '#' * 8 + ' ')
+    assert lines[1].endswith(' INFO=2')
+
+
+def test_log_counts_sync(logtail, capsys, make_handler, make_logger, db_path):
+    handler = make_handler(coalescer=Coalescer(window=60))
+    logger = make_logger(handler)
+    for _ in range(4):
+        logger.warning('spam')
+    logger.error('rare')
+    handler.close()
+
+    now = datetime.now(timezone.utc)
+    from_date, to_date = now - timedelta(minutes=5), now + timedelta(minutes=5)
+    logtail.log_counts_sync([db_path], 0, from_date, to_date, None, 'messages', 10)
+    assert [line.split()[-1] for line in output_lines(capsys)] == ['spam', 'rare']
+
+    logtail.log_counts_sync([db_path], logging.ERROR, from_date, to_date, 3600, None, 10)
+    lines = output_lines(capsys)
+    assert len(lines) == 1
+    assert lines[0].endswith(' ERROR=1')
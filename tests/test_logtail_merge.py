@@ -0,0 +1,88 @@
+import io
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from dblogger.sqlite_handler import DBLogHandler
+from conftest import clear_handler_caches
+
+
+class Entry:
+
+    def __init__(self, pk: int, seconds: int):
+        self.pk = pk
+        self.time = datetime(2024, 1, 1) + timedelta(seconds=seconds)
+
+
+def merged(items):
+    return [(idx, item.pk) for idx, item in items]
+
+
+def test_merge_pages(logtail):
+    pages = [
+        [Entry(3, 30), Entry(1, 10)],
+        [Entry(2, 20), Entry(4, 10)],
+        [],
+    ]
+    assert merged(logtail.merge_pages(pages)) == [(0, 1), (1, 4), (1, 2), (0, 3)]
+
+
+def test_merge_streams_async(logtail, monkeypatch):
+    # asyncio is only imported by the script in the async run mode
+    monkeypatch.setattr(logtail, 'asyncio', asyncio, raising=False)
+    monkeypatch.setattr(logtail, 'MERGE_READ_AHEAD', 2)
+
+    async def stream(items):
+        for item in items:
+            await asyncio.sleep(0)
+            yield item
+
+    async def main():
+        streams = [
+            stream([Entry(1, 10), Entry(3, 30), Entry(5, 50)]),
+            stream([Entry(2, 20), Entry(4, 40)]),
+            stream([]),
+        ]
+        return [item async for item in logtail.merge_streams_async(streams)]
+
+    assert merged(asyncio.run(main())) == [(0, 1), (1, 2), (0, 3), (1, 4), (0, 5)]
+
+
+def test_merge_streams_async_raises_errors(logtail, monkeypatch):
+    monkeypatch.setattr(logtail, 'asyncio', asyncio, raising=False)
+
+    async def broken():
+        yield Entry(1, 10)
+        raise RuntimeError('connection lost')
+
+    async def main():
+        return [item async for item in logtail.merge_streams_async([broken()])]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+
+def test_log_tail_sync_merges_databases(logtail, tmp_path, make_logger):
+    paths = [str(tmp_path / 'first.sqlite3'), str(tmp_path / 'second.sqlite3')]
+    handlers = []
+    for path in paths:
+        # every database gets its own ids for the same rows
+        clear_handler_caches(DBLogHandler)
+        handlers.append(DBLogHandler('test', db_name=path))
+    loggers = [make_logger(handler) for handler in handlers]
+    for idx in range(6):
+        clear_handler_caches(DBLogHandler)
+        loggers[idx % 2].info('message %d', idx)
+    for handler in handlers:
+        handler.close()
+    clear_handler_caches(DBLogHandler)
+
+    stream = io.StringIO()
+    renderer = logtail.Renderer(fmt='{message}', stream=stream)
+    now = datetime.now()
+    logtail.log_tail_sync(paths, from_date=now - timedelta(minutes=5), to_date=now + timedelta(minutes=5), renderer=renderer)
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0].startswith('Displaying logs from ')
+    assert lines[2:] == [f'message {idx}' for idx in range(6)]
@@ -0,0 +1,189 @@
+import os
+import stat
+import time
+import asyncio
+import struct
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dblogger.querycache import QueryCache, QueryCacheClient, encode_entry, decode_entry, encode_frame, \
+    DEFAULT_QUERY_SOCKET_MODE, MAX_REQUEST_SIZE
+from dblogger.sqlite_models import LogEntry
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.frames.append(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def logged(make_handler, make_logger):
+    handler = make_handler()
+    logger = make_logger(handler)
+    for idx in range(5):
+        logger.info('message %d', idx, extra={'tags': ['cache']})
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logger.exception('failed')
+    handler.close()
+
+
+def window():
+    now = time.time()
+    return now - 300, now + 300
+
+
+def test_encode_decode_entry(logged, db):
+    entries = list(LogEntry.iterate_with_date(
+        db.cursor(), datetime.now(timezone.utc) - timedelta(minutes=5), datetime.now(timezone.utc) + timedelta(minutes=5)
+    ))
+    failed = [entry for entry in entries if entry.message == 'failed'][0]
+
+    entry, logger, tags, exception = decode_entry(encode_entry(failed))
+    assert entry.pk == failed.pk
+    assert entry.message == 'failed'
+    assert logger.name == 'test'
+    assert tags == []
+    assert 'ValueError' in exception.traceback
+
+    entry, logger, tags, exception = decode_entry(encode_entry(entries[0]))
+    assert [tag.name for tag in tags] == ['cache']
+    assert exception is None
+
+
+def test_closed_windows_are_cached(logged, db_path):
+    cache = QueryCache(db_path, run_mode='sqlite', settle=-3600)
+    from_ts, to_ts = window()
+
+    async def run():
+        cache.db_lock = asyncio.Lock()
+        await cache.connect()
+        first = await cache.load_range(from_ts, to_ts, {})
+        second = await cache.load_range(from_ts, to_ts, {})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.size == sum(len(page) for page in first)
+
+
+def test_open_windows_are_not_cached(logged, db_path):
+    cache = QueryCache(db_path, run_mode='sqlite', settle=3600)
+    from_ts, to_ts = window()
+
+    async def run():
+        cache.db_lock = asyncio.Lock()
+        await cache.connect()
+        await cache.load_range(from_ts, to_ts, {'search': 'message'})
+        await cache.load_range(from_ts, to_ts, {'search': 'message'})
+
+    asyncio.run(run())
+    assert cache.misses == 2
+    assert len(cache.windows) == 0
+
+
+def test_concurrent_queries_run_once(monkeypatch):
+    cache = QueryCache('', run_mode='sqlite')
+    calls = []
+
+    async def query(kind, **kwargs):
+        calls.append(kind)
+        await asyncio.sleep(0.05)
+        return []
+
+    monkeypatch.setattr(cache, 'query', query)
+
+    async def run():
+        return await asyncio.gather(*[cache.load_range(1.0, 2.0, {}) for _ in range(3)])
+
+    results = asyncio.run(run())
+    assert calls == ['range']
+    assert results[0] == results[1] == results[2]
+    assert cache.inflight == {}
+
+
+def test_cancelled_owner_does_not_block_waiters(monkeypatch):
+    cache = QueryCache('', run_mode='sqlite')
+
+    async def query(kind, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(cache, 'query', query)
+
+    async def run():
+        owner = asyncio.ensure_future(cache.load_range(1.0, 2.0, {}))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.load_range(1.0, 2.0, {}))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(waiter, 1)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+
+    asyncio.run(run())
+    assert cache.inflight == {}
+
+
+def test_oversized_request_closes_connection():
+    cache = QueryCache('', run_mode='sqlite')
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(struct.pack('!I', MAX_REQUEST_SIZE + 1) + b'{' * 16)
+        writer = FakeWriter()
+        await cache.handle_client(reader, writer)
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.closed
+    assert writer.frames == [encode_frame({'error': 'Request too large'})]
+
+
+def test_daemon(logged, tmp_path, db_path):
+    socket_path = str(tmp_path / 'query.sock')
+    cache = QueryCache(db_path, socket_path=socket_path, run_mode='sqlite')
+
+    def query():
+        client = QueryCacheClient(socket_path)
+        try:
+            from_date = datetime.now(timezone.utc) - timedelta(minutes=5)
+            return list(client.load_range(from_date, from_date + timedelta(minutes=10), search='message'))
+        finally:
+            client.close()
+
+    async def run():
+        task = asyncio.ensure_future(cache.run())
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            await asyncio.sleep(0.01)
+        mode = stat.S_IMODE(os.stat(socket_path).st_mode)
+        try:
+            rows = await asyncio.get_event_loop().run_in_executor(None, query)
+        finally:
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return mode, rows
+
+    mode, rows = asyncio.run(run())
+    assert mode == DEFAULT_QUERY_SOCKET_MODE
+    assert sorted(entry.message for entry, _, _, _ in rows) == [f'message {idx}' for idx in range(5)]
+    assert all([tag.name for tag in tags] == ['cache'] for _, _, tags, _ in rows)
+    assert not os.path.exists(socket_path)
@@ -0,0 +1,83 @@
+import time
+import logging
+
+from dblogger.durability import Durability
+from dblogger.ratelimit import RateLimiter, callsite_key
+from dblogger.sqlite_models import LogEntry, connect
+
+
+def make_record(created: float, level: int=logging.INFO, lineno: int=1) -> logging.LogRecord:
+    record = logging.LogRecord('test', level, __file__, lineno, 'message', (), None)
+    record.created = created
+    return record
+
+
+def load_messages(db_path):
+    connection = connect(db_path)
+    try:
+        return [entry.message for entry in LogEntry.load_all_with_date(connection.cursor(), limit=100)]
+    finally:
+        connection.close()
+
+
+def test_token_bucket_per_callsite():
+    limiter = RateLimiter(rate=1, burst=2)
+    now = time.time()
+
+    assert [limiter.allow(make_record(now)) for _ in range(3)] == [True, True, False]
+    assert limiter.allow(make_record(now, lineno=2))
+    assert limiter.allow(make_record(now + 1))
+    assert limiter.rate_limited == {callsite_key(make_record(now)): 1}
+
+
+def test_sampling_by_level():
+    limiter = RateLimiter(sample_rates={logging.DEBUG: 0.0})
+    now = time.time()
+
+    assert not limiter.allow(make_record(now, logging.DEBUG))
+    assert limiter.allow(make_record(now, logging.INFO))
+    assert limiter.suppressed_total == 1
+
+
+def test_summary_after_interval():
+    limiter = RateLimiter(rate=1, burst=1, summary_interval=10)
+    now = time.time()
+    for _ in range(4):
+        limiter.allow(make_record(now))
+
+    assert limiter.next_summary_due() == limiter.next_summary
+    assert limiter.summaries(now) == []
+    summaries = limiter.summaries(now + 11)
+    assert [summary.getMessage() for summary in summaries] == ['suppressed 3 similar records']
+    assert summaries[0].lineno == 1
+    assert limiter.next_summary_due() is None
+
+
+def test_handler_writes_summary_without_further_records(db_path, make_handler, make_logger):
+    limiter = RateLimiter(rate=0.001, burst=1, summary_interval=0.2)
+    handler = make_handler(rate_limiter=limiter, durability=Durability(level=logging.ERROR, group_commit=0))
+    logger = make_logger(handler)
+
+    for _ in range(3):
+        logger.info('hot loop')
+    assert load_messages(db_path) == ['hot loop']
+
+    deadline = time.time() + 5
+    while len(load_messages(db_path)) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert sorted(load_messages(db_path)) == ['hot loop', 'suppressed 2 similar records']
+    assert handler.summary_timer is None
+
+
+def test_close_writes_pending_summary(db_path, make_handler, make_logger):
+    limiter = RateLimiter(rate=0.001, burst=1, summary_interval=60)
+    handler = make_handler(rate_limiter=limiter)
+    logger = make_logger(handler)
+
+    for _ in range(2):
+        logger.info('hot loop')
+    assert handler.summary_timer is not None
+    handler.close()
+
+    assert handler.summary_timer is None
+    assert sorted(load_messages(db_path)) == ['hot loop', 'suppressed 1 similar records']
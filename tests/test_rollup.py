@@ -0,0 +1,88 @@
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+
+from dblogger.coalesce import Coalescer
+from dblogger.durability import Durability
+from dblogger.rollup import RollupCounter
+from dblogger.sqlite_models import LogEntry, LogRollup
+
+
+def test_counters_per_bucket():
+    rollup = RollupCounter(bucket_size=60)
+    rollup.add(120.5, 1, 2, 3, logging.INFO)
+    rollup.add(179.9, 1, 2, 3, logging.INFO, count=4)
+    rollup.add(180.0, 1, 2, 3, logging.INFO)
+
+    assert rollup.counters == {(120.0, 1, 2, 3, logging.INFO): 5, (180.0, 1, 2, 3, logging.INFO): 1}
+
+
+def test_take_and_restore():
+    rollup = RollupCounter(flush_interval=60)
+    assert not rollup.due()
+    rollup.add(120.0, 1, 2, 3, logging.INFO)
+    assert not rollup.due()
+    assert rollup.due(rollup.next_flush)
+
+    counters = rollup.take()
+    assert rollup.counters == {}
+    rollup.add(120.0, 1, 2, 3, logging.INFO)
+    rollup.restore(counters)
+    assert rollup.counters == {(120.0, 1, 2, 3, logging.INFO): 2}
+
+
+def test_upsert_adds_to_existing_counts(db):
+    key = (datetime(2024, 1, 1, 12, 0).timestamp(), 1, 1, 1, logging.INFO)
+    LogRollup.upsert_counters(db.cursor(), {key: 2})
+    LogRollup.upsert_counters(db.cursor(), {key: 3})
+    db.commit()
+
+    stats = LogRollup.load_stats(db.cursor(), group_by=['time', 'level'])
+    assert [(row['level'], row['count']) for row in stats] == [(logging.INFO, 5)]
+
+
+def test_stats_group_and_filter(make_handler, make_logger, db):
+    handler = make_handler(rollup=RollupCounter(flush_interval=3600), coalescer=Coalescer(window=60))
+    logger = make_logger(handler)
+    for _ in range(3):
+        logger.info('repeated')
+    logger.warning('warning')
+    logger.error('error')
+    handler.close()
+
+    stats = LogRollup.load_stats(db.cursor(), group_by=['logger', 'level'])
+    assert sorted((row['logger'], row['level'], row['count']) for row in stats) == [
+        ('test', logging.INFO, 3), ('test', logging.WARNING, 1), ('test', logging.ERROR, 1)
+    ]
+    stats = LogRollup.load_stats(db.cursor(), group_by=['level'], level=logging.WARNING)
+    assert sum(row['count'] for row in stats) == 2
+    stats = LogRollup.load_stats(db.cursor(), from_date=datetime.now() + timedelta(minutes=2))
+    assert stats == []
+
+
+def test_unknown_group_is_rejected(db):
+    with pytest.raises(ValueError):
+        LogRollup.load_stats(db.cursor(), group_by=['message'])
+
+
+@pytest.mark.parametrize('group_commit', [0, 60])
+def test_failed_flush_keeps_the_entries(make_handler, make_logger, db, capsys, group_commit):
+    rollup = RollupCounter(flush_interval=0)
+    handler = make_handler(rollup=rollup, durability=Durability(level=logging.ERROR, group_commit=group_commit))
+    logger = make_logger(handler)
+    errors = []
+    handler.handleError = errors.append
+    logger.info('first')
+    handler.db.execute('DROP TABLE logger_rollup')
+
+    logger.info('second')
+    handler.commit_pending()
+
+    assert errors == []
+    assert len(handler.callsite_cache) > 0
+    assert handler.durability.lost == 0
+    assert sum(rollup.counters.values()) == 1
+    assert 'could not flush the rollup counters' in capsys.readouterr().err
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=10)
+    assert sorted(entry.message for entry in entries) == ['first', 'second']
@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+import dblogger
+
+
+def run_python(code: str, **env) -> str:
+    environment = dict(os.environ, **env)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(os.path.abspath(dblogger.__file__))),
+        environment.get('PYTHONPATH')
+    ]))
+    result = subprocess.run([sys.executable, '-c', code], env=environment, stdout=subprocess.PIPE, check=True)
+    return result.stdout.decode('utf-8').strip()
+
+
+def test_import_does_not_load_drivers():
+    code = (
+        'import sys, dblogger\n'
+        'print(",".join(sorted(m for m in ("asyncpg", "psycopg2", "psycopg", "sqlite3") if m in sys.modules)))'
+    )
+    assert run_python(code) == ''
+
+
+def test_run_mode_from_environment():
+    code = 'import dblogger; print(dblogger.get_run_mode(), dblogger.DBLogHandler.__module__)'
+    assert run_python(code, DBLOGGER_RUN_MODE='sqlite') == 'sqlite dblogger.sqlite_handler'
+
+
+def test_set_run_mode(sqlite_run_mode):
+    from dblogger.sqlite_handler import DBLogHandler
+
+    assert dblogger.get_run_mode() == 'sqlite'
+    assert dblogger.DBLogHandler is DBLogHandler
+    assert 'DBLogHandler' in dir(dblogger)
+    with pytest.raises(ValueError):
+        dblogger.set_run_mode('mysql')
+    with pytest.raises(AttributeError):
+        dblogger.NoSuchHandler
+
+
+def test_connect_sync_sqlite(db_path):
+    connection = dblogger.connect_sync(db_path, run_mode='sqlite')
+    try:
+        row = connection.execute('SELECT 1 AS value').fetchone()
+    finally:
+        connection.close()
+    assert row['value'] == 1
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from dblogger.models.entry import get_sql_for_search, get_search_value
+from dblogger.sqlite_models import LogEntry
+
+
+def search(db, text: str):
+    return [entry.message for entry in LogEntry.load_all_with_date(db.cursor(), limit=100, search=text)]
+
+
+@pytest.mark.parametrize('message_templates', [False, True])
+def test_search_finds_entries(make_handler, make_logger, db, message_templates):
+    handler = make_handler(message_templates=message_templates)
+    logger = make_logger(handler)
+    logger.info('hello %s', 'world')
+    logger.info('something else')
+    handler.close()
+
+    assert len(search(db, 'hello')) == 1
+    assert len(search(db, 'HELLO')) == 1
+    assert search(db, 'nothing') == []
+
+
+def test_search_escapes_wildcards(make_handler, make_logger, db):
+    handler = make_handler()
+    logger = make_logger(handler)
+    logger.info('100% done')
+    logger.info('1000 done')
+    handler.close()
+
+    assert len(search(db, '0%')) == 1
+
+
+def test_search_with_date_and_after_id(make_handler, make_logger, db):
+    handler = make_handler(message_templates=True)
+    logger = make_logger(handler)
+    logger.info('hello %s', 'world')
+    handler.close()
+
+    now = datetime.now(timezone.utc)
+    entries = list(LogEntry.iterate_with_date(
+        db.cursor(), now - timedelta(minutes=1), now + timedelta(minutes=1), search='hello'
+    ))
+    assert len(entries) == 1
+    assert len(LogEntry.load_all_after_id(db.cursor(), 0, search='hello')) == 1
+
+
+def test_search_words_mode_is_rejected_by_sqlite(db):
+    with pytest.raises(ValueError):
+        LogEntry.load_all_with_date(db.cursor(), limit=10, search='hello', search_mode='words')
+
+
+@pytest.mark.parametrize('mode', ['substring', 'words'])
+def test_postgres_search_covers_templates(mode):
+    sql = get_sql_for_search('$1', mode)
+    assert 'logger_template' in sql
+    assert sql.count('$1') == 2
+
+    sql = get_sql_for_search('%s', mode, '%s')
+    assert sql.count('%s') == 2
+
+
+def test_search_value_escaping():
+    assert get_search_value('50%_off\\') == '%50\\%\\_off\\\\%'
+    assert get_search_value('timeout -redis', 'words') == 'timeout -redis'
+
+
+def test_template_entries_are_rendered(make_handler, make_logger, db):
+    handler = make_handler(message_templates=True)
+    logger = make_logger(handler)
+    logger.info('hello %s', 'world')
+    handler.close()
+
+    assert search(db, 'hello') == ['hello world']
@@ -0,0 +1,59 @@
+import pytest
+
+from dblogger.sqlite_models import LogEntry, LogTag
+
+
+def load_entries(db):
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=10)
+    LogEntry.prefetch_tags(db.cursor(), entries)
+    return {entry.message: entry for entry in entries}
+
+
+def tag_names(entry, db):
+    return sorted(tag.name for tag in entry.tags(db.cursor()))
+
+
+@pytest.mark.parametrize('tag_storage', ['table', 'array'])
+def test_prefetch_tags(make_handler, make_logger, db, tag_storage):
+    handler = make_handler(tag_storage=tag_storage)
+    logger = make_logger(handler)
+    logger.info('tagged', extra={'tags': ['b', 'a']})
+    logger.info('other', extra={'tags': ['c']})
+    logger.info('untagged')
+    handler.close()
+
+    entries = load_entries(db)
+    assert tag_names(entries['tagged'], db) == ['a', 'b']
+    assert tag_names(entries['other'], db) == ['c']
+    assert tag_names(entries['untagged'], db) == []
+    if tag_storage == 'array':
+        assert entries['untagged'].tag_ids == []
+
+
+def test_array_tags_are_sorted_and_unique(make_handler, make_logger, db):
+    handler = make_handler(tag_storage='array')
+    logger = make_logger(handler)
+    logger.info('tagged', extra={'tags': ['b', 'a', 'b']})
+    handler.close()
+
+    entry = load_entries(db)['tagged']
+    assert entry.tag_ids == sorted(entry.tag_ids)
+    assert len(entry.tag_ids) == 2
+
+
+@pytest.mark.parametrize('tag_storage', ['table', 'array'])
+def test_add_and_remove_tags(make_handler, make_logger, db, tag_storage):
+    handler = make_handler(tag_storage=tag_storage)
+    logger = make_logger(handler)
+    logger.info('tagged', extra={'tags': ['a']})
+    handler.close()
+
+    cursor = db.cursor()
+    extra = LogTag.create(cursor, name='extra')
+    entry = load_entries(db)['tagged']
+    entry.add_tags(cursor, [extra])
+    assert tag_names(entry, db) == ['a', 'extra']
+
+    entry.remove_tag(cursor, entry.tags(cursor)[0])
+    db.commit()
+    assert tag_names(load_entries(db)['tagged'], db) == ['extra']
@@ -0,0 +1,128 @@
+import gc
+import asyncio
+import threading
+
+import pytest
+
+from dblogger import tag_scope, current_tags
+from dblogger.cache import LRUCache
+from dblogger.tagscope import TagSet, EMPTY_TAGS, intern_tags, _interned
+from dblogger.sqlite_handler import DBLogHandler
+from dblogger.sqlite_models import LogEntry
+
+
+def test_intern_tags_returns_same_object():
+    first = intern_tags(['a', 'b'])
+    assert isinstance(first, TagSet)
+    assert intern_tags(('b', 'a')) is first
+    assert intern_tags(frozenset(['a', 'b'])) is first
+    assert intern_tags(first) is first
+
+
+def test_intern_tags_normalizes():
+    assert intern_tags([1, None, '', 'x']) == frozenset(['1', 'x'])
+    assert intern_tags([]) is EMPTY_TAGS
+    assert intern_tags([None, '']) is EMPTY_TAGS
+
+
+def test_interned_tag_sets_are_released():
+    before = len(_interned)
+    tag_sets = [intern_tags(['request', f'id-{i}']) for i in range(1000)]
+    assert len(_interned) >= before + 1000
+
+    del tag_sets
+    gc.collect()
+    assert len(_interned) <= before
+
+
+def test_scopes_nest():
+    assert current_tags() is EMPTY_TAGS
+    with tag_scope('a'):
+        with tag_scope('b') as tags:
+            assert tags == frozenset(['a', 'b'])
+            assert current_tags() is tags
+        assert current_tags() == frozenset(['a'])
+    assert current_tags() is EMPTY_TAGS
+
+
+def test_decorator():
+    @tag_scope('sync')
+    def sync():
+        return current_tags()
+
+    @tag_scope('async')
+    async def coroutine():
+        return current_tags()
+
+    assert sync() == frozenset(['sync'])
+    assert asyncio.run(coroutine()) == frozenset(['async'])
+    assert current_tags() is EMPTY_TAGS
+
+
+def test_scope_object_shared_by_threads():
+    scope = tag_scope('shared')
+    entered = threading.Event()
+    exited = threading.Event()
+    errors = []
+    seen = []
+
+    def first():
+        try:
+            with scope:
+                entered.set()
+                seen.append(current_tags())
+            exited.set()
+            seen.append(current_tags())
+        except Exception as e:
+            errors.append(e)
+
+    def second():
+        try:
+            entered.wait()
+            with scope:
+                # the first thread leaves the scope while this one is still inside
+                exited.wait()
+                seen.append(current_tags())
+            seen.append(current_tags())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(seen, key=len) == [EMPTY_TAGS, EMPTY_TAGS, frozenset(['shared']), frozenset(['shared'])]
+
+
+def test_lru_cache_is_bounded():
+    cache = LRUCache(3)
+    for key in 'abc':
+        cache[key] = key
+    assert cache.get('a') == 'a'
+    cache['d'] = 'd'
+
+    assert list(cache.keys()) == ['c', 'a', 'd']
+    assert cache.get('b') is None
+    assert len(cache) == 3
+
+
+def test_handler_tag_caches_are_bounded():
+    for name in ('tag_cache', 'tag_set_cache', 'tag_list_cache'):
+        assert isinstance(getattr(DBLogHandler, name), LRUCache)
+
+
+@pytest.mark.parametrize('tag_storage', ['table', 'array'])
+def test_handler_stores_scope_tags(make_handler, make_logger, db, tag_storage):
+    handler = make_handler(tag_storage=tag_storage)
+    logger = make_logger(handler)
+    with tag_scope('request', 42):
+        logger.info('in scope', extra={'tags': ['extra']})
+    logger.info('outside')
+    handler.close()
+
+    entries = {entry.message: entry for entry in LogEntry.load_all_with_date(db.cursor(), limit=10)}
+    assert sorted(tag.name for tag in entries['in scope'].tags(db.cursor())) == ['42', 'extra', 'request']
+    assert entries['outside'].tags(db.cursor()) == []
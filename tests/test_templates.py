@@ -0,0 +1,81 @@
+import enum
+import logging
+
+import pytest
+
+from dblogger.coalesce import Coalescer
+from dblogger.sqlite_models import LogEntry
+from dblogger.templates import split_message, render_message, template_hash
+
+
+class Color(enum.IntEnum):
+    red = 1
+
+
+def make_record(msg, args) -> logging.LogRecord:
+    return logging.LogRecord('test', logging.INFO, __file__, 1, msg, args, None)
+
+
+@pytest.mark.parametrize('msg, args, expected', [
+    ('plain', (), ('plain', None)),
+    ('%s of %d', ('one', 2), ('%s of %d', ['one', 2])),
+    ('%(name)s', ({'name': 'value'}, ), ('%(name)s', {'name': 'value'})),
+    ('%s', (None, ), ('%s', [None])),
+])
+def test_split_message(msg, args, expected):
+    assert split_message(make_record(msg, args)) == expected
+
+
+@pytest.mark.parametrize('msg, args', [
+    ('%s', (Color.red, )),
+    ('%s', (float('nan'), )),
+    ('%s', (object(), )),
+    ('%(a)s', ({1: 'a'}, )),
+    (ValueError('not a string'), ()),
+])
+def test_split_message_rejects_non_native(msg, args):
+    assert split_message(make_record(msg, args)) is None
+
+
+def test_render_message():
+    assert render_message('%s of %d', ['one', 2]) == 'one of 2'
+    assert render_message('%(name)s', {'name': 'value'}) == 'value'
+    assert render_message('plain', None) == 'plain'
+    assert render_message('%d', ['text']) == "%d ('text',)"
+
+
+def test_template_hash():
+    assert template_hash('%s') == template_hash('%s')
+    assert template_hash('%s') != template_hash('%d')
+
+
+def test_templates_are_stored_once(make_handler, make_logger, db):
+    handler = make_handler(message_templates=True)
+    logger = make_logger(handler)
+    for value in range(3):
+        logger.info('value %d', value)
+    logger.info('enum %s', Color.red)
+    handler.close()
+
+    enum_message = 'enum %s' % Color.red
+    entries = {entry.message: entry for entry in LogEntry.load_all_with_date(db.cursor(), limit=10)}
+    assert set(entries) == {'value 0', 'value 1', 'value 2', enum_message}
+    assert entries['value 2'].args == [2]
+    assert len({entries[f'value {value}'].template_id for value in range(3)}) == 1
+    assert entries[enum_message].template_id is None
+
+    counts = LogEntry.count_by_template(db.cursor())
+    assert [(template.template, count) for template, count in counts] == [('value %d', 3)]
+
+
+def test_template_counts_sum_repeat_counts(make_handler, make_logger, db):
+    handler = make_handler(message_templates=True, coalescer=Coalescer(window=60))
+    logger = make_logger(handler)
+    for _ in range(4):
+        logger.info('value %d', 1)
+    logger.info('value %d', 2)
+    handler.close()
+
+    assert len(LogEntry.load_all_with_date(db.cursor(), limit=10)) == 2
+    counts = LogEntry.count_by_template(db.cursor())
+    assert [(template.template, count) for template, count in counts] == [('value %d', 5)]
@@ -0,0 +1,87 @@
+import sys
+import logging
+
+from dblogger.sqlite_models import LogEntry, LogException
+from dblogger.tracebacks import normalize_traceback, normalize_traceback_text, format_traceback, traceback_hash
+
+
+def fail(message: str):
+    raise ValueError(message)
+
+
+def make_record(exc_info=None, stack_info=None) -> logging.LogRecord:
+    return logging.LogRecord('test', logging.ERROR, __file__, 1, 'failed', (), exc_info, sinfo=stack_info)
+
+
+def capture(message: str) -> logging.LogRecord:
+    try:
+        fail(message)
+    except ValueError:
+        return make_record(sys.exc_info())
+
+
+def test_same_crash_same_normalized_form():
+    first = normalize_traceback(capture('object at 0x7f00'))
+    second = normalize_traceback(capture('another message'))
+
+    assert first == second
+    assert first.startswith('builtins.ValueError\n')
+    assert 'in fail' in first
+    assert 'object at' not in first
+
+
+def test_chained_exceptions():
+    try:
+        try:
+            fail('inner')
+        except ValueError as e:
+            raise KeyError('outer') from e
+    except KeyError:
+        record = make_record(sys.exc_info())
+
+    lines = normalize_traceback(record).splitlines()
+    assert lines[0] == 'builtins.KeyError'
+    assert 'builtins.ValueError' in lines
+
+
+def test_records_without_traceback():
+    assert normalize_traceback(make_record()) is None
+    assert normalize_traceback(make_record(stack_info='Stack (most recent call last):\n  at 0x1234')) == \
+        'Stack (most recent call last):\n  at 0x?'
+
+
+def test_normalize_text_matches_structure():
+    record = capture('message')
+    text = format_traceback(record)
+
+    assert text.startswith('Traceback (most recent call last):')
+    assert text.endswith('ValueError: message')
+    normalized = normalize_traceback_text(text)
+    assert normalized.splitlines()[-1] == 'ValueError'
+    assert normalized == normalize_traceback_text(format_traceback(capture('other message')))
+
+
+def test_traceback_hash():
+    assert traceback_hash('a') == traceback_hash('a')
+    assert traceback_hash('a') != traceback_hash('b')
+    assert len(traceback_hash('a')) == 40
+
+
+def test_exceptions_are_stored_once(make_handler, make_logger, db):
+    handler = make_handler()
+    logger = make_logger(handler)
+    for message in ('first', 'second'):
+        try:
+            fail(message)
+        except ValueError:
+            logger.exception('failed %s', message)
+    handler.close()
+
+    entries = LogEntry.load_all_with_date(db.cursor(), limit=10)
+    assert len(entries) == 2
+    assert entries[0].exception_id == entries[1].exception_id
+    cursor = db.cursor()
+    cursor.execute(f'SELECT count(*) AS count FROM {LogException.table}')
+    assert cursor.fetchone()['count'] == 1
+    exception = LogException.load(db.cursor(), pk=entries[0].exception_id)
+    assert 'ValueError: first' in exception.traceback
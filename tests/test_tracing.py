@@ -0,0 +1,71 @@
+import pytest
+
+from dblogger.models.tracing import QueryTracer, statement_shape, set_tracer, get_tracer, traced
+
+
+@pytest.fixture
+def tracer():
+    slow_queries = []
+    tracer = QueryTracer(slow_threshold=1.0, slow_log=lambda *args: slow_queries.append(args))
+    tracer.slow_queries = slow_queries
+    previous = set_tracer(tracer)
+    yield tracer
+    set_tracer(previous)
+
+
+@pytest.mark.parametrize('sql, shape', [
+    ('SELECT *\n  FROM logger_log\n WHERE id = 42', 'SELECT * FROM logger_log WHERE id = N'),
+    ('SELECT * FROM t WHERE a = $1 AND b = $12', 'SELECT * FROM t WHERE a = $n AND b = $n'),
+    ('INSERT INTO t VALUES (%s, %s), (%s, %s), (%s, %s)', 'INSERT INTO t VALUES (%s, %s), ...'),
+    ('INSERT INTO t VALUES ($1, $2), ($3, $4)', 'INSERT INTO t VALUES ($n, $n), ...'),
+    ('SELECT * FROM t WHERE (a = %s) OR (a = %s) OR (a = %s)', 'SELECT * FROM t WHERE (a = %s) OR ...'),
+    ('SELECT * FROM t WHERE id IN (%s, %s, %s, %s)', 'SELECT * FROM t WHERE id IN (%s, ...)'),
+    ('SELECT t1.id FROM t1', 'SELECT t1.id FROM t1'),
+])
+def test_statement_shape(sql, shape):
+    assert statement_shape(sql) == shape
+
+
+def test_record_aggregates_by_shape(tracer):
+    tracer.record('SELECT * FROM t WHERE id = 1', 1, 0.5, 1)
+    tracer.record('SELECT * FROM t WHERE id = 2', 1, 1.5, 0)
+    tracer.record('DELETE FROM t', 0, 0.1, -1)
+
+    stats = tracer.top(1)[0]
+    assert stats.shape == 'SELECT * FROM t WHERE id = N'
+    assert (stats.calls, stats.total, stats.max, stats.avg, stats.rows, stats.parameters) == (2, 2.0, 1.5, 1.0, 1, 2)
+    assert [stats.shape for stats in tracer.top(key='calls')][1] == 'DELETE FROM t'
+    assert tracer.statements['DELETE FROM t'].rows == 0
+    assert tracer.slow == 1
+    assert tracer.slow_queries == [('SELECT * FROM t WHERE id = 2', 1, 1.5, 0)]
+
+    report = tracer.report()
+    assert report.splitlines()[0].split() == ['calls', 'total', 'ms', 'avg', 'ms', 'max', 'ms', 'rows', 'params', 'statement']
+    assert report.splitlines()[-1] == '1 slow statements'
+
+    tracer.reset()
+    assert tracer.top() == []
+
+
+def test_traced(tracer):
+    with traced('SELECT 1', 0) as trace:
+        trace.rows = 1
+    assert tracer.statements['SELECT N'].rows == 1
+
+    set_tracer(None)
+    assert get_tracer() is None
+    with traced('SELECT 2'):
+        pass
+    assert tracer.statements['SELECT N'].calls == 1
+
+
+def test_models_are_traced(tracer, make_handler, make_logger):
+    handler = make_handler()
+    logger = make_logger(handler)
+    for idx in range(3):
+        logger.info('message %d', idx)
+    handler.close()
+
+    inserts = [stats for stats in tracer.statements.values() if stats.shape.startswith('INSERT INTO logger_log ')]
+    assert len(inserts) == 1
+    assert inserts[0].calls == 3